@@ -2,19 +2,100 @@
 
 import asyncio
 import json
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from starlette.websockets import WebSocketState
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 
-from common_logic.data_source import LegislationDataSource
-from config import logger
-
-app = FastAPI()
+from common_logic.answer_cache import AnswerCache
+from common_logic.data_source import CorpusDataSource, SharedDataSource
+from common_logic.metrics import (
+    ANSWER_CACHE_HITS, ANSWER_CACHE_MISSES, EXECUTOR_QUEUE_DEPTH, POST_PROCESS_SECONDS, QUERIES_IN_FLIGHT,
+    RECEIVE_SECONDS, SEND_SECONDS, render_metrics
+)
+from common_logic.query_scheduler import QueryScheduler, SchedulerBusy
+from config import (
+    logger, DATA_DIR, CORPUS_MANIFEST, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_DISK,
+    QUERY_CONCURRENCY, QUERY_QUEUE_SIZE, SHARED_INDEX, SHARED_INDEX_DIR, SHARED_INDEX_POLL,
+    SHARED_INDEX_TIMEOUT
+)
 
 executor = ThreadPoolExecutor()
 
-PA1977 = LegislationDataSource('https://www.legislation.gov.uk/ukpga/1977/37/contents/')
-PA1977.load_data()
+
+def create_data_source():
+    """Create the data source served by the API - every Act in the corpus manifest, in one shared index."""
+    if SHARED_INDEX:
+        return attach_shared_index()
+    data_source = CorpusDataSource.from_manifest(CORPUS_MANIFEST)
+    data_source.load_data()
+    return data_source
+
+
+def attach_shared_index():
+    """
+    Attach to the index snapshot published by the loader process, waiting for it to be published.
+
+    Raises:
+        TimeoutError: If no snapshot is published within SHARED_INDEX_TIMEOUT seconds.
+    """
+    data_source = SharedDataSource(SHARED_INDEX_DIR)
+    deadline = time.monotonic() + SHARED_INDEX_TIMEOUT
+    while True:
+        try:
+            data_source.load_data()
+            return data_source
+        except FileNotFoundError as e:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No index snapshot was published within {SHARED_INDEX_TIMEOUT:g}s: {e}") from e
+            logger.info(f"{e}, waiting for the loader")
+            time.sleep(SHARED_INDEX_POLL)
+
+
+def create_answer_cache():
+    """Create the cache of answers to repeated queries, or None if it is disabled."""
+    if not ANSWER_CACHE_SIZE:
+        return None
+    return AnswerCache(
+        max_entries=ANSWER_CACHE_SIZE,
+        ttl=ANSWER_CACHE_TTL,
+        similarity_threshold=ANSWER_CACHE_SIMILARITY or None,
+        path=DATA_DIR / "answer_cache.sqlite3" if ANSWER_CACHE_DISK else None
+    )
+
+
+async def warm_up(app: FastAPI):
+    """Load the data source in the background, so the server can accept connections while it loads."""
+    try:
+        app.state.data_source = await run_in_executor(create_data_source)
+        logger.info("Data source is ready")
+    except Exception as e:
+        logger.exception("Failed to load the data source")
+        app.state.warmup_error = str(e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.data_source = None
+    app.state.warmup_error = None
+    app.state.answer_cache = create_answer_cache()
+    app.state.scheduler = QueryScheduler(QUERY_CONCURRENCY, QUERY_QUEUE_SIZE)
+    warm_up_task = asyncio.create_task(warm_up(app))
+    yield
+    warm_up_task.cancel()
+    if app.state.answer_cache is not None:
+        app.state.answer_cache.close()
+
+
+app = FastAPI(lifespan=lifespan)
+# Set until the lifespan starts, so endpoints report that the server is warming
+app.state.data_source = None
+app.state.warmup_error = None
+app.state.answer_cache = None
+app.state.scheduler = None
 
 
 def slow_function(query: str) -> dict:
@@ -37,59 +118,161 @@ def slow_function(query: str) -> dict:
     }
     return response
 
-def post_process_result(result: dict) -> dict:
-    """Post process the function result."""
-    # This could be moved into the data source object
-    documents = result['source_documents']
+def format_sources(documents) -> list:
+    """Format source documents for the client."""
     sources = []
     for doc in documents:
+        # Chunks of sections are cited by their subsection, e.g. 60(2)(a)
+        label = doc.metadata.get("label", doc.metadata["section"])
         sources.append({
             "text": doc.page_content,
-            "citation": doc.metadata["section"] + " " + doc.metadata["title"] + " - " + doc.metadata["source"]
+            "citation": label + " " + doc.metadata["title"] + " - " + doc.metadata["source"]
         })
-    result['sources'] = sources
-    result.pop('source_documents')
+    return sources
+
+def post_process_result(result: dict) -> dict:
+    """Post process the function result."""
+    # This could be moved into the data source object
+    result['sources'] = format_sources(result.pop('source_documents'))
     result['state'] = "SUCCESS"
     return result
 
 async def run_in_executor(func, *args):
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(executor, func, *args)
+    EXECUTOR_QUEUE_DEPTH.inc()
+    dequeued = threading.Lock()
 
+    def leave_queue(*_):
+        # Once, when the job starts or when it is cancelled before it starts
+        if dequeued.acquire(blocking=False):
+            EXECUTOR_QUEUE_DEPTH.dec()
+
+    def run():
+        leave_queue()
+        return func(*args)
+
+    future = loop.run_in_executor(executor, run)
+    future.add_done_callback(leave_queue)
+    return await future
+
+
+async def send_state(websocket: WebSocket, query: str, state: str, **fields):
+    """Send a message with no answer yet, reporting the state of a query."""
+    await websocket.send_json({"query": query, "result": None, "sources": [], "state": state, **fields})
+
+
+async def stream_answer(websocket: WebSocket, data_source, query: str, acts) -> dict:
+    """Answer a query on the event loop, sending the sources and each token of the answer as they are produced."""
+    async def on_documents(documents):
+        with SEND_SECONDS.time():
+            await websocket.send_json({
+                "query": query, "result": None, "sources": format_sources(documents), "state": "STREAMING", "token": ""
+            })
+
+    async def on_token(token):
+        await websocket.send_json({"query": query, "state": "STREAMING", "token": token})
+
+    return await data_source.astream_answers_and_documents(query, on_documents, on_token, acts)
+
+
+async def answer_query(websocket: WebSocket, query: str, acts):
+    """Answer one query from a client, from the answer cache if possible, otherwise once the scheduler admits it."""
+    data_source = websocket.app.state.data_source
+    if data_source is None:
+        # The index is still loading, or failed to load
+        error = websocket.app.state.warmup_error
+        await send_state(websocket, query, "ERROR" if error else "WARMING", **({"error": error} if error else {}))
+        return
+
+    # Prepare preliminary response
+    logger.debug("Sending initial response")
+    await send_state(websocket, query, "PROCESSING")
+
+    unknown_acts = [act for act in acts if act not in data_source.acts] if acts else []
+    if unknown_acts:
+        await send_state(websocket, query, "ERROR", error=f"Unknown Acts: {unknown_acts}")
+        return
+
+    # Answer repeated and near-duplicate queries from the cache, scoped to the current index - cache hits skip the
+    # scheduler, as they need no LLM call
+    answer_cache = websocket.app.state.answer_cache
+    scope = data_source.fingerprint
+    lookup = None
+    if answer_cache is not None:
+        lookup = await run_in_executor(answer_cache.get, query, scope, acts, data_source.embed_query)
+        if lookup.answer is not None:
+            logger.info("Answering from the answer cache")
+            ANSWER_CACHE_HITS.inc()
+            with SEND_SECONDS.time():
+                await websocket.send_json({"query": query, **lookup.answer, "cached": True})
+            return
+        ANSWER_CACHE_MISSES.inc()
+
+    async def on_queued(position, eta):
+        await send_state(websocket, query, "QUEUED", position=position, eta=round(eta, 1) if eta is not None else None)
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    try:
+        async with websocket.app.state.scheduler.slot(on_queued):
+            result = await stream_answer(websocket, data_source, query, acts)
+    except SchedulerBusy as e:
+        logger.warning(f"Rejecting query, the server is busy: {e}")
+        await send_state(websocket, query, "BUSY", error="The server is busy, please try again shortly")
+        return
+
+    logger.info(f"Sending final response: {result}")
+    with POST_PROCESS_SECONDS.time():
+        result = post_process_result(result)
+    with SEND_SECONDS.time():
+        await websocket.send_json(result)
+    if answer_cache is not None:
+        # The disk tier writes to SQLite, so keep it off the event loop
+        await run_in_executor(
+            answer_cache.put, query, scope, {key: result[key] for key in ("result", "sources", "state")}, acts,
+            lookup.embedding
+        )
+
+
+async def receive_queries(websocket: WebSocket, queries: asyncio.Queue):
+    """Read messages from a client, with the time each arrived, until it disconnects, which is marked with None."""
     try:
         while True:
             data = await websocket.receive_text()
             logger.debug(f"Received data: {data}")
-            query_data = json.loads(data)  # Assume you're receiving JSON and it contains a 'query' field
+            received = time.perf_counter()
+            # Assume you're receiving JSON and it contains a 'query' field
+            await queries.put((json.loads(data), received))
+    except WebSocketDisconnect:
+        await queries.put(None)
+
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    # Read from the websocket in the background, so that a client closing it is noticed while its query is answered
+    queries = asyncio.Queue()
+    receiver = asyncio.create_task(receive_queries(websocket, queries))
+    try:
+        while (message := await queries.get()) is not None:
+            query_data, received = message
+            RECEIVE_SECONDS.observe(time.perf_counter() - received)
             query = query_data.get('query')
+            # Optional list of Act identifiers, e.g. ["ukpga/1977/37"], to restrict the search to
+            acts = query_data.get('acts')
             logger.debug(f"Received query: {query}")
-
-            # Prepare preliminary response
-            response = {
-                "query": query,
-                "result": None,
-                "sources": [],
-                "state": "PROCESSING"
-            }
-            logger.debug(f"Sending initial response: {response}")
-            await websocket.send_json(response)
-
-            # Run the slow function asynchronously
-            task = asyncio.create_task(run_in_executor(PA1977.get_answers_and_documents, query))
-
-            # Wait for it to complete and get the result
-            result = await task
-
-            logger.info(f"Sending final response: {result}")
-            result = post_process_result(result)
-            await websocket.send_json(result)
+            with QUERIES_IN_FLIGHT.track_inprogress():
+                answer = asyncio.create_task(answer_query(websocket, query, acts))
+                await asyncio.wait([answer, receiver], return_when=asyncio.FIRST_COMPLETED)
+                if not answer.done():
+                    # The client went away - stop answering, freeing its place in the queue and closing its LLM
+                    # request
+                    answer.cancel()
+                    await asyncio.wait([answer])
+                    break
+            answer.result()
     except WebSocketDisconnect:
         pass
     finally:
+        receiver.cancel()
         if websocket.application_state == WebSocketState.CONNECTED \
                 and websocket.client_state == WebSocketState.CONNECTED:
             await websocket.close()
@@ -99,3 +282,38 @@ async def websocket_endpoint(websocket: WebSocket):
 def read_root():
     return {"message": "Hello, World!"}
 
+
+@app.get("/healthz")
+def healthz():
+    """Liveness - the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/stats")
+def stats():
+    """Counters of the answer cache and the query scheduler."""
+    answer_cache = app.state.answer_cache
+    scheduler = app.state.scheduler
+    return {
+        "answer_cache": answer_cache.stats if answer_cache is not None else None,
+        "scheduler": {**scheduler.stats, "active": scheduler.active, "waiting": scheduler.waiting}
+        if scheduler is not None else None
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics of the query and ingestion pipelines."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness - the index is loaded and queries can be answered."""
+    if app.state.data_source is not None:
+        return {"status": "ready"}
+    if app.state.warmup_error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": app.state.warmup_error})
+    return JSONResponse(status_code=503, content={"status": "warming"})
+
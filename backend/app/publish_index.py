@@ -0,0 +1,30 @@
+"""
+Load the corpus once and publish its index for API workers to share.
+
+Run before starting several workers with SHARED_INDEX=True - each worker then memory-maps the published snapshot
+instead of parsing, embedding and indexing the corpus itself:
+
+    python -m app.publish_index
+    SHARED_INDEX=True uvicorn app.main:app --workers 4
+"""
+import argparse
+
+from common_logic.data_source import CorpusDataSource
+from config import logger, CORPUS_MANIFEST, SHARED_INDEX_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the corpus and publish its index for API workers to share.")
+    parser.add_argument("--refresh", action="store_true", help="re-ingest the corpus before publishing it")
+    args = parser.parse_args()
+
+    data_source = CorpusDataSource.from_manifest(CORPUS_MANIFEST)
+    data_source.load_data()
+    if args.refresh:
+        data_source.refresh()
+    snapshot = data_source.publish(SHARED_INDEX_DIR)
+    logger.info(f"Published index snapshot {snapshot.directory}")
+
+
+if __name__ == "__main__":
+    main()
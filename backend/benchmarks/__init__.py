@@ -0,0 +1 @@
+"""Offline benchmarks. Run from the backend directory, e.g. `python -m benchmarks.bench_fetch`."""
@@ -0,0 +1,100 @@
+"""Benchmark query throughput and latency of the thread pool and async query paths against stub OpenAI servers."""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from langchain.chat_models import ChatOpenAI
+from langchain.schema.document import Document
+
+from common_logic.data_source import DataSource
+from common_logic.embedding_store import open_embedding_store
+from tests.stub_server import StubEmbeddingsClient, StubOpenAIServer
+
+
+class DocumentsDataSource(DataSource):
+    """Data source over a fixed list of documents."""
+
+    def __init__(self, documents, **kwargs):
+        super().__init__(**kwargs)
+        self.documents = documents
+
+    def load_data(self):
+        self.data = self.documents
+        self.post_data_load_setup()
+
+
+async def ignore(_):
+    pass
+
+
+async def run(answer, clients: int, queries: int):
+    """Answer queries from concurrent clients, each asking its next query once answered, returning the latencies."""
+    remaining = iter(range(queries))
+    latencies = []
+
+    async def client():
+        for number in remaining:
+            start = time.perf_counter()
+            await answer(f"Question {number} about patents")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=200, help="number of queries at each level of concurrency")
+    parser.add_argument("--clients", type=int, nargs="+", default=[8, 32, 128, 256], help="concurrent clients")
+    parser.add_argument("--threads", type=int, default=min(32, (os.cpu_count() or 1) + 4),
+                        help="threads of the pool, by default the size of a default ThreadPoolExecutor")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=20, help="tokens in each answer")
+    args = parser.parse_args()
+
+    documents = [
+        Document(page_content=f"{number}. Section {number} about patents",
+                 metadata={"section": str(number), "title": f"Section {number}", "source": f"section/{number}"})
+        for number in range(1, 201)
+    ]
+    answer = " ".join(["word"] * args.tokens)
+    with StubOpenAIServer(answer=answer, latency=0.02, chat_latency=args.chat_latency,
+                          token_latency=args.token_latency) as server, tempfile.TemporaryDirectory() as directory:
+        data_source = DocumentsDataSource(
+            documents,
+            embedding_model=StubEmbeddingsClient(server.url),
+            llm=ChatOpenAI(streaming=True, openai_api_base=server.url, openai_api_key="sk-test"),
+            store=open_embedding_store(Path(directory))
+        )
+        data_source.load_data()
+        pool = ThreadPoolExecutor(max_workers=args.threads)
+
+        async def threaded(query):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(pool, data_source.stream_answers_and_documents, query, list, len)
+
+        async def direct(query):
+            await data_source.astream_answers_and_documents(query, ignore, ignore)
+
+        for clients in args.clients:
+            for name, answer_query in (("thread pool", threaded), ("async", direct)):
+                server.max_in_flight = 0
+                start = time.perf_counter()
+                latencies = asyncio.run(run(answer_query, clients, args.queries))
+                elapsed = time.perf_counter() - start
+                p50, p95 = (statistics.quantiles(latencies, n=100)[i] for i in (49, 94))
+                print(f"{clients:4} clients  {name:12} {args.queries / elapsed:7.1f} queries/s  "
+                      f"p50 {p50 * 1000:7.0f} ms  p95 {p95 * 1000:7.0f} ms  "
+                      f"{server.max_in_flight:4} requests in flight")
+        pool.shutdown()
+        data_source.store.close()
+
+
+if __name__ == "__main__":
+    main()
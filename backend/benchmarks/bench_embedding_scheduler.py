@@ -0,0 +1,64 @@
+"""Benchmark of ingest embedding throughput, sending batches one at a time or scheduled within rate limits."""
+import argparse
+
+from common_logic.context import TokenCounter
+from common_logic.embedding_scheduler import EmbeddingScheduler
+from common_logic.lxml_parser import parse_body_sections
+from common_logic.utils import flatten_text
+from tests.fixture_server import build_act_xml
+from tests.stub_server import StubEmbeddingsClient, StubOpenAIServer
+
+
+def run(texts, server_limits: dict, label: str, **scheduler_args) -> None:
+    with StubOpenAIServer(latency=0.05, latency_per_input=0.0005, dimensions=64, **server_limits) as server:
+        # Count tokens as the stub server does, whether or not tiktoken has its encoding
+        counter = TokenCounter()
+        counter._loaded = True
+        scheduler = EmbeddingScheduler(StubEmbeddingsClient(server.url), counter, **scheduler_args)
+        scheduler.embed(texts)
+    stats = scheduler.last_stats
+    print(
+        f"{label:38} {stats.seconds:6.2f}s {stats.texts_per_second:8.1f} sections/s "
+        f"{stats.tokens_per_minute / 60:8.0f} tokens/s  {stats.batches:3} batches  "
+        f"{server.throttled:3} throttled  {server.max_in_flight} in flight"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--copies", type=int, default=4, help="copies of the fixture Act to embed")
+    parser.add_argument("--batch-tokens", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests-per-period", type=float, default=10)
+    parser.add_argument("--tokens-per-period", type=float, default=200000)
+    parser.add_argument("--period", type=float, default=5.0, help="seconds the limits are given for")
+    args = parser.parse_args()
+
+    sections = parse_body_sections(build_act_xml()).values()
+    texts = [
+        f"{copy}.{n}. {section['title']}\n\n{flatten_text(section['parsed_data'])}"
+        for copy in range(args.copies) for n, section in enumerate(sections)
+    ]
+    limits = dict(requests_per_minute=args.requests_per_period, tokens_per_minute=args.tokens_per_period)
+    # The scheduler's limits are a little under the server's
+    under = {name: 0.9 * limit for name, limit in limits.items()}
+    print(
+        f"{len(texts)} sections; server limits of {args.requests_per_period:.0f} requests and "
+        f"{args.tokens_per_period:.0f} tokens per {args.period}s"
+    )
+
+    run(texts, {}, "unlimited, sequential", max_batch_tokens=args.batch_tokens, max_concurrency=1)
+    run(texts, {}, "unlimited, concurrent", max_batch_tokens=args.batch_tokens, max_concurrency=args.concurrency)
+    server_limits = dict(limits, limit_period=args.period)
+    run(
+        texts, server_limits, "limited, concurrent, Retry-After only",
+        max_batch_tokens=args.batch_tokens, max_concurrency=args.concurrency
+    )
+    run(
+        texts, server_limits, "limited, concurrent, within budget",
+        max_batch_tokens=args.batch_tokens, max_concurrency=args.concurrency, period=args.period, **under
+    )
+
+
+if __name__ == "__main__":
+    main()
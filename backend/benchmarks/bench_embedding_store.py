@@ -0,0 +1,84 @@
+"""Benchmark warm-start lookup of cached embeddings in LocalFileStore and the SQLite store."""
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.embeddings.base import Embeddings
+from langchain.storage import LocalFileStore
+
+from common_logic.embedding_store import SQLiteByteStore, cache_backed_embeddings, migrate_file_store
+
+
+class RandomEmbeddings(Embeddings):
+    """Random vectors, standing in for the embedding model when populating the caches."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.rng = np.random.default_rng(0)
+
+    def embed_documents(self, texts):
+        return self.rng.standard_normal((len(texts), self.dim)).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def time_lookup(make_embedder, texts, repeat: int = 3) -> float:
+    """Return the best seconds taken to look up every text in a freshly opened cache."""
+    timings = []
+    for _ in range(repeat):
+        embedder = make_embedder()
+        start = time.perf_counter()
+        embedder.embed_documents(texts)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=5000, help="number of cached embeddings")
+    parser.add_argument("--dim", type=int, default=1536, help="embedding dimension")
+    args = parser.parse_args()
+
+    texts = [f"section {i} of an Act" for i in range(args.count)]
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        model = RandomEmbeddings(args.dim)
+        file_dir = tmp / "embeddings_cache"
+        legacy = CacheBackedEmbeddings.from_bytes_store(model, LocalFileStore(file_dir), namespace="bench")
+        legacy.embed_documents(texts)
+        start = time.perf_counter()
+        sqlite_store = SQLiteByteStore(tmp / "embeddings.sqlite3")
+        migrate_file_store(file_dir, sqlite_store)
+        migration = time.perf_counter() - start
+        sqlite_store.close()
+
+        # The model must not be called on a warm start
+        missing = RandomEmbeddings(0)
+        file_time = time_lookup(
+            lambda: CacheBackedEmbeddings.from_bytes_store(missing, LocalFileStore(file_dir), namespace="bench"), texts
+        )
+        sqlite_time = time_lookup(
+            lambda: cache_backed_embeddings(missing, SQLiteByteStore(tmp / "embeddings.sqlite3"), namespace="bench"),
+            texts
+        )
+        print(f"{args.count} embeddings of dimension {args.dim}, migrated in {migration:.2f} s")
+        print(f"{'LocalFileStore':16} size {directory_size(file_dir) / 1e6:8.2f} MB  "
+              f"files {args.count:6}  lookup {file_time * 1000:8.1f} ms")
+        print(f"{'SQLiteByteStore':16} size {(tmp / 'embeddings.sqlite3').stat().st_size / 1e6:8.2f} MB  "
+              f"files {1:6}  lookup {sqlite_time * 1000:8.1f} ms")
+        print(f"speed-up {file_time / sqlite_time:.1f}x")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
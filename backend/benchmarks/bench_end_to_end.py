@@ -0,0 +1,267 @@
+"""
+Offline end-to-end benchmark of ingestion, startup and websocket query latency, written as JSON.
+
+CLML fixtures are served from a local HTTP server, and deterministic fake embedding and chat models stand in for
+OpenAI, so runs need no network access and can be compared across commits:
+
+    python -m benchmarks.bench_end_to_end --output before.json
+    python -m benchmarks.bench_end_to_end --output after.json --baseline before.json
+
+Ingestion phase times are the sums of the pipeline's own Prometheus timings. Queries are sent by concurrent clients
+through the app's websocket endpoint, in process.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+import app.main
+import common_logic.data_source
+from common_logic.data_source import CorpusDataSource, SharedDataSource
+from tests.fakes import FakeEmbeddings, FakeStreamingLLM
+from tests.fixture_server import ClmlFixtureServer, corpus_resolver
+
+ANSWER = (
+    "A patent may be granted only for an invention which is new, involves an inventive step and is capable of "
+    "industrial application, as set out in section 1 of the Act."
+)
+TERMS = (
+    "patent invention application comptroller proprietor licence infringement revocation priority specification "
+    "claim employee compensation crown use register opposition amendment renewal declaration"
+).split()
+
+
+class LatentEmbeddings(FakeEmbeddings):
+    """Fake embeddings with a delay per call, standing in for a remote embedding model."""
+
+    def __init__(self, size: int, latency: float):
+        super().__init__(size)
+        self.latency = latency
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+def metric(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50, p95 and p99 of durations in seconds, in milliseconds."""
+    if not values:
+        return {}
+    return {f"p{p}": round(float(np.percentile(values, p)) * 1000, 2) for p in (50, 95, 99)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def make_corpus(server: ClmlFixtureServer, acts: List[str], args) -> CorpusDataSource:
+    return CorpusDataSource(
+        [f"{server.url}/{act}/contents/" for act in acts], processes=1,
+        embedding_model=LatentEmbeddings(args.dim, args.embed_latency),
+        llm=FakeStreamingLLM(responses=[ANSWER], token_delay=args.token_delay)
+    )
+
+
+def bench_ingest_and_startup(server: ClmlFixtureServer, acts: List[str], directory: Path, args):
+    """Load the corpus cold, then warm, then attach to a published snapshot of it."""
+    before = {
+        'fetch': metric("legislation_fetch_seconds_sum"),
+        'parse': metric("legislation_section_parse_seconds_sum") + metric("legislation_act_parse_seconds_sum"),
+        'embed_and_index': metric("index_build_seconds_sum", operation="build"),
+    }
+    cold = make_corpus(server, acts, args)
+    start = time.perf_counter()
+    cold.load_data()
+    cold_seconds = time.perf_counter() - start
+    sections = len(cold.data)
+    phases = {
+        'fetch': metric("legislation_fetch_seconds_sum") - before['fetch'],
+        'parse': metric("legislation_section_parse_seconds_sum") + metric("legislation_act_parse_seconds_sum")
+        - before['parse'],
+        'embed_and_index': metric("index_build_seconds_sum", operation="build") - before['embed_and_index'],
+    }
+    ingest = {
+        'sections': sections,
+        'seconds': round(cold_seconds, 3),
+        'sections_per_second': round(sections / cold_seconds, 1),
+        'phases': {
+            phase: {
+                'seconds': round(seconds, 3),
+                'sections_per_second': round(sections / seconds, 1) if seconds else None,
+            }
+            for phase, seconds in phases.items()
+        },
+    }
+    cold.store.close()
+
+    warm = make_corpus(server, acts, args)
+    start = time.perf_counter()
+    warm.load_data()
+    warm_seconds = time.perf_counter() - start
+
+    warm.publish(directory / "shared")
+    shared = SharedDataSource(
+        directory / "shared", embedding_model=LatentEmbeddings(args.dim, args.embed_latency),
+        llm=FakeStreamingLLM(responses=[ANSWER]), store=warm.store
+    )
+    start = time.perf_counter()
+    shared.load_data()
+    attach_seconds = time.perf_counter() - start
+    startup = {
+        'cold_seconds': round(cold_seconds, 3),
+        'warm_seconds': round(warm_seconds, 3),
+        'attach_seconds': round(attach_seconds, 4),
+    }
+    return warm, ingest, startup
+
+
+def run_client(client: TestClient, queries: List[str], ready: threading.Barrier, results: List[Dict[str, Any]]):
+    """Send queries one after another over one websocket, timing the first token and the answer of each."""
+    with client.websocket_connect("/ws") as websocket:
+        ready.wait()
+        for query in queries:
+            start = time.perf_counter()
+            first_token = None
+            websocket.send_json({"query": query})
+            while (message := websocket.receive_json())['state'] in ("PROCESSING", "QUEUED", "STREAMING"):
+                if first_token is None and message.get('token'):
+                    first_token = time.perf_counter() - start
+            results.append({
+                'state': message['state'], 'latency': time.perf_counter() - start, 'first_token': first_token
+            })
+
+
+def bench_queries(client: TestClient, clients: int, queries_per_client: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    # Mostly searches, with some queries that refer to sections by number
+    queries = [
+        [f"What does s.{rng.randint(1, 130)} say?" if rng.random() < 0.2 else
+         f"What are the rules on {' '.join(rng.sample(TERMS, 3))}?" for _ in range(queries_per_client)]
+        for _ in range(clients)
+    ]
+    results: List[Dict[str, Any]] = []
+    ready = threading.Barrier(clients + 1)
+    threads = [threading.Thread(target=run_client, args=(client, q, ready, results)) for q in queries]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    answered = [r for r in results if r['state'] == "SUCCESS"]
+    return {
+        'clients': clients,
+        'queries': len(results),
+        'answered': len(answered),
+        'queries_per_second': round(len(answered) / elapsed, 1),
+        'latency_ms': percentiles([r['latency'] for r in answered]),
+        'first_token_ms': percentiles([r['first_token'] for r in answered if r['first_token'] is not None]),
+    }
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves of the results, keyed by their path."""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, list):
+            for item in value:
+                flat.update(flatten(item, f"{path}[clients={item.get('clients')}]."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print the change of every measurement from a baseline run."""
+    print(f"\nChange from {baseline.get('commit')} to {results.get('commit')}:")
+    old, new = flatten(baseline['results']), flatten(results['results'])
+    for path, value in new.items():
+        if path in old and old[path]:
+            print(f"  {path:60} {old[path]:>12} -> {value:>12}  {(value - old[path]) / old[path]:+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--acts", type=int, default=4, help="Acts in the corpus, each a copy of the fixture Act")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32], help="concurrent websocket clients")
+    parser.add_argument("--queries-per-client", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=256, help="embedding dimension")
+    parser.add_argument("--fetch-latency", type=float, default=0.0, help="seconds added to each fixture response")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per embedding call")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="seconds between streamed answer tokens")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="file to write the results to, printed if not given")
+    parser.add_argument("--baseline", type=Path, help="results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    acts = [f"ukpga/2000/{number}" for number in range(1, args.acts + 1)]
+    with tempfile.TemporaryDirectory() as tmp, \
+            ClmlFixtureServer(resolver=corpus_resolver(acts), latency=args.fetch_latency) as server:
+        directory = Path(tmp)
+        common_logic.data_source.DATA_DIR = directory
+        common_logic.data_source.FETCH_RATE_LIMIT = 0
+        data_source, ingest, startup = bench_ingest_and_startup(server, acts, directory, args)
+        print(f"Ingested {ingest['sections']} sections in {ingest['seconds']} s, startup: {startup}", file=sys.stderr)
+
+        # Serve the warm corpus, without the answer cache so every query is answered
+        app.main.create_data_source = lambda: data_source
+        app.main.ANSWER_CACHE_SIZE = 0
+        queries = []
+        with TestClient(app.main.app) as client:
+            while client.get("/readyz").status_code != 200:
+                time.sleep(0.01)
+            bench_queries(client, 1, 3, args.seed)
+            for clients in args.clients:
+                queries.append(bench_queries(client, clients, args.queries_per_client, args.seed))
+                print(f"{clients} clients: {queries[-1]}", file=sys.stderr)
+        data_source.store.close()
+
+    results = {
+        'benchmark': "end_to_end",
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'config': {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        'results': {'ingest': ingest, 'startup': startup, 'queries': queries},
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
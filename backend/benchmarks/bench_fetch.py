@@ -0,0 +1,37 @@
+"""Benchmark wall-clock ingest time of the sequential, concurrent and whole-Act fetch paths."""
+import argparse
+import time
+
+from common_logic.fetching import SectionFetcher
+from common_logic.XMLparser import UKLegislationParser
+from tests.fixture_server import ClmlFixtureServer
+
+
+def time_ingest(contents_url: str, fetcher: SectionFetcher = None, **kwargs) -> float:
+    """Return the seconds taken to fetch and parse every section of the Act."""
+    start = time.perf_counter()
+    UKLegislationParser(contents_url, parse_sections=True, fetcher=fetcher, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated server latency in seconds")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    with ClmlFixtureServer(latency=args.latency) as server:
+        contents_url = f"{server.url}/ukpga/1977/37/contents"
+        sequential = time_ingest(contents_url)
+        print(f"sequential: {sequential:.2f}s")
+        for workers in args.workers:
+            fetcher = SectionFetcher(max_workers=workers)
+            elapsed = time_ingest(contents_url, fetcher)
+            fetcher.close()
+            print(f"concurrent ({workers} workers): {elapsed:.2f}s ({sequential / elapsed:.1f}x)")
+        elapsed = time_ingest(contents_url, whole_act=True)
+        print(f"whole Act: {elapsed:.2f}s ({sequential / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Benchmark building a FAISS index from cached embeddings against loading the saved, fingerprinted index."""
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from langchain.schema.document import Document
+from langchain.vectorstores import FAISS
+
+from common_logic.embedding_store import SQLiteByteStore, cache_backed_embeddings
+from common_logic.index_store import index_fingerprint, load_index, save_index
+from benchmarks.bench_embedding_store import RandomEmbeddings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000], help="numbers of documents")
+    parser.add_argument("--dim", type=int, default=1536, help="embedding dimension")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        tmp = Path(tempfile.mkdtemp())
+        try:
+            documents = [Document(page_content=f"section {i} of an Act", metadata={'section': str(i)})
+                         for i in range(size)]
+            ids = [f"id{i}" for i in range(size)]
+            store = SQLiteByteStore(tmp / "embeddings.sqlite3")
+            embedder = cache_backed_embeddings(RandomEmbeddings(args.dim), store, namespace="bench")
+            embedder.embed_documents([doc.page_content for doc in documents])
+
+            # Warm start without a saved index: every cached vector is read and the index rebuilt
+            start = time.perf_counter()
+            vectorstore = FAISS.from_documents(documents, embedder, ids=ids)
+            rebuild = time.perf_counter() - start
+
+            fingerprint = index_fingerprint(ids, documents, "bench", {'index': 'IndexFlatL2'})
+            save_index(vectorstore, tmp / "index", fingerprint)
+            start = time.perf_counter()
+            fingerprint = index_fingerprint(ids, documents, "bench", {'index': 'IndexFlatL2'})
+            load_index(tmp / "index", fingerprint, embedder)
+            load = time.perf_counter() - start
+            store.close()
+            print(f"{size:7} documents  rebuild {rebuild * 1000:9.1f} ms  "
+                  f"load saved index {load * 1000:8.1f} ms  speed-up {rebuild / load:6.1f}x")
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark of sections embedded per second by the local hashing embeddings, on their own and through the cache."""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from common_logic.embedding_store import SQLiteByteStore, cache_backed_embeddings
+from common_logic.embeddings import HashingEmbeddings
+from common_logic.lxml_parser import parse_body_sections
+from common_logic.utils import flatten_text
+from tests.fixture_server import build_act_xml
+
+
+def sections_per_second(embed, texts, batch_size: int, repeat: int = 3) -> float:
+    """Best rate of embedding all the texts in batches of batch_size."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            embed(texts[i:i + batch_size])
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--copies", type=int, default=10, help="copies of the fixture Act to embed")
+    parser.add_argument("--dimensions", type=int, default=1024)
+    args = parser.parse_args()
+
+    sections = parse_body_sections(build_act_xml()).values()
+    # Number the copies so that every text is distinct, as in a real corpus
+    texts = [
+        f"{copy}.{n}. {section['title']}\n\n{flatten_text(section['parsed_data'])}"
+        for copy in range(args.copies) for n, section in enumerate(sections)
+    ]
+    print(f"{len(texts)} sections, {sum(map(len, texts)) / len(texts):.0f} characters each on average")
+    for batch_size in (1, 32, 1000):
+        embeddings = HashingEmbeddings(args.dimensions)
+        rate = sections_per_second(embeddings.embed_documents, texts, batch_size)
+        print(f"batches of {batch_size:4}:      {rate:8.0f} sections/s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteByteStore(Path(directory) / "embeddings.sqlite3")
+        embeddings = HashingEmbeddings(args.dimensions)
+        cached = cache_backed_embeddings(embeddings, store, namespace=embeddings.model)
+        cold = sections_per_second(cached.embed_documents, texts, 1000, repeat=1)
+        warm = sections_per_second(cached.embed_documents, texts, 1000)
+        print(f"cached, cold:          {cold:8.0f} sections/s")
+        print(f"cached, warm:          {warm:8.0f} sections/s")
+
+
+if __name__ == "__main__":
+    main()
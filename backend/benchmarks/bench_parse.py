@@ -0,0 +1,48 @@
+"""Micro-benchmark of sections parsed per second by the bs4 and lxml engines."""
+import argparse
+import time
+
+from common_logic.lxml_parser import parse_section
+from common_logic.utils import parse_xml, parse_recursive, flatten_text
+from tests.tests_logic import CURRENT_DIR
+
+FIXTURES = ["test_section.xml", "test_section_2.xml"]
+
+
+def parse_bs4(content: bytes) -> str:
+    """Parse a section the way the bs4 engine does, from raw bytes to flattened text."""
+    soup = parse_xml(content)
+    title_element = soup.select_one('P1group > Title')
+    title = title_element.text.strip() if title_element else None
+    return f"{title}\n\n{flatten_text(parse_recursive(soup.find('P1')))}"
+
+
+def parse_lxml(content: bytes) -> str:
+    """Parse a section with the streaming lxml engine, from raw bytes to flattened text."""
+    title, parsed_data = parse_section(content)
+    return f"{title}\n\n{flatten_text(parsed_data)}"
+
+
+def sections_per_second(parse, contents, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in contents:
+            parse(content)
+    return repeat * len(contents) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    contents = [(CURRENT_DIR / name).read_bytes() for name in FIXTURES]
+    assert all(parse_bs4(content) == parse_lxml(content) for content in contents)
+    bs4_rate = sections_per_second(parse_bs4, contents, args.repeat)
+    lxml_rate = sections_per_second(parse_lxml, contents, args.repeat)
+    print(f"bs4:  {bs4_rate:8.1f} sections/s")
+    print(f"lxml: {lxml_rate:8.1f} sections/s ({lxml_rate / bs4_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark of the memory and render time of a whole Act's sections as parsed dicts and as slotted provisions."""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from common_logic.lxml_parser import parse_body_sections
+from common_logic.provisions import Provision, render
+from common_logic.utils import flatten_text
+from tests.fixture_server import build_act_xml
+
+
+def allocated(build) -> int:
+    """Bytes still allocated by the object build returns, while it is alive."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def seconds(function, items, repeat: int) -> float:
+    """The best time of repeat runs of function over all the items."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--copies", type=int, default=5, help="copies of the fixture Act held at once")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    content = build_act_xml()
+    parsed = [section['parsed_data'] for section in parse_body_sections(content).values()]
+    trees = [Provision.from_dict(data) for data in parsed]
+    assert all(render(tree) == flatten_text(data) for tree, data in zip(trees, parsed))
+
+    sections = args.copies * len(parsed)
+    dict_bytes = allocated(lambda: [section['parsed_data'] for _ in range(args.copies)
+                                    for section in parse_body_sections(content).values()])
+    parse_bytes = allocated(lambda: [parse_body_sections(content) for _ in range(args.copies)])
+    slot_bytes = allocated(lambda: [Provision.from_dict(section['parsed_data']) for _ in range(args.copies)
+                                    for section in parse_body_sections(content).values()])
+    print(f"{sections} sections ({args.copies} copies of a {len(parsed)} section Act)")
+    print(f"dicts:       {dict_bytes / 1024:9.1f} KiB ({dict_bytes / sections:7.1f} bytes/section)")
+    print(f"provisions:  {slot_bytes / 1024:9.1f} KiB ({slot_bytes / sections:7.1f} bytes/section, "
+          f"{1 - slot_bytes / dict_bytes:.0%} less)")
+    print(f"(whole parse results, with titles and URIs: {parse_bytes / 1024:.1f} KiB)")
+
+    flatten_seconds = seconds(flatten_text, parsed, args.repeat)
+    render_seconds = seconds(render, trees, args.repeat)
+    convert_seconds = seconds(lambda data: render(Provision.from_dict(data)), parsed, args.repeat)
+    print(f"flatten_text:        {flatten_seconds * 1000:8.3f} ms/Act")
+    print(f"render:              {render_seconds * 1000:8.3f} ms/Act ({flatten_seconds / render_seconds:.2f}x)")
+    print(f"from_dict + render:  {convert_seconds * 1000:8.3f} ms/Act ({flatten_seconds / convert_seconds:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
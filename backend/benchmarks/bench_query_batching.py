@@ -0,0 +1,49 @@
+"""Benchmark query embedding throughput under concurrent load, with and without micro-batching."""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common_logic.query_batcher import QueryEmbeddingBatcher
+from tests.stub_server import StubEmbeddingsClient, StubOpenAIServer
+
+
+def run(embeddings, queries, clients: int) -> float:
+    """Embed every query from a pool of concurrent clients, returning the seconds taken."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(embeddings.embed_query, queries))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=500, help="number of queries")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32, 64], help="concurrent clients")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per embedding request")
+    parser.add_argument("--latency-per-input", type=float, default=0.0002, help="further seconds per query")
+    parser.add_argument("--dim", type=int, default=64, help="embedding dimension returned by the stub")
+    parser.add_argument("--batch-size", type=int, default=32, help="maximum queries per batch")
+    parser.add_argument("--wait", type=float, default=0.005, help="seconds to wait for a batch to fill")
+    args = parser.parse_args()
+
+    queries = [f"What does section {i} of the Patents Act say?" for i in range(args.queries)]
+    with StubOpenAIServer(latency=args.latency, latency_per_input=args.latency_per_input, dimensions=args.dim) as server:
+        for clients in args.clients:
+            server.requests.clear()
+            direct = run(StubEmbeddingsClient(server.url), queries, clients)
+            direct_requests = server.requests["embeddings"]
+
+            server.requests.clear()
+            batcher = QueryEmbeddingBatcher(StubEmbeddingsClient(server.url), args.batch_size, args.wait)
+            batched = run(batcher, queries, clients)
+            batcher.close()
+            batched_requests = server.requests["embeddings"]
+
+            print(f"{clients:3} clients  "
+                  f"direct {len(queries) / direct:7.1f} queries/s ({direct_requests:5} requests)  "
+                  f"batched {len(queries) / batched:7.1f} queries/s ({batched_requests:5} requests)  "
+                  f"speed-up {direct / batched:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark retrieval hit rate and latency of vector, hybrid and hybrid with section lookup on labelled queries."""
+import argparse
+import random
+import statistics
+import time
+from typing import List, Tuple
+
+from langchain.schema.document import Document
+from langchain.vectorstores import FAISS
+
+from common_logic.retrieval import HybridRetriever, RetrievalIndex
+from tests.fakes import FakeEmbeddings
+
+COMMON = (
+    "person application patent comptroller proceedings provision subsection period prescribed request court "
+    "invention proprietor rights order regulations notice section act applicant specification claim filed date "
+    "relevant matter purpose accordance respect opposition grant made relation case"
+).split()
+RARE = (
+    "exclusive compulsory crown supplementary biotechnological pharmaceutical divisional priority renewal "
+    "restoration surrender revocation amendment infringement threats employee compensation licence declaration "
+    "mortgage assignment register secrecy defence vessel aircraft hovercraft convention european international "
+    "translation inspection opinion certificate validity damages injunction account profits costs security "
+    "evidence witness appeal tribunal arbitration"
+).split()
+
+
+class SlowEmbeddings(FakeEmbeddings):
+    """Bag-of-words embeddings with a fixed delay per call, standing in for a remote embedding model."""
+
+    def __init__(self, size: int, latency: float):
+        super().__init__(size)
+        self.latency = latency
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+def build_corpus(sections: int, seed: int) -> Tuple[List[Document], List[Tuple[str, str, str]]]:
+    """
+    Build a synthetic Act and labelled queries.
+
+    Every section is common legal vocabulary plus a pair of rarer terms. Queries ask about a section's rare terms,
+    paraphrase it with its common words, or refer to it by number.
+
+    Returns:
+        The documents, and (kind, query, section number) for each query.
+    """
+    rng = random.Random(seed)
+    pairs = rng.sample([(a, b) for a in RARE for b in RARE if a != b], sections)
+    documents, queries = [], []
+    for number, (first, second) in enumerate(pairs, start=1):
+        label = f"{number}{'A' if number % 7 == 0 else ''}"
+        words = rng.choices(COMMON, k=60)
+        position = rng.randrange(len(words))
+        body = " ".join(words[:position] + [first, second] + words[position:])
+        documents.append(Document(
+            page_content=f"{label}. {first.capitalize()} {second}.\n\n    1) {body}",
+            metadata={"section": label, "title": f"{first} {second}", "act": "ukpga/1977/37"}
+        ))
+        queries.append(("exact terms", f"What are the rules on {first} {second}?", label))
+        queries.append(("paraphrase", " ".join(rng.sample(words, 12)), label))
+        queries.append(("section number", rng.choice([f"What does s.{label} say?", f"Explain section {label}(1)"]),
+                        label))
+    return documents, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sections", type=int, default=300, help="sections in the synthetic Act")
+    parser.add_argument("--k", type=int, default=4, help="documents retrieved per query")
+    parser.add_argument("--dim", type=int, default=256, help="embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="seconds to embed a query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    documents, queries = build_corpus(args.sections, args.seed)
+    embeddings = SlowEmbeddings(args.dim, args.embed_latency)
+    vectorstore = FAISS.from_documents(documents, embeddings)
+    modes = {
+        "vector": dict(lexical=False, sections=False),
+        "hybrid": dict(lexical=True, sections=False),
+        "hybrid + lookup": dict(lexical=True, sections=True),
+    }
+    kinds = sorted({kind for kind, _, _ in queries})
+    print(f"{len(documents)} sections, {len(queries)} queries, k={args.k}, hit rate by kind of query:")
+    print(f"{'':16}" + "".join(f"{kind:>16}" for kind in kinds) + f"{'MRR':>8}{'mean ms':>10}{'p95 ms':>10}")
+    for name, options in modes.items():
+        start = time.perf_counter()
+        index = RetrievalIndex.from_vectorstore(vectorstore, **options)
+        build = time.perf_counter() - start
+        retriever = HybridRetriever(vectorstore=vectorstore, embeddings=embeddings, index=index, k=args.k)
+        hits = {kind: [] for kind in kinds}
+        reciprocal_ranks, latencies = [], []
+        for kind, query, label in queries:
+            start = time.perf_counter()
+            found = [doc.metadata["section"] for doc in retriever.get_relevant_documents(query)]
+            latencies.append(time.perf_counter() - start)
+            hits[kind].append(label in found)
+            reciprocal_ranks.append(1 / (found.index(label) + 1) if label in found else 0.0)
+        p95 = statistics.quantiles(latencies, n=100)[94]
+        print(f"{name:16}" + "".join(f"{sum(hits[kind]) / len(hits[kind]):16.1%}" for kind in kinds)
+              + f"{statistics.mean(reciprocal_ranks):8.3f}{statistics.mean(latencies) * 1000:10.2f}{p95 * 1000:10.2f}"
+              + f"   (indexes built in {build * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Benchmark worker startup time and memory when each worker loads the index against attaching to a shared one."""
+import argparse
+import json
+import multiprocessing
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+from langchain.llms.fake import FakeListLLM
+from langchain.schema.document import Document
+
+import common_logic.data_source
+from common_logic.data_source import DataSource, SharedDataSource
+from common_logic.embedding_store import SQLiteByteStore
+from benchmarks.bench_embedding_store import RandomEmbeddings
+
+WORDS = [f"term{i}" for i in range(5000)]
+
+
+class SavedDataSource(DataSource):
+    """Data source over documents read from a JSON lines file, standing in for the parsed legislation cache."""
+
+    def __init__(self, path: Path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def index_name(self):
+        return "bench"
+
+    def load_data(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.data = [Document(**json.loads(line)) for line in f]
+        self.doc_ids = [doc.metadata['source'] for doc in self.data]
+        self.post_data_load_setup()
+
+
+def memory() -> Dict[str, float]:
+    """Resident, proportional and private memory of this process in MB."""
+    fields = {}
+    with open("/proc/self/smaps_rollup", 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {'rss': fields['Rss'], 'pss': fields['Pss'], 'private': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def worker(mode: str, tmp: Path, dim: int, queries: int, started, results, done):
+    common_logic.data_source.DATA_DIR = tmp
+    kwargs = dict(
+        embedding_model=RandomEmbeddings(dim), llm=FakeListLLM(responses=["answer"]),
+        store=SQLiteByteStore(tmp / "embeddings.sqlite3")
+    )
+    before = memory()
+    start = time.perf_counter()
+    if mode == "load":
+        data_source = SavedDataSource(tmp / "documents.jsonl", **kwargs)
+    else:
+        data_source = SharedDataSource(tmp / "shared", **kwargs)
+    data_source.load_data()
+    startup = time.perf_counter() - start
+    rng = random.Random(0)
+    for _ in range(queries):
+        data_source.qa_chain.retriever.get_relevant_documents(" ".join(rng.choices(WORDS, k=8)))
+    # Measure once every worker is running, so pages they share are split between them
+    started.wait()
+    after = memory()
+    results.put((startup, {key: after[key] - before[key] for key in after}))
+    done.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=20000, help="documents in the index")
+    parser.add_argument("--words", type=int, default=300, help="words per document")
+    parser.add_argument("--dim", type=int, default=1536, help="embedding dimension")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    parser.add_argument("--queries", type=int, default=50, help="retrievals by each worker before it is measured")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        rng = random.Random(0)
+        with open(tmp / "documents.jsonl", 'w', encoding='utf-8') as f:
+            for i in range(args.documents):
+                text = f"{i}. " + " ".join(rng.choices(WORDS, k=args.words))
+                metadata = {'section': str(i), 'title': f"Section {i}", 'source': f"bench/{i}", 'act': "bench"}
+                f.write(json.dumps({'page_content': text, 'metadata': metadata}) + "\n")
+        common_logic.data_source.DATA_DIR = tmp
+        loader = SavedDataSource(
+            tmp / "documents.jsonl", embedding_model=RandomEmbeddings(args.dim), llm=FakeListLLM(responses=["a"]),
+            store=SQLiteByteStore(tmp / "embeddings.sqlite3")
+        )
+        start = time.perf_counter()
+        loader.load_data()
+        print(f"{args.documents} documents of {args.words} words, {args.dim}-d embeddings - "
+              f"index built and saved in {time.perf_counter() - start:.1f} s")
+        start = time.perf_counter()
+        loader.publish(tmp / "shared")
+        print(f"Snapshot published in {time.perf_counter() - start:.1f} s")
+        loader.store.close()
+        del loader
+
+        context = multiprocessing.get_context("spawn")
+        print(f"{'mode':8}{'workers':>8}{'startup s':>11}{'RSS MB':>9}{'PSS MB':>9}{'private MB':>12}   per worker")
+        for mode in ("load", "attach"):
+            started, done = context.Barrier(args.workers + 1), context.Event()
+            results = context.Queue()
+            processes = [
+                context.Process(target=worker, args=(mode, tmp, args.dim, args.queries, started, results, done))
+                for _ in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+            started.wait()
+            measured = [results.get() for _ in processes]
+            done.set()
+            for process in processes:
+                process.join()
+            n = len(measured)
+            print(f"{mode:8}{n:8}{sum(s for s, _ in measured) / n:11.2f}"
+                  + "".join(f"{sum(m[key] for _, m in measured) / n:{width}.1f}"
+                            for key, width in (('rss', 9), ('pss', 9), ('private', 12))))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark size, load time and memory of the legacy pickle and the compact JSON Lines format."""
+import gc
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from common_logic.fetching import SectionFetcher
+from common_logic.storage import ParsedLegislation, save_parsed_legislation
+from common_logic.XMLparser import UKLegislationParser
+from tests.fixture_server import ClmlFixtureServer
+
+
+def measure(load, repeat: int = 3):
+    """Return the best seconds taken and peak bytes allocated by load() over a few runs."""
+    timings, peaks = [], []
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        load()
+        timings.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(timings), min(peaks)
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def main():
+    # BeautifulSoup trees are deeply nested
+    sys.setrecursionlimit(100000)
+    with ClmlFixtureServer() as server:
+        parser = UKLegislationParser(
+            f"{server.url}/ukpga/1977/37/contents", parse_sections=True, fetcher=SectionFetcher(max_workers=8)
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path = Path(tmp) / "parser.pkl"
+        compact_path = Path(tmp) / "parser.jsonl"
+        with open(pickle_path, "wb") as f:
+            pickle.dump(parser, f)
+        save_parsed_legislation(parser, compact_path)
+
+        rows = [
+            ("pickle", pickle_path, lambda: load_pickle(pickle_path)),
+            ("compact (header)", compact_path, lambda: ParsedLegislation.load(compact_path)),
+            ("compact (all sections)", compact_path,
+             lambda: ParsedLegislation.load(compact_path).get_section_dicts()),
+        ]
+        for name, path, load in rows:
+            elapsed, peak = measure(load)
+            print(f"{name:24} size {path.stat().st_size / 1e6:7.2f} MB  "
+                  f"load {elapsed * 1000:8.1f} ms  peak memory {peak / 1e6:7.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark recall@k, search latency, build time and memory of approximate and quantized indexes against flat."""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from common_logic.vector_index import build_index, configure_search, index_params
+
+
+def clustered_vectors(count: int, dimensions: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors scattered around random centres, roughly as embeddings of related passages are."""
+    centres = rng.standard_normal((clusters, dimensions))
+    vectors = centres[rng.integers(clusters, size=count)] + 0.5 * rng.standard_normal((count, dimensions))
+    vectors = vectors.astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=20000, help="vectors in the index")
+    parser.add_argument("--dim", type=int, default=256, help="embedding dimension")
+    parser.add_argument("--clusters", type=int, default=200, help="clusters the vectors are drawn around")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10, help="neighbours retrieved per query")
+    parser.add_argument("--pq-bits", type=int, default=8, help="bits per PQ code - 4 trains much faster")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = clustered_vectors(args.vectors + args.queries, args.dim, args.clusters, rng)
+    vectors, queries = vectors[:args.vectors], vectors[args.vectors:]
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    configurations = [
+        ("flat", index_params("flat"), [{}]),
+        ("ivf", index_params("ivf"), [{"nprobe": n} for n in (1, 4, 16, 64)]),
+        ("hnsw", index_params("hnsw"), [{"ef_search": ef} for ef in (16, 64, 256)]),
+        ("pq", index_params("pq", pq_bits=args.pq_bits), [{}]),
+        ("ivfpq", index_params("ivfpq", pq_bits=args.pq_bits), [{"nprobe": n} for n in (4, 16, 64)]),
+    ]
+    print(f"{args.vectors} vectors of dimension {args.dim}, {args.queries} queries, recall@{args.k} against flat:")
+    print(f"{'index':8}{'search':>14}{'recall':>10}{'ms/query':>10}{'build s':>10}{'bytes/vector':>14}")
+    for name, params, settings in configurations:
+        start = time.perf_counter()
+        index = build_index(vectors, params)
+        build = time.perf_counter() - start
+        size = len(faiss.serialize_index(index)) / args.vectors
+        for setting in settings:
+            configure_search(index, **setting)
+            start = time.perf_counter()
+            _, found = index.search(queries, args.k)
+            latency = (time.perf_counter() - start) / args.queries
+            recall = np.mean([len(set(t) & set(f)) / args.k for t, f in zip(truth, found)])
+            label = ", ".join(f"{key}={value}" for key, value in setting.items()) or "-"
+            print(f"{name:8}{label:>14}{recall:10.3f}{latency * 1000:10.3f}{build:10.2f}{size:14.1f}")
+
+
+if __name__ == "__main__":
+    main()
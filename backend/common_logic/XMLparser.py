@@ -1,26 +1,58 @@
 # Code for the legislation XML parser
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import pickle
 
-from common_logic.utils import fetch_xml, parse_recursive, flatten_text, url_to_filename
+from common_logic.fetching import SectionFetcher
+from common_logic.metrics import ACT_PARSE_SECONDS, SECTION_PARSE_SECONDS
+from common_logic.lxml_parser import parse_section, parse_body_sections
+from common_logic.storage import ParsedLegislation, save_parsed_legislation
+from common_logic.utils import (
+    fetch_xml, fetch_xml_content, parse_xml, parse_recursive, flatten_text, url_to_filename,
+    act_url_from_contents_url, normalise_uri, content_hash
+)
 from config import DATA_DIR
 
+# Engines available for parsing section XML
+ENGINES = ("bs4", "lxml")
+
+
 class UKLegislationParser:
     def __init__(
             self,
             base_url: str,
             parse_contents: bool = True,
-            parse_sections: bool = False
+            parse_sections: bool = False,
+            fetcher: Optional[SectionFetcher] = None,
+            engine: str = "bs4",
+            whole_act: bool = False,
+            previous=None,
+            previous_source_hashes: Optional[Dict[str, str]] = None
     ):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown parsing engine '{engine}', expected one of {ENGINES}")
+
         # Initialize internal data structures
         self.metadata = {}
         self.contents = {}
         self.primary = {}
         self.commentaries = {}
 
-        # Initialise the base url and fetch data
+        # Initialise the base url and fetch data - sections are fetched concurrently if a fetcher is given
         self.base_url = base_url
-        self.soup = fetch_xml(base_url)
+        self.fetcher = fetcher
+        # Section XML is kept as a BeautifulSoup tree for the bs4 engine and as raw bytes for the lxml engine
+        self.engine = engine
+        # In whole-Act mode the Act is downloaded once and split into sections locally
+        self.whole_act = whole_act
+        # Sections whose source XML hashes the same as in a previous parse are copied from it instead of re-parsed
+        self.source_hashes: Dict[str, str] = {}
+        self.previous_source_hashes = previous_source_hashes or {}
+        self._previous_sections = {
+            normalise_uri(section['DocumentURI'] or ""): section for section in previous.get_section_dicts()
+        } if previous is not None else {}
+        self._primary_reused = False
+        self.stats = {'parsed': 0, 'reused': 0}
+        self.soup = parse_xml(fetcher.fetch(base_url)) if fetcher is not None else fetch_xml(base_url)
 
         # Parse the XML data
         if parse_contents:
@@ -31,6 +63,20 @@ class UKLegislationParser:
 
         if parse_sections:
             self._parse_sections()
+        self._previous_sections = {}
+
+    def _record_source(self, uri: str, content: Optional[bytes]) -> bool:
+        """
+        Record the hash of fetched XML.
+
+        Returns:
+            bool: True if the XML hashes the same as in the previous parse.
+        """
+        if content is None:
+            return False
+        key = normalise_uri(uri)
+        self.source_hashes[key] = content_hash(content)
+        return self.previous_source_hashes.get(key) == self.source_hashes[key]
 
     def _parse_metadata(self) -> None:
         """
@@ -114,45 +160,161 @@ class UKLegislationParser:
         return items
 
     def _parse_primary(self):
-        # Populate self.primary
-        pass
+        """
+        Populate self.primary with the title and parsed data of each section in the body of the whole Act.
+
+        Only used in whole-Act mode, where the Act is downloaded once instead of once per section. Sections are keyed
+        by their normalised DocumentURI.
+
+        Returns:
+            None
+        """
+        if not self.whole_act:
+            return
+        act_url = act_url_from_contents_url(self.base_url)
+        content = self.fetcher.fetch(act_url) if self.fetcher is not None else fetch_xml_content(act_url)
+        if content is None:
+            print("Whole Act XML could not be fetched, falling back to fetching each section.")
+            return
+        if self._record_source(act_url, content) and self._previous_sections:
+            # Unchanged since the previous parse, so take the sections from it
+            self.primary = {
+                key: {'title': section['title'], 'parsed_data': section['parsed_data']}
+                for key, section in self._previous_sections.items()
+            }
+            self._primary_reused = True
+            return
+        with ACT_PARSE_SECONDS.time():
+            if self.engine == "lxml":
+                sections = parse_body_sections(content)
+            else:
+                sections = self._parse_body_sections_bs4(parse_xml(content))
+        self.primary = {normalise_uri(uri): section for uri, section in sections.items()}
+
+    @staticmethod
+    def _parse_body_sections_bs4(soup) -> Dict[str, Dict[str, Any]]:
+        """
+        Parse every top-level P1 in the body of a whole-Act BeautifulSoup tree.
+
+        Parameters:
+            soup (BeautifulSoup): The whole-Act XML.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The 'title' and 'parsed_data' of each section, keyed by its DocumentURI.
+        """
+        sections = {}
+        body = soup.find('Body')
+        if body is None:
+            return sections
+        for element in body.find_all('P1'):
+            uri = element.get('DocumentURI')
+            # Skip P1s without a URI and those nested in another P1, such as amending text
+            if uri is None or uri in sections or element.find_parent('P1') is not None:
+                continue
+            title = None
+            if element.parent.name == 'P1group':
+                title_element = element.parent.find('Title', recursive=False)
+                title = title_element.text.strip() if title_element else None
+            sections[uri] = {'title': title, 'parsed_data': parse_recursive(element)}
+        return sections
 
     def _parse_commentaries(self):
         # Populate self.commentaries
         pass
 
-    def _fetch_section_data(self):
-        """Fetch the XML data for each section and populate the corresponding dictionary."""
-        for part in self.contents['parts']:
-            for block in part['blocks']:
-                for item in block['items']:
-                    uri = item['DocumentURI']
-                    xml_data = fetch_xml(uri)
-                    item['xml_data'] = xml_data
+    def _fetch_section_data(self, items: Optional[List[Dict[str, Any]]] = None):
+        """
+        Fetch the XML data for each section and populate the corresponding dictionary.
 
-    def _parse_section_data(self):
-        """Parse the XML data for each section and populate the corresponding dictionary."""
-        for part in self.contents['parts']:
-            for block in part['blocks']:
-                for item in block['items']:
-                    xml_data = item['xml_data']
+        Parameters:
+            items (List[Dict[str, Any]]): The sections to fetch. Defaults to all sections.
+        """
+        if items is None:
+            items = self.get_section_dicts()
+        if self.fetcher is not None:
+            self._fetch_section_data_concurrently(items)
+            return
+        for item in items:
+            self._set_fetched_content(item, fetch_xml_content(item['DocumentURI']))
+
+    def _set_fetched_content(self, item: Dict[str, Any], content: Optional[bytes]):
+        """Record the hash of a section's fetched XML and keep it in the form the engine parses."""
+        reusable = self._record_source(item['DocumentURI'], content) \
+            and normalise_uri(item['DocumentURI']) in self._previous_sections
+        # Unchanged sections are reused without parsing, so there is no need to build a soup for them
+        item['xml_data'] = content if self.engine == "lxml" or reusable else parse_xml(content)
+
+    def _fetch_section_data_concurrently(self, items: List[Dict[str, Any]]):
+        """Fetch the XML data for the given sections using the fetcher, keeping the section order."""
+        contents = self.fetcher.fetch_all(item['DocumentURI'] for item in items)
+        for item, content in zip(items, contents):
+            self._set_fetched_content(item, content)
+
+    def _reuse_section(self, item: Dict[str, Any]) -> bool:
+        """Copy the section from the previous parse if its source XML is unchanged, returning True if it was."""
+        key = normalise_uri(item['DocumentURI'] or "")
+        if key not in self._previous_sections or key not in self.source_hashes \
+                or self.source_hashes[key] != self.previous_source_hashes.get(key):
+            return False
+        previous = self._previous_sections[key]
+        item['xml_data'] = None
+        self._set_section_data(item, previous['title'], previous['parsed_data'])
+        return True
+
+    def _parse_section_data(self, items: Optional[List[Dict[str, Any]]] = None):
+        """
+        Parse the XML data for each section and populate the corresponding dictionary.
+
+        Parameters:
+            items (List[Dict[str, Any]]): The sections to parse. Defaults to all sections.
+        """
+        if items is None:
+            items = self.get_section_dicts()
+        for item in items:
+            xml_data = item['xml_data']
+            with SECTION_PARSE_SECONDS.time():
+                if self.engine == "lxml":
+                    title_text, parsed_data = parse_section(xml_data)
+                else:
                     # Get the title of the section
                     title_element = xml_data.select_one('P1group > Title')
                     title_text = title_element.text.strip() if title_element else None
-                    item['title'] = title_text
                     # Get the P1 element and parse it recursively
                     primary_element = xml_data.find('P1')
                     parsed_data = parse_recursive(primary_element)
-                    item['parsed_data'] = parsed_data
-                    # Flatten the text
-                    flattened_text = flatten_text(parsed_data)
-                    item['flattened_text'] = f"{item['number']}. {item['title']}\n\n{flattened_text}"
+            self._set_section_data(item, title_text, parsed_data)
+
+    @staticmethod
+    def _set_section_data(item: Dict[str, Any], title: Optional[str], parsed_data: Dict) -> None:
+        """Populate the title, parsed data and flattened text of a section."""
+        item['title'] = title
+        item['parsed_data'] = parsed_data
+        # Flatten the text
+        flattened_text = flatten_text(parsed_data)
+        item['flattened_text'] = f"{item['number']}. {item['title']}\n\n{flattened_text}"
 
     def _parse_sections(self):
         """Fetch and parse the sections."""
-        # Fetch and parse the XML data for each section
-        self._fetch_section_data()
-        self._parse_section_data()
+        items = self.get_section_dicts()
+        if self.whole_act:
+            # Take sections from the whole-Act body and only fetch those that are missing from it
+            missing = []
+            for item in items:
+                section = self.primary.get(normalise_uri(item['DocumentURI'] or ""))
+                if section is None:
+                    missing.append(item)
+                else:
+                    self._set_section_data(item, section['title'], section['parsed_data'])
+                    self.stats['reused' if self._primary_reused else 'parsed'] += 1
+            if missing:
+                print(f"{len(missing)} sections not found in the whole Act XML, fetching individually.")
+            items = missing
+        # Fetch and parse the XML data for each section, skipping those that are unchanged
+        self._fetch_section_data(items)
+        to_parse = [item for item in items if not self._reuse_section(item)]
+        self._parse_section_data(to_parse)
+        self.stats['reused'] += len(items) - len(to_parse)
+        self.stats['parsed'] += len(to_parse)
 
     def get_metadata(self):
         return self.metadata
@@ -178,16 +340,32 @@ class UKLegislationParser:
                     sections.append(item)
         return sections
 
+    def __getstate__(self):
+        """Exclude the fetcher and its HTTP session when pickling."""
+        state = self.__dict__.copy()
+        state['fetcher'] = None
+        state['_previous_sections'] = {}
+        return state
+
     def save(self, filename: str = None):
-        """Save the object to a pickle file."""
+        """
+        Save the parsed structure in the compact JSON Lines format.
+
+        Only metadata, contents and section records are written - not the XML trees.
+        """
         if filename is None:
-            filename = url_to_filename(self.base_url) + ".pkl"
+            filename = url_to_filename(self.base_url) + ".jsonl"
             filename = DATA_DIR / filename
-        with open(filename, 'wb') as f:
-            pickle.dump(self, f)
+        save_parsed_legislation(self, filename)
 
     @classmethod
-    def load(cls, filename: str = "parser.pkl"):
-        """Load the object from a pickle file."""
-        with open(filename, 'rb') as f:
-            return pickle.load(f)
+    def load(cls, filename: str = "parser.jsonl"):
+        """
+        Load parsed legislation saved with save().
+
+        Files with a '.pkl' suffix are treated as legacy pickles of the whole parser.
+        """
+        if str(filename).endswith(".pkl"):
+            with open(filename, 'rb') as f:
+                return pickle.load(f)
+        return ParsedLegislation.load(filename)
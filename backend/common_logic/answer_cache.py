@@ -0,0 +1,265 @@
+"""Cache of answers to repeated and near-duplicate queries."""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from config import logger
+
+# Key of a cached answer: (scope, acts, normalised query)
+CacheKey = Tuple[str, Tuple[str, ...], str]
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalise a query so that trivially different phrasings share a cache entry.
+
+    Case, runs of whitespace and trailing punctuation are ignored.
+    """
+    return re.sub(r"\s+", " ", query.casefold()).strip().rstrip("?!. ")
+
+
+class CacheEntry(NamedTuple):
+    """A cached answer with the query embedding it was stored with, if any."""
+    answer: Dict[str, Any]
+    embedding: Optional[np.ndarray]
+    created: float
+
+
+class Lookup(NamedTuple):
+    """
+    Result of looking up a query.
+
+    Attributes:
+        answer (Optional[Dict[str, Any]]): The cached answer, or None on a miss.
+        embedding (Optional[np.ndarray]): The query embedding computed for the lookup, to store with the answer.
+    """
+    answer: Optional[Dict[str, Any]]
+    embedding: Optional[np.ndarray]
+
+
+class AnswerCache:
+    """
+    Two-tier cache of post-processed answers, keyed on the normalised query.
+
+    Entries are scoped to a fingerprint of the index they were answered from, so they are never served once the
+    index changes. Recent entries are held in memory with LRU eviction, and optionally in a SQLite file that
+    survives restarts. If a similarity threshold is set, a query that misses exactly is matched against the query
+    embeddings of the entries in memory, and the answer to the most similar one is used if it is close enough.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = 1024,
+            ttl: float = 24 * 60 * 60,
+            similarity_threshold: Optional[float] = None,
+            path: Optional[Union[str, Path]] = None,
+            clock: Callable[[], float] = time.time
+    ):
+        """
+        Initialise the cache.
+
+        Parameters:
+            max_entries (int): Maximum number of entries in each tier.
+            ttl (float): Seconds an entry is served for after it is stored.
+            similarity_threshold (float, optional): Minimum cosine similarity of query embeddings for a near-duplicate
+                query to be served from the cache. Only exact matches are served if not given.
+            path (str or Path, optional): SQLite file for the on-disk tier. Only the memory tier is used if not given.
+            clock (Callable): Returns the current time in seconds.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.clock = clock
+        self.stats = {'hits': 0, 'semantic_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path is not None:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+            with self._conn:
+                self._conn.execute(
+                    """CREATE TABLE IF NOT EXISTS answers (
+                        scope TEXT NOT NULL,
+                        acts TEXT NOT NULL,
+                        query TEXT NOT NULL,
+                        answer TEXT NOT NULL,
+                        embedding BLOB,
+                        created REAL NOT NULL,
+                        PRIMARY KEY (scope, acts, query)
+                    )"""
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS answers_created ON answers (created)")
+
+    @staticmethod
+    def _key(query: str, scope: str, acts: Optional[Iterable[str]]) -> CacheKey:
+        return scope, tuple(sorted(acts)) if acts is not None else (), normalize_query(query)
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return self.clock() - entry.created > self.ttl
+
+    def get(
+            self,
+            query: str,
+            scope: str,
+            acts: Optional[Iterable[str]] = None,
+            embed: Optional[Callable[[str], List[float]]] = None
+    ) -> Lookup:
+        """
+        Look up the answer to a query.
+
+        Parameters:
+            query (str): The query.
+            scope (str): Fingerprint of the index the answer must come from.
+            acts (Iterable[str], optional): The Acts the query is restricted to.
+            embed (Callable, optional): Embeds the query, used for near-duplicate matching if a similarity threshold
+                is set. It is only called if there is no exact match.
+
+        Returns:
+            Lookup: The cached answer, if any, and the query embedding if one was computed.
+        """
+        key = self._key(query, scope, acts)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return Lookup(entry.answer, entry.embedding)
+        entry = self._get_from_disk(key)
+        if entry is not None:
+            with self._lock:
+                self._store(key, entry)
+                self.stats['hits'] += 1
+                self.stats['disk_hits'] += 1
+            return Lookup(entry.answer, entry.embedding)
+
+        embedding = None
+        if self.similarity_threshold is not None and embed is not None:
+            embedding = self._normalise(embed(query))
+            answer = self._get_similar(key, embedding)
+            if answer is not None:
+                return Lookup(answer, embedding)
+        with self._lock:
+            self.stats['misses'] += 1
+        return Lookup(None, embedding)
+
+    @staticmethod
+    def _normalise(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _get_similar(self, key: CacheKey, embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Return the answer to the most similar query in the same scope, if it is above the threshold."""
+        scope, acts, _ = key
+        with self._lock:
+            candidates = [
+                (candidate_key, entry) for candidate_key, entry in self._entries.items()
+                if candidate_key[:2] == (scope, acts) and entry.embedding is not None and not self._expired(entry)
+            ]
+            if not candidates:
+                return None
+            similarities = np.stack([entry.embedding for _, entry in candidates]) @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            best_key, best_entry = candidates[best]
+            self._entries.move_to_end(best_key)
+            self.stats['hits'] += 1
+            self.stats['semantic_hits'] += 1
+            return best_entry.answer
+
+    def put(
+            self,
+            query: str,
+            scope: str,
+            answer: Dict[str, Any],
+            acts: Optional[Iterable[str]] = None,
+            embedding: Optional[Union[np.ndarray, List[float]]] = None
+    ) -> None:
+        """
+        Store the post-processed answer to a query.
+
+        Parameters:
+            query (str): The query.
+            scope (str): Fingerprint of the index the answer came from.
+            answer (Dict[str, Any]): The answer, as sent to clients.
+            acts (Iterable[str], optional): The Acts the query was restricted to.
+            embedding (optional): The query embedding, for near-duplicate matching.
+        """
+        key = self._key(query, scope, acts)
+        entry = CacheEntry(answer, self._normalise(embedding) if embedding is not None else None, self.clock())
+        with self._lock:
+            self._store(key, entry)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO answers (scope, acts, query, answer, embedding, created) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (key[0], json.dumps(key[1]), key[2], json.dumps(answer),
+                         entry.embedding.tobytes() if entry.embedding is not None else None, entry.created)
+                    )
+                    self._evict_from_disk()
+
+    def _store(self, key: CacheKey, entry: CacheEntry) -> None:
+        """Store an entry in memory, evicting the least recently used entries above the size bound."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _get_from_disk(self, key: CacheKey) -> Optional[CacheEntry]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, embedding, created FROM answers WHERE scope = ? AND acts = ? AND query = ?",
+                (key[0], json.dumps(key[1]), key[2])
+            ).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(
+            json.loads(row[0]), np.frombuffer(row[1], dtype=np.float32) if row[1] is not None else None, row[2]
+        )
+        return None if self._expired(entry) else entry
+
+    def _evict_from_disk(self) -> None:
+        """Delete expired entries and the oldest entries above the size bound from the on-disk tier."""
+        self._conn.execute("DELETE FROM answers WHERE created < ?", (self.clock() - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM answers")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def close(self) -> None:
+        """Close the on-disk tier."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        logger.info(f"Answer cache: {self.stats}")
@@ -0,0 +1,87 @@
+"""Splitting parsed sections into subsection chunks, each labelled with its path in the section."""
+
+import math
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from common_logic.utils import flatten_text
+
+# Characters per token of English legislation, for estimates made without a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of LLM tokens in a text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class Chunk(NamedTuple):
+    """A part of a section - a subsection, a paragraph of one, or the text of the section around them."""
+    # Labels from the section number down, e.g. ('60', '2', 'a')
+    path: Tuple[str, ...]
+    text: str
+
+    @property
+    def label(self) -> str:
+        """The chunk's reference as written in legislation, e.g. '60(2)(a)'."""
+        return self.path[0] + "".join(f"({part})" for part in self.path[1:])
+
+
+def section_heading(number: str, title: str) -> str:
+    """The heading that starts the text of a section and of each of its chunks."""
+    return f"{number}. {title}\n\n"
+
+
+def chunk_section(number: str, title: str, parsed_data: Dict[str, Any], max_tokens: int) -> List[Chunk]:
+    """
+    Split a parsed section into one chunk per subsection, in order.
+
+    Subsections longer than max_tokens are split further into their paragraphs, and so on down. Text of a part that
+    is split, such as the words introducing its paragraphs, forms a chunk of its own labelled with the part. A section
+    without subsections is a single chunk whose text is the whole section, as it is indexed without chunking.
+
+    Parameters:
+        number (str): The section number.
+        title (str): The section title.
+        parsed_data (Dict[str, Any]): The section parsed by parse_recursive.
+        max_tokens (int): Estimated tokens above which a part is split into its parts.
+
+    Returns:
+        List[Chunk]: The chunks, whose texts together hold all of the section's text.
+    """
+    heading = section_heading(number, title)
+    if not any(isinstance(item, dict) for item in parsed_data.get('text', [])):
+        return [Chunk((str(number),), heading + flatten_text(parsed_data))]
+    parts = []
+    _split(parsed_data, (), max_tokens, parts, top=True)
+    return [
+        Chunk((str(number),) + labels, heading + flatten_text(_nest(labels, node)))
+        for labels, node in parts
+    ]
+
+
+def _split(
+        node: Dict[str, Any],
+        labels: Tuple[str, ...],
+        max_tokens: int,
+        parts: List[Tuple[Tuple[str, ...], Dict[str, Any]]],
+        top: bool = False
+) -> None:
+    """Add the parts of a node to parts, splitting the section itself and any node longer than max_tokens."""
+    children = [item for item in node.get('text', []) if isinstance(item, dict)]
+    if not children or not top and estimate_tokens(flatten_text(_nest(labels, node))) <= max_tokens:
+        parts.append((labels, node))
+        return
+    loose = [item for item in node['text'] if not isinstance(item, dict)]
+    if loose:
+        parts.append((labels, {**node, 'text': loose}))
+    for child in children:
+        _split(child, labels + (str(child.get('label', '')),), max_tokens, parts)
+
+
+def _nest(labels: Tuple[str, ...], node: Dict[str, Any]) -> Dict[str, Any]:
+    """Wrap a node in its ancestors, so that it is flattened with the labels of its path and its depth."""
+    if not labels:
+        return node
+    for label in reversed(labels[:-1]):
+        node = {'text': [node], 'label': label}
+    return {'text': [node]}
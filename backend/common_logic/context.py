@@ -0,0 +1,141 @@
+"""Token counting, and the assembly of retrieved documents into the context passed to the LLM."""
+
+import threading
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain.schema import BaseStore
+from langchain.schema.document import Document
+
+from common_logic.chunking import estimate_tokens
+from common_logic.utils import content_hash
+from config import logger
+
+
+class TokenCounter:
+    """
+    Counts the tokens of texts with a tiktoken encoding, caching the counts in a byte store.
+
+    Falls back to estimating counts from the length of texts if tiktoken or the encoding cannot be loaded - tiktoken
+    downloads encodings the first time they are used.
+    """
+
+    def __init__(self, store: Optional[BaseStore[str, bytes]] = None, encoding: str = "cl100k_base"):
+        """
+        Parameters:
+            store (BaseStore[str, bytes], optional): Store to cache counts in, such as the one opened by
+                embedding_store.open_token_count_store.
+            encoding (str): Name of the tiktoken encoding.
+        """
+        self.store = store
+        self.encoding_name = encoding
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        """The tiktoken encoding, or None if it cannot be loaded."""
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    import tiktoken
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception as e:
+                    logger.warning(f"Cannot load the {self.encoding_name} tiktoken encoding ({e}), estimating tokens")
+        return self._encoding
+
+    @property
+    def name(self) -> str:
+        """Name of the way tokens are counted, part of the keys of cached counts."""
+        return f"tiktoken-{self.encoding_name}" if self.encoding is not None else "estimate"
+
+    def _count(self, text: str) -> int:
+        encoding = self.encoding
+        if encoding is None:
+            return estimate_tokens(text)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def count(self, texts: Sequence[str]) -> List[int]:
+        """
+        Count the tokens of texts, looking them up in the store first and caching those that had to be counted.
+
+        Parameters:
+            texts (Sequence[str]): The texts.
+
+        Returns:
+            List[int]: The number of tokens of each text.
+        """
+        if self.store is None:
+            return [self._count(text) for text in texts]
+        prefix = f"{self.name}:"
+        keys = [prefix + content_hash(text) for text in texts]
+        counts = [int(value) if value is not None else None for value in self.store.mget(keys)]
+        missing = [(key, i) for i, (key, count) in enumerate(zip(keys, counts)) if count is None]
+        for _, i in missing:
+            counts[i] = self._count(texts[i])
+        if missing:
+            self.store.mset([(key, str(counts[i]).encode()) for key, i in missing])
+        return counts
+
+
+class ContextStats(NamedTuple):
+    """What context assembly did to the documents of a query."""
+    # Tokens of the documents passed to the LLM
+    tokens: int
+    # Documents dropped as duplicates of documents ranked above them, and their tokens
+    duplicates: int
+    duplicate_tokens: int
+    # Tokens dropped to keep within the token budget
+    truncated_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        """Tokens of retrieved documents left out of the context."""
+        return self.duplicate_tokens + self.truncated_tokens
+
+
+def is_duplicate(terms: frozenset, kept: Sequence[frozenset], similarity: float) -> bool:
+    """Whether the words of a text are at least similarity alike (by Jaccard similarity) to those of a kept text."""
+    for other in kept:
+        union = len(terms | other)
+        if union == 0 or len(terms & other) / union >= similarity:
+            return True
+    return False
+
+
+def truncate_text(text: str, tokens: int, max_tokens: int) -> str:
+    """Cut a text of the given number of tokens down to about max_tokens, at a word boundary."""
+    end = len(text) * max_tokens // max(tokens, 1)
+    cut = text.rfind(" ", 0, end + 1)
+    return text[:cut if cut > 0 else end]
+
+
+def fit_to_budget(documents: Sequence[Tuple[Document, int]], max_tokens: int) -> Tuple[List[Document], int, int]:
+    """
+    Keep documents, in rank order, while their tokens fit a budget.
+
+    Documents that do not fit are dropped, and smaller documents ranked below them may still fit. If the best
+    document does not fit on its own, it is truncated to the budget.
+
+    Parameters:
+        documents (Sequence[Tuple[Document, int]]): The documents, best first, with their number of tokens.
+        max_tokens (int): The budget, 0 for no limit.
+
+    Returns:
+        Tuple[List[Document], int, int]: The documents kept, their tokens, and the tokens dropped.
+    """
+    kept, total, dropped = [], 0, 0
+    for doc, tokens in documents:
+        if not max_tokens or total + tokens <= max_tokens:
+            kept.append(doc)
+            total += tokens
+        elif not kept:
+            kept.append(Document(
+                page_content=truncate_text(doc.page_content, tokens, max_tokens), metadata=doc.metadata
+            ))
+            total += max_tokens
+            dropped += tokens - max_tokens
+        else:
+            dropped += tokens
+    return kept, total, dropped
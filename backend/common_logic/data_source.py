@@ -1,96 +1,791 @@
+import json
 import logging
+import os
 import pickle
-from langchain.embeddings import CacheBackedEmbeddings
-from langchain.embeddings.openai import OpenAIEmbeddings
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+import faiss
+import numpy as np
+from langchain.embeddings.base import Embeddings
 from langchain.vectorstores import FAISS
-from langchain.storage import LocalFileStore
 from langchain.chat_models import ChatOpenAI
 from langchain.chains import RetrievalQA
 from langchain.callbacks import StdOutCallbackHandler
+from langchain.callbacks.base import AsyncCallbackHandler, BaseCallbackHandler
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema import BaseStore
 from langchain.schema.document import Document
+from langchain.schema.language_model import BaseLanguageModel
 
-from config import logger, DATA_DIR
+from config import (
+    logger, DATA_DIR, FETCH_CONCURRENCY, FETCH_RATE_LIMIT, FETCH_MAX_RETRIES, FETCH_TIMEOUT, HTTP_CACHE_MAX_BYTES,
+    PARSER_ENGINE, WHOLE_ACT_INGEST, INGEST_PROCESSES, EMBEDDING_STORE, EMBEDDING_PROVIDER, HASHING_DIMENSIONS,
+    PERSIST_INDEX, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT, RETRIEVAL_K, RETRIEVAL_FETCH_K, HYBRID_RETRIEVAL, SECTION_LOOKUP,
+    VECTOR_INDEX, IVF_NLIST, IVF_NPROBE, HNSW_M, HNSW_EF_SEARCH, PQ_M, PQ_BITS, SUBSECTION_CHUNKS, CHUNK_MAX_TOKENS,
+    CHUNK_EXPANSION_TOKENS, CONTEXT_MAX_TOKENS, CONTEXT_DEDUP_SIMILARITY, CONTEXT_ENCODING, EMBED_BATCH_TOKENS,
+    EMBED_BATCH_SIZE, EMBED_CONCURRENCY, EMBED_REQUESTS_PER_MINUTE, EMBED_TOKENS_PER_MINUTE, EMBED_MAX_RETRIES
+)
+from common_logic.chunking import chunk_section
+from common_logic.context import TokenCounter
+from common_logic.embeddings import HashingEmbeddings, create_embeddings
+from common_logic.embedding_scheduler import EmbeddingScheduler, without_retries
+from common_logic.embedding_store import cache_backed_embeddings, open_embedding_store, open_token_count_store
+from common_logic.fetching import SectionFetcher
+from common_logic.http_cache import HTTPCache
+from common_logic.index_store import index_fingerprint, load_index, save_index
+from common_logic.manifest import Manifest, document_hash
+from common_logic.metrics import INDEX_BUILD_SECONDS, LLM_SECONDS, SECTIONS
+from common_logic.query_batcher import QueryEmbeddingBatcher, aembed_query
+from common_logic.retrieval import HybridRetriever, RetrievalIndex
+from common_logic.shared_index import Snapshot, current_snapshot, open_index, open_retrieval_index, publish_snapshot
+from common_logic.vector_index import build_index, configure_search, index_params, is_exact
+from common_logic.storage import ParsedLegislation, save_parsed_legislation
 from common_logic.XMLparser import UKLegislationParser
-from common_logic.utils import url_to_filename
+from common_logic.utils import url_to_filename, act_id
+
+
+def ingest_legislation(
+        url: str, path: Path, previous_source_hashes: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Fetch and parse the legislation at a URL and save it in the compact format.
+
+    This is a plain function so that it can run in a worker process.
+
+    Parameters:
+        url (str): The contents URL of the legislation.
+        path (Path): The file to save the parsed legislation to.
+        previous_source_hashes (Dict[str, str], optional): Source hashes from a previous ingest. If given, sections
+            whose source is unchanged are copied from the file already at path instead of being parsed again.
+
+    Returns:
+        Dict[str, str]: The hash of the source XML of each fetched document, keyed by normalised URI.
+    """
+    previous = ParsedLegislation.load(path) if previous_source_hashes and path.exists() else None
+    http_cache = HTTPCache(DATA_DIR / "http_cache.sqlite3", max_bytes=HTTP_CACHE_MAX_BYTES)
+    fetcher = SectionFetcher(
+        max_workers=FETCH_CONCURRENCY,
+        requests_per_second=FETCH_RATE_LIMIT,
+        max_retries=FETCH_MAX_RETRIES,
+        timeout=FETCH_TIMEOUT,
+        cache=http_cache
+    )
+    try:
+        parser = UKLegislationParser(
+            url, parse_sections=True, fetcher=fetcher, engine=PARSER_ENGINE,
+            whole_act=WHOLE_ACT_INGEST, previous=previous, previous_source_hashes=previous_source_hashes
+        )
+    finally:
+        fetcher.close()
+        http_cache.close()
+        if previous is not None:
+            previous.close()
+    logger.info(f"Parsed {url} - HTTP cache: {http_cache.stats}, sections: {parser.stats}")
+    for outcome, count in parser.stats.items():
+        SECTIONS.labels(outcome).inc(count)
+    parser.save(path)
+    return parser.source_hashes
+
+class TokenCallbackHandler(BaseCallbackHandler):
+    """Pass each token streamed by the LLM to a function."""
+
+    def __init__(self, on_token: Callable[[str], None]):
+        self.on_token = on_token
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.on_token(token)
+
+
+class AsyncTokenCallbackHandler(AsyncCallbackHandler):
+    """Await a coroutine function with each token streamed by the LLM, on the event loop."""
+
+    def __init__(self, on_token: Callable[[str], Awaitable[None]]):
+        self.on_token = on_token
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        await self.on_token(token)
+
 
 class DataSource:
-    def __init__(self):
+    def __init__(
+            self,
+            embedding_model: Optional[Embeddings] = None,
+            llm: Optional[BaseLanguageModel] = None,
+            store: Optional[BaseStore[str, bytes]] = None
+    ):
         self.logger = logger
         self.logger.info("Initializing data source")
 
         self.data = None
-        self.logger.info("Creating local file store")
+        # Vector store ids of the documents in self.data - random ids are used if left as None
+        self.doc_ids = None
         # Initialize common functionalities
-        embeddings_cache_dir = DATA_DIR / "embeddings_cache/"
-        self.store = LocalFileStore(embeddings_cache_dir)
-        self.logger.info("Initialising OpenAI Embeddings and Chat")
-        # Use the OpenAIEmbeddings model - means it's easier to host remotely as we don't need a GPU
-        self.core_embedding_model = OpenAIEmbeddings()
-        self.llm = ChatOpenAI()
+        # The embedding store, opened when first used so that a data source that never indexes does not create it
+        self._store = store
+        # Counts the tokens of documents when they are indexed, caching the counts beside the embedding store
+        self.token_counter = None
+        self.logger.info(f"Initialising {EMBEDDING_PROVIDER} Embeddings and OpenAI Chat")
+        self.core_embedding_model = embedding_model if embedding_model is not None \
+            else create_embeddings(EMBEDDING_PROVIDER, HASHING_DIMENSIONS)
+        # Streaming lets answers be forwarded token by token, and makes no difference to whole answers
+        self.llm = llm if llm is not None else ChatOpenAI(streaming=True)
 
         # Initialize these after data is loaded
+        # Fingerprint of the inputs of the vector index, which changes whenever answers may change
+        self.fingerprint = None
         self.embedder = None
+        # Embeds queries for retrieval, batching concurrent queries together
+        self.query_embedder = None
         self.vectorstore = None
+        # Whether the vectors of the vector store are L2-normalised, which its searches must know
+        self.normalize_L2 = False
+        # Lexical and section number indexes over the documents of the vector store
+        self.retrieval_index = None
         self.qa_chain = None
 
     def load_data(self):
         raise NotImplementedError("This method should be overridden by subclass")
 
+    @property
+    def store(self) -> BaseStore[str, bytes]:
+        """The store embeddings are cached in."""
+        if self._store is None:
+            self.logger.info("Opening embedding store")
+            self._store = open_embedding_store(DATA_DIR, EMBEDDING_STORE)
+        return self._store
+
+    @property
+    def embedding_namespace(self) -> str:
+        """Name of the embedding model, used to namespace cached embeddings."""
+        return getattr(self.core_embedding_model, "model", type(self.core_embedding_model).__name__)
+
+    @property
+    def index_dir(self) -> Optional[Path]:
+        """Directory the vector index is saved in, or None if it is not persisted."""
+        if not PERSIST_INDEX or self.index_name() is None or self.doc_ids is None:
+            return None
+        return DATA_DIR / "indexes" / self.index_name()
+
+    def index_name(self) -> Optional[str]:
+        """Name of the saved vector index - subclasses return a name to persist their index."""
+        return None
+
+    def index_params(self) -> Dict[str, Any]:
+        """Parameters of the vector index, part of its fingerprint."""
+        return index_params(VECTOR_INDEX, nlist=IVF_NLIST, hnsw_m=HNSW_M, pq_m=PQ_M, pq_bits=PQ_BITS)
+
+    def index_fingerprint(self) -> str:
+        """Fingerprint of the documents, embedding model and index parameters the vector index is built from."""
+        ids = self.doc_ids if self.doc_ids is not None else [""] * len(self.data)
+        return index_fingerprint(ids, self.data, self.embedding_namespace, self.index_params())
+
     def post_data_load_setup(self):
+        self._setup_embeddings()
+        index_dir = self.index_dir
+        start = time.perf_counter()
+        self.fingerprint = self.index_fingerprint()
+        self.vectorstore = load_index(
+            index_dir, self.fingerprint, self.query_embedder, normalize_L2=self.normalize_L2
+        ) if index_dir else None
+        if self.vectorstore is not None:
+            self.logger.info(f"Loaded saved vector index from {index_dir}")
+            operation = "load"
+        else:
+            self.logger.info("Storing embeddings in vector store")
+            self.vectorstore = self._build_vectorstore()
+            self._save_index()
+            operation = "build"
+        configure_search(self.vectorstore.index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+        self._build_retrieval_index()
+        INDEX_BUILD_SECONDS.labels(operation).observe(time.perf_counter() - start)
+        self._build_qa_chain()
+
+    def _setup_embeddings(self) -> None:
+        """Create the embedders of documents, backed by the embedding store, and of queries."""
         self.logger.info("Creating cache backed embeddings")
-        self.embedder = CacheBackedEmbeddings.from_bytes_store(
+        self.token_counter = TokenCounter(open_token_count_store(self.store), CONTEXT_ENCODING)
+        self.embedder = cache_backed_embeddings(
             self.core_embedding_model,
             self.store,
-            namespace=self.core_embedding_model.model
+            namespace=self.embedding_namespace,
+            scheduler=self._embedding_scheduler()
+        )
+        self.query_embedder = QueryEmbeddingBatcher(
+            self.core_embedding_model, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT, document_embeddings=self.embedder
+        ) if QUERY_BATCH_SIZE > 1 else self.embedder
+
+    def _embedding_scheduler(self) -> Optional[EmbeddingScheduler]:
+        """The scheduler of documents embedded by a remote model, or None for a local model."""
+        if isinstance(self.core_embedding_model, HashingEmbeddings):
+            return None
+        return EmbeddingScheduler(
+            without_retries(self.core_embedding_model), self.token_counter, max_batch_tokens=EMBED_BATCH_TOKENS,
+            max_batch_size=EMBED_BATCH_SIZE, max_concurrency=EMBED_CONCURRENCY,
+            requests_per_minute=EMBED_REQUESTS_PER_MINUTE, tokens_per_minute=EMBED_TOKENS_PER_MINUTE,
+            max_retries=EMBED_MAX_RETRIES
         )
-        self.logger.info("Storing embeddings in vector store")
-        self.vectorstore = FAISS.from_documents(self.data, self.embedder)
+
+    def _build_qa_chain(self) -> None:
+        """Build the QA chain over the vector store and retrieval index."""
         self.logger.info("Initializing the QA chain")
         self.qa_chain = RetrievalQA.from_chain_type(
             llm=self.llm,
-            retriever=self.vectorstore.as_retriever(),
+            retriever=self._retriever(),
             callbacks=[StdOutCallbackHandler()],
             return_source_documents=True
         )
 
-    def get_answers_and_documents(self, query):
+    def _build_vectorstore(self) -> FAISS:
+        """
+        Embed the documents into a new vector store, with an index of the configured type trained on them.
+
+        The embeddings are gathered into one array, from which the index is built directly, so that building an
+        approximate index never holds a flat index of every vector as well.
+        """
+        vectors = np.array(self.embedder.embed_documents([doc.page_content for doc in self.data]), dtype=np.float32)
+        if self.normalize_L2:
+            faiss.normalize_L2(vectors)
+        index = build_index(vectors, self.index_params())
+        ids = self.doc_ids if self.doc_ids is not None else [str(uuid.uuid4()) for _ in self.data]
+        assert len(set(ids)) == len(ids), "Document ids must be unique, or the docstore would drop documents"
+        return FAISS(
+            self.query_embedder.embed_query, index, InMemoryDocstore(dict(zip(ids, self.data))), dict(enumerate(ids)),
+            normalize_L2=self.normalize_L2
+        )
+
+    def _build_retrieval_index(self) -> None:
+        """Index the documents of the vector store by their terms and section numbers, and count their tokens."""
+        self.logger.info("Building the lexical and section indexes")
+        self.retrieval_index = RetrievalIndex.from_vectorstore(
+            self.vectorstore, token_counter=self.token_counter, lexical=HYBRID_RETRIEVAL, sections=SECTION_LOOKUP
+        )
+
+    def _retriever(self, filter: Optional[Dict[str, Any]] = None) -> HybridRetriever:
+        """Build a retriever over the vector store and the retrieval index, restricted by a metadata filter."""
+        return HybridRetriever(
+            vectorstore=self.vectorstore, embeddings=self.query_embedder, index=self.retrieval_index,
+            k=RETRIEVAL_K, fetch_k=RETRIEVAL_FETCH_K, filter=filter, normalize_L2=self.normalize_L2,
+            expansion_tokens=CHUNK_EXPANSION_TOKENS, dedup_similarity=CONTEXT_DEDUP_SIMILARITY,
+            max_tokens=CONTEXT_MAX_TOKENS
+        )
+
+    def _update_vectors(self, stale: List[str], fresh: Set[str]) -> None:
+        """
+        Update the vector store in place.
+
+        Approximate indexes cannot have vectors removed in place, so they are rebuilt and retrained instead, with the
+        unchanged documents' embeddings coming from the cache.
+
+        Parameters:
+            stale (List[str]): Ids of the vectors to delete.
+            fresh (Set[str]): Ids of the documents in self.data to embed and add.
+        """
+        documents = [(id_, doc) for id_, doc in zip(self.doc_ids, self.data) if id_ in fresh]
+        if not stale and not documents:
+            return
+        start = time.perf_counter()
+        if is_exact(self.index_params()):
+            if stale:
+                self.vectorstore.delete(stale)
+            if documents:
+                texts = [doc.page_content for _, doc in documents]
+                self.vectorstore.add_embeddings(
+                    list(zip(texts, self.embedder.embed_documents(texts))),
+                    metadatas=[doc.metadata for _, doc in documents],
+                    ids=[id_ for id_, _ in documents]
+                )
+        else:
+            self.vectorstore = self._build_vectorstore()
+            configure_search(self.vectorstore.index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+        self.fingerprint = self.index_fingerprint()
+        self._save_index()
+        # Positions in the vector store have changed
+        self._build_retrieval_index()
+        INDEX_BUILD_SECONDS.labels("update").observe(time.perf_counter() - start)
+        self.qa_chain.retriever = self._retriever()
+
+    def _save_index(self) -> None:
+        """Save the vector index with the fingerprint of its current inputs, if it is persisted."""
+        index_dir = self.index_dir
+        if index_dir is not None:
+            self.logger.info(f"Saving vector index to {index_dir}")
+            save_index(self.vectorstore, index_dir, self.fingerprint)
+
+    def publish(self, directory: Path) -> Snapshot:
+        """
+        Publish a snapshot of the loaded index for SharedDataSource workers to attach to.
+
+        Parameters:
+            directory (Path): The directory snapshots are published in.
+
+        Returns:
+            Snapshot: The published snapshot.
+        """
+        if self.vectorstore is None:
+            raise ValueError("Load the data before publishing it")
+        return publish_snapshot(
+            directory, self.vectorstore, self.retrieval_index, self.fingerprint, self.embedding_namespace,
+            self.normalize_L2
+        )
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query with the data source's embedding model."""
+        return self.query_embedder.embed_query(query)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """Embed a query with the data source's embedding model, without blocking the event loop."""
+        return await aembed_query(self.query_embedder, query)
+
+    def _get_chain(self, acts: Optional[Iterable[str]] = None) -> RetrievalQA:
+        """Return the QA chain for a query, restricted to the given Acts if the data source holds several."""
+        if acts is not None:
+            raise ValueError(f"{type(self).__name__} cannot restrict queries to a subset of Acts")
+        return self.qa_chain
+
+    def _subset_chain(self, acts: List[str]) -> RetrievalQA:
+        """Build a QA chain that only retrieves documents from the given Acts, sharing the LLM of the main chain."""
+        return RetrievalQA(
+            combine_documents_chain=self.qa_chain.combine_documents_chain,
+            retriever=self._retriever({'act': acts}),
+            callbacks=[StdOutCallbackHandler()],
+            return_source_documents=True
+        )
+
+    def get_answers_and_documents(self, query, acts: Optional[Iterable[str]] = None):
+        self.logger.info("Getting answers and documents")
+        return self._get_chain(acts)({"query": query})
+
+    def stream_answers_and_documents(
+            self,
+            query: str,
+            on_documents: Callable[[List[Document]], None],
+            on_token: Callable[[str], None],
+            acts: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Answer a query, reporting the source documents once they are retrieved and each token as it is generated.
+
+        Parameters:
+            query (str): The query.
+            on_documents (Callable): Called with the source documents before generation starts.
+            on_token (Callable): Called with each token of the answer.
+            acts (Iterable[str], optional): Identifiers of the Acts to search, if the data source holds several.
+
+        Returns:
+            Dict[str, Any]: The query, result and source documents, as returned by get_answers_and_documents.
+        """
+        self.logger.info("Streaming answers and documents")
+        chain = self._get_chain(acts)
+        documents = chain.retriever.get_relevant_documents(query)
+        on_documents(documents)
+        with LLM_SECONDS.time():
+            answer = chain.combine_documents_chain.run(
+                input_documents=documents, question=query, callbacks=[TokenCallbackHandler(on_token)]
+            )
+        return {"query": query, "result": answer, "source_documents": documents}
+
+    async def aget_answers_and_documents(self, query: str, acts: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Answer a query on the event loop, with async calls to the embedding model and the LLM.
+
+        Parameters:
+            query (str): The query.
+            acts (Iterable[str], optional): Identifiers of the Acts to search, if the data source holds several.
+
+        Returns:
+            Dict[str, Any]: The query, result and source documents, as returned by get_answers_and_documents.
+        """
         self.logger.info("Getting answers and documents")
-        return self.qa_chain({"query": query})
+        chain = self._get_chain(acts)
+        documents = await chain.retriever.aget_relevant_documents(query)
+        with LLM_SECONDS.time():
+            answer = await chain.combine_documents_chain.arun(input_documents=documents, question=query)
+        return {"query": query, "result": answer, "source_documents": documents}
+
+    async def astream_answers_and_documents(
+            self,
+            query: str,
+            on_documents: Callable[[List[Document]], Awaitable[None]],
+            on_token: Callable[[str], Awaitable[None]],
+            acts: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Answer a query on the event loop, reporting the source documents once they are retrieved and each token as it
+        is generated.
+
+        Cancelling the coroutine closes the requests to the embedding model and the LLM.
+
+        Parameters:
+            query (str): The query.
+            on_documents (Callable): Awaited with the source documents before generation starts.
+            on_token (Callable): Awaited with each token of the answer.
+            acts (Iterable[str], optional): Identifiers of the Acts to search, if the data source holds several.
+
+        Returns:
+            Dict[str, Any]: The query, result and source documents, as returned by get_answers_and_documents.
+        """
+        self.logger.info("Streaming answers and documents")
+        chain = self._get_chain(acts)
+        documents = await chain.retriever.aget_relevant_documents(query)
+        await on_documents(documents)
+        with LLM_SECONDS.time():
+            answer = await chain.combine_documents_chain.arun(
+                input_documents=documents, question=query, callbacks=[AsyncTokenCallbackHandler(on_token)]
+            )
+        return {"query": query, "result": answer, "source_documents": documents}
+
 
 class LegislationDataSource(DataSource):
-    def __init__(self, url: str):
-        super().__init__()
+    def __init__(self, url: str, **kwargs):
+        super().__init__(**kwargs)
         self.url = url
         self.parser = None
+        # Hashes of the source XML and of each indexed document, used to refresh incrementally
+        self.manifest = Manifest()
+
+    @property
+    def cache_path(self):
+        """File the parsed legislation is cached in."""
+        return DATA_DIR / (url_to_filename(self.url) + ".jsonl")
+
+    @property
+    def manifest_path(self):
+        """File the manifest of content hashes is saved in."""
+        return DATA_DIR / (url_to_filename(self.url) + ".manifest.json")
+
+    def index_name(self) -> Optional[str]:
+        return url_to_filename(self.url)
+
+    @property
+    def act(self) -> str:
+        """Identifier of the Act, recorded in the metadata of its documents."""
+        return act_id(self.url)
 
     def load_data(self, use_cache: bool = True):
         """Initialise loading of data."""
         self.logger.info(f"Loading legislation data from {self.url}")
-        if use_cache:
-            # Check if there is a file created from the url
-            filename = url_to_filename(self.url) + ".pkl"
-            full_path = DATA_DIR / filename
-            try:
-                self.logger.info(f"Attempting to load cached parser from {filename}")
-                with open(full_path, "rb") as f:
-                    self.parser = pickle.load(f)
-                self.logger.info("Loaded cached parser")
-            except FileNotFoundError:
-                self.logger.info("Cached parser not found, parsing XML")
-                use_cache = False
-        if not use_cache:
-            self.logger.info("Parsing XML from URL")
-            self.parser = UKLegislationParser(self.url, parse_sections=True)
-            self.logger.info("Saving parser to cache")
-            self.parser.save()
-        # Get documents from the parser
-        self.data = [
-            Document(
-                page_content=x['flattened_text'],
-                metadata={
-                    "title": x['title'],
-                    "section": x['number'],
-                    "source": x['DocumentURI']
-                }
-            ) for x in self.parser.get_section_dicts()]
-        self.post_data_load_setup()
\ No newline at end of file
+        if not (use_cache and self._load_cached()):
+            self._parse_legislation()
+        self._finish_loading()
+        self.post_data_load_setup()
+
+    def _load_cached(self) -> bool:
+        """
+        Load the parsed legislation from the cache, if it is there and usable.
+
+        Returns:
+            bool: True if the legislation was loaded, False if it needs parsing.
+        """
+        # Check if there is a file created from the url
+        full_path = self.cache_path
+        try:
+            self.logger.info(f"Attempting to load cached legislation from {full_path.name}")
+            self.parser = ParsedLegislation.load(full_path)
+            self.manifest = Manifest.load(self.manifest_path)
+            self.logger.info("Loaded cached legislation")
+            return True
+        except FileNotFoundError:
+            return self._migrate_pickled_parser(full_path)
+        except ValueError as e:
+            self.logger.info(f"Cached legislation is not usable ({e}), parsing XML")
+            return False
+
+    def _finish_loading(self) -> None:
+        """Build the documents from the parsed legislation and record their hashes."""
+        self.manifest.sections = self._build_documents()
+        self.manifest.save(self.manifest_path)
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        Re-ingest the legislation, updating only what changed since it was last loaded.
+
+        Sections whose source XML is unchanged are not parsed again, and only the vectors of added, changed or
+        removed sections are updated in the index.
+
+        Returns:
+            Dict[str, int]: The number of sections added, changed, removed and unchanged.
+        """
+        if self.vectorstore is None:
+            self.load_data(use_cache=False)
+            return {'added': len(self.data), 'changed': 0, 'removed': 0, 'unchanged': 0}
+
+        self.logger.info(f"Refreshing legislation data from {self.url}")
+        previous_manifest = self.manifest
+        self._parse_legislation(previous_source_hashes=previous_manifest.sources)
+        added, changed, removed = self._apply_refresh(previous_manifest)
+        # Replace changed vectors by deleting and re-adding them
+        self._update_vectors(changed + removed, set(added + changed))
+        summary = {
+            'added': len(added), 'changed': len(changed), 'removed': len(removed),
+            'unchanged': len(self.manifest.sections) - len(added) - len(changed)
+        }
+        self.logger.info(f"Refreshed legislation: {summary}")
+        return summary
+
+    def _apply_refresh(self, previous_manifest: Manifest):
+        """
+        Rebuild the documents after the legislation has been parsed again and record their new hashes.
+
+        Returns:
+            Tuple[List[str], List[str], List[str]]: The ids of the documents added, changed and removed.
+        """
+        hashes = self._build_documents()
+        added, changed, removed = previous_manifest.diff(hashes)
+        self.manifest.sections = hashes
+        self.manifest.save(self.manifest_path)
+        return added, changed, removed
+
+    def _parse_legislation(self, previous_source_hashes: Optional[Dict[str, str]] = None):
+        """Fetch and parse the legislation, then save it in the compact format and record the source hashes."""
+        self.logger.info("Parsing XML from URL")
+        self._set_parsed(ingest_legislation(self.url, self.cache_path, previous_source_hashes))
+
+    def _set_parsed(self, source_hashes: Dict[str, str]) -> None:
+        """Open the freshly saved legislation and record the hashes of its source XML."""
+        if isinstance(self.parser, ParsedLegislation):
+            self.parser.close()
+        self.manifest = Manifest(sources=source_hashes)
+        # Open the compact file so that the XML held by the parser is not kept in memory
+        self.parser = ParsedLegislation.load(self.cache_path)
+
+    def _build_documents(self) -> Dict[str, str]:
+        """
+        Build the documents of each section, with its DocumentURI as its vector store id.
+
+        With SUBSECTION_CHUNKS, a section with subsections has a document per chunk instead, labelled with its path in
+        the 'label' metadata, numbered in order in the 'chunk' metadata and identified by the URI of its subsection,
+        e.g. '.../section/60/2/a'. Parts without a label take the chunk number prefixed with '_' in their place.
+
+        Returns:
+            Dict[str, str]: The hash of each document, keyed by its vector store id.
+        """
+        self.data = []
+        self.doc_ids = []
+        for x in self.parser.get_section_dicts():
+            metadata = {
+                "title": x['title'],
+                "section": x['number'],
+                "source": x['DocumentURI'],
+                "act": self.act
+            }
+            uri = x['DocumentURI'] or f"{self.url}#{x['number']}"
+            chunks = chunk_section(
+                x['number'], x['title'], x['parsed_data'] or {}, CHUNK_MAX_TOKENS
+            ) if SUBSECTION_CHUNKS else []
+            if len(chunks) < 2:
+                self.data.append(Document(page_content=x['flattened_text'], metadata=metadata))
+                self.doc_ids.append(uri)
+                continue
+            for i, chunk in enumerate(chunks):
+                self.data.append(Document(
+                    page_content=chunk.text, metadata={**metadata, "label": chunk.label, "chunk": i}
+                ))
+                # Unlabelled parts, such as paragraphs without a number, are told apart by their chunk number
+                self.doc_ids.append("/".join((uri,) + tuple(part or f"_{i}" for part in chunk.path[1:])))
+        return {id_: document_hash(doc) for id_, doc in zip(self.doc_ids, self.data)}
+
+    def _migrate_pickled_parser(self, full_path) -> bool:
+        """
+        Convert a legacy pickled parser, if there is one, into the compact format.
+
+        Returns:
+            bool: True if the legislation was loaded from a legacy pickle, False if it needs parsing.
+        """
+        legacy_path = full_path.with_suffix(".pkl")
+        if not legacy_path.exists():
+            self.logger.info("Cached legislation not found, parsing XML")
+            return False
+        self.logger.info(f"Migrating legacy pickled parser {legacy_path.name}")
+        with open(legacy_path, "rb") as f:
+            parser = pickle.load(f)
+        save_parsed_legislation(parser, full_path)
+        self.parser = ParsedLegislation.load(full_path)
+        return True
+
+
+class CorpusDataSource(DataSource):
+    """
+    Data source for several Acts, held in one shared vector index.
+
+    Each Act is parsed in a worker process and every document records its Act in the 'act' metadata, so queries can
+    be restricted to a subset of the Acts.
+    """
+
+    def __init__(self, urls: Iterable[str], processes: int = INGEST_PROCESSES, **kwargs):
+        """
+        Parameters:
+            urls (Iterable[str]): The contents URLs of the Acts.
+            processes (int): Number of worker processes used to parse the Acts, 0 for one per CPU.
+        """
+        super().__init__(**kwargs)
+        self.processes = processes or os.cpu_count() or 1
+        self.acts: Dict[str, LegislationDataSource] = {}
+        for url in urls:
+            source = LegislationDataSource(
+                url, embedding_model=self.core_embedding_model, llm=self.llm, store=self._store
+            )
+            self.acts[source.act] = source
+        # Number of documents of each Act, used to size filtered searches
+        self.act_counts: Dict[str, int] = {}
+
+    def index_name(self) -> Optional[str]:
+        return "corpus"
+
+    @classmethod
+    def from_manifest(cls, path: Path, **kwargs) -> "CorpusDataSource":
+        """Create a corpus from a JSON list of Act URLs."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f), **kwargs)
+
+    def load_data(self, use_cache: bool = True):
+        """Load every Act, parsing those that are not cached in parallel, and build the shared index."""
+        self.logger.info(f"Loading {len(self.acts)} Acts")
+        to_parse = [source for source in self.acts.values() if not (use_cache and source._load_cached())]
+        self._ingest(to_parse)
+        for source in self.acts.values():
+            source._finish_loading()
+        self._merge_documents()
+        self.post_data_load_setup()
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        Re-ingest every Act, updating only the vectors of the sections that changed.
+
+        Returns:
+            Dict[str, int]: The number of sections added, changed, removed and unchanged across all Acts.
+        """
+        if self.vectorstore is None:
+            self.load_data(use_cache=False)
+            return {'added': len(self.data), 'changed': 0, 'removed': 0, 'unchanged': 0}
+
+        self.logger.info(f"Refreshing {len(self.acts)} Acts")
+        previous_manifests = {act: source.manifest for act, source in self.acts.items()}
+        self._ingest(list(self.acts.values()), previous_manifests)
+        added, changed, removed = [], [], []
+        for act, source in self.acts.items():
+            act_added, act_changed, act_removed = source._apply_refresh(previous_manifests[act])
+            added += act_added
+            changed += act_changed
+            removed += act_removed
+        self._merge_documents()
+        self._update_vectors(changed + removed, set(added + changed))
+        summary = {
+            'added': len(added), 'changed': len(changed), 'removed': len(removed),
+            'unchanged': len(self.data) - len(added) - len(changed)
+        }
+        self.logger.info(f"Refreshed corpus: {summary}")
+        return summary
+
+    def _ingest(self, sources: List[LegislationDataSource], previous_manifests: Dict[str, Manifest] = None) -> None:
+        """Parse the given Acts, in worker processes if there is more than one."""
+        if not sources:
+            return
+        previous_manifests = previous_manifests or {}
+        jobs = [
+            (source.url, source.cache_path, previous_manifests[source.act].sources if source.act in previous_manifests
+             else None)
+            for source in sources
+        ]
+        processes = min(self.processes, len(jobs))
+        if processes == 1:
+            results = [ingest_legislation(*job) for job in jobs]
+        else:
+            self.logger.info(f"Parsing {len(jobs)} Acts in {processes} processes")
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = list(pool.map(ingest_legislation, *zip(*jobs)))
+        for source, source_hashes in zip(sources, results):
+            source._set_parsed(source_hashes)
+
+    def _merge_documents(self) -> None:
+        """Gather the documents of every Act into the corpus."""
+        self.data = []
+        self.doc_ids = []
+        for act, source in self.acts.items():
+            self.data += source.data
+            self.doc_ids += source.doc_ids
+            self.act_counts[act] = len(source.data)
+
+    def _get_chain(self, acts: Optional[Iterable[str]] = None) -> RetrievalQA:
+        """
+        Return the QA chain for a query from all Acts, or from a subset of them.
+
+        Parameters:
+            acts (Iterable[str], optional): Identifiers of the Acts to search, e.g. 'ukpga/1977/37'. All Acts are
+                searched if not given.
+        """
+        if acts is None:
+            return self.qa_chain
+        acts = list(acts)
+        unknown = [act for act in acts if act not in self.acts]
+        if unknown:
+            raise ValueError(f"Unknown Acts: {unknown}")
+        self.logger.info(f"Restricting the query to {acts}")
+        return self._subset_chain(acts)
+
+
+class SharedDataSource(DataSource):
+    """
+    Read-only data source attached to a snapshot published by another process with DataSource.publish.
+
+    The FAISS index, documents and retrieval index of the snapshot are memory-mapped rather than loaded, so every
+    worker process attached to the same snapshot shares one copy of them, and attaching takes no parsing, embedding
+    or index building. Documents are read from the snapshot as they are retrieved - the vector store has no docstore
+    of its own.
+    """
+
+    def __init__(self, directory: Path, **kwargs):
+        """
+        Parameters:
+            directory (Path): The directory snapshots are published in.
+        """
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.snapshot: Optional[Snapshot] = None
+        # Identifiers of the Acts in the snapshot
+        self.acts: List[str] = []
+
+    def load_data(self):
+        """
+        Attach to the current snapshot.
+
+        Raises:
+            FileNotFoundError: If no snapshot has been published yet.
+            ValueError: If the snapshot was built with a different embedding model.
+        """
+        snapshot = current_snapshot(self.directory)
+        if snapshot is None:
+            raise FileNotFoundError(f"No index snapshot has been published in {self.directory}")
+        if snapshot.embeddings != self.embedding_namespace:
+            raise ValueError(
+                f"Index snapshot was built with {snapshot.embeddings} embeddings, not {self.embedding_namespace}"
+            )
+        self.logger.info(f"Attaching to index snapshot {snapshot.directory}")
+        start = time.perf_counter()
+        self._setup_embeddings()
+        index = open_index(snapshot)
+        configure_search(index, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH)
+        self.normalize_L2 = snapshot.normalize_L2
+        self.vectorstore = FAISS(
+            self.query_embedder.embed_query, index, InMemoryDocstore({}), {}, normalize_L2=self.normalize_L2
+        )
+        self.retrieval_index = open_retrieval_index(snapshot)
+        self.data = self.retrieval_index.documents
+        acts = self.retrieval_index.fields.get('act')
+        self.acts = [str(act) for act in acts.keys] if acts is not None else []
+        self.fingerprint = snapshot.fingerprint
+        self.snapshot = snapshot
+        INDEX_BUILD_SECONDS.labels("attach").observe(time.perf_counter() - start)
+        self._build_qa_chain()
+
+    def _get_chain(self, acts: Optional[Iterable[str]] = None) -> RetrievalQA:
+        """Return the QA chain for a query from all Acts, or from a subset of them."""
+        if acts is None:
+            return self.qa_chain
+        acts = list(acts)
+        unknown = [act for act in acts if act not in self.acts]
+        if unknown:
+            raise ValueError(f"Unknown Acts: {unknown}")
+        return self._subset_chain(acts)
@@ -0,0 +1,294 @@
+"""Concurrent embedding of documents at ingest, in token-sized batches within the provider's rate limits."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+import openai
+import requests
+from langchain.embeddings.base import Embeddings
+from langchain.embeddings.openai import OpenAIEmbeddings
+
+from common_logic.context import TokenCounter
+from common_logic.fetching import RETRY_STATUSES
+from common_logic.metrics import EMBEDDING_REQUESTS, EMBEDDING_TOKENS
+from config import logger
+
+
+def _openai_connection_errors() -> tuple:
+    """openai's connection and timeout errors, kept in openai.error before openai 1.0 and at the top level since."""
+    errors = getattr(openai, "error", None)
+    if errors is not None:
+        return errors.APIConnectionError, errors.Timeout
+    # Since 1.0, APITimeoutError is a subclass of APIConnectionError
+    connection_error = getattr(openai, "APIConnectionError", None)
+    return (connection_error,) if connection_error is not None else ()
+
+
+# Errors without an HTTP status that are worth retrying
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout) + _openai_connection_errors()
+
+
+class Budget:
+    """
+    Limit the amount of something, such as requests or tokens, used per period.
+
+    A token bucket that holds up to a period's allowance and refills continuously. Callers take what they need
+    up front, leaving the bucket in debt, and wait until the debt is repaid, so waiting callers are served in order.
+
+    Like the provider's, the bucket starts full. Requests reach the provider a little after they are counted here, so
+    a limit a little under the provider's keeps them from being throttled.
+    """
+
+    def __init__(self, limit: float, period: float = 60.0):
+        """
+        Parameters:
+            limit (float): Allowance per period. 0 disables limiting.
+            period (float): Length of the period in seconds.
+        """
+        self.limit = limit
+        self.rate = limit / period
+        self._level = limit
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take an amount from the budget.
+
+        Parameters:
+            amount (float): The amount, capped at the allowance of a period so that it can always be met.
+
+        Returns:
+            float: Seconds to wait before using it.
+        """
+        if not self.limit:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.limit, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= min(amount, self.limit)
+            return -self._level / self.rate if self._level < 0 else 0.0
+
+
+class ScheduleStats(NamedTuple):
+    """What embedding a set of texts took."""
+    texts: int
+    tokens: int
+    # Batches the texts were sent in, and the times batches were throttled or failed and sent again
+    batches: int
+    retries: int
+    seconds: float
+
+    @property
+    def texts_per_second(self) -> float:
+        return self.texts / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_minute(self) -> float:
+        return 60 * self.tokens / self.seconds if self.seconds else 0.0
+
+
+def retry_delay(error: Exception) -> Optional[float]:
+    """
+    Whether a failed embedding request is worth retrying, and how long the provider asked us to wait.
+
+    Parameters:
+        error (Exception): The error raised by the embedding model.
+
+    Returns:
+        Optional[float]: None if the request should not be retried, otherwise the seconds given by a Retry-After
+            header, or 0 if there was none.
+    """
+    # openai errors carry the status and headers themselves, requests errors on their response
+    response = getattr(error, "response", None)
+    status = getattr(error, "http_status", None) or getattr(response, "status_code", None)
+    if status not in RETRY_STATUSES and not isinstance(error, RETRY_ERRORS):
+        return None
+    headers = getattr(error, "headers", None) or getattr(response, "headers", None) or {}
+    retry_after = headers.get("Retry-After", headers.get("retry-after"))
+    try:
+        return max(0.0, float(retry_after)) if retry_after is not None else 0.0
+    except ValueError:
+        return 0.0
+
+
+def without_retries(embeddings: Embeddings) -> Embeddings:
+    """
+    The model with its own retries turned off, so that throttled requests are retried by the scheduler instead.
+
+    OpenAIEmbeddings retries throttled requests with exponential backoff, ignoring the provider's Retry-After.
+    """
+    if isinstance(embeddings, OpenAIEmbeddings):
+        return embeddings.copy(update={"max_retries": 1})
+    return embeddings
+
+
+class EmbeddingScheduler:
+    """
+    Embed many texts with a remote model, sending batches concurrently within requests and tokens per minute limits.
+
+    Texts are packed in order into batches of up to max_batch_tokens tokens and max_batch_size texts. Each batch
+    waits for its share of the budgets before it is sent, and throttled batches are sent again after the
+    provider's Retry-After, during which no other batch is sent either. Completed batches are handed to a callback,
+    so that they can be cached before the rest are done.
+    """
+
+    def __init__(
+            self,
+            embeddings: Embeddings,
+            token_counter: Optional[TokenCounter] = None,
+            max_batch_tokens: int = 50000,
+            max_batch_size: int = 1000,
+            max_concurrency: int = 4,
+            requests_per_minute: float = 0,
+            tokens_per_minute: float = 0,
+            max_retries: int = 6,
+            backoff_factor: float = 1.0,
+            period: float = 60.0
+    ):
+        """
+        Parameters:
+            embeddings (Embeddings): The model, without retries of its own.
+            token_counter (TokenCounter, optional): Counts the tokens of texts. Defaults to an uncached counter.
+            max_batch_tokens (int): Maximum tokens in a batch. A longer text is sent in a batch of its own.
+            max_batch_size (int): Maximum texts in a batch.
+            max_concurrency (int): Maximum batches in flight at once.
+            requests_per_minute (float): Request budget, 0 for no limit.
+            tokens_per_minute (float): Token budget, 0 for no limit.
+            max_retries (int): Times a throttled or failed batch is sent again before giving up.
+            backoff_factor (float): Base delay in seconds for exponential backoff, if the provider gives no
+                Retry-After.
+            period (float): Seconds the budgets are given for, a minute except in tests.
+        """
+        self.embeddings = embeddings
+        self.token_counter = token_counter if token_counter is not None else TokenCounter()
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests = Budget(requests_per_minute, period)
+        self.tokens = Budget(tokens_per_minute, period)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.last_stats: Optional[ScheduleStats] = None
+        self._paused_until = 0.0
+        self._retries = 0
+        self._lock = threading.Lock()
+
+    def batches(self, tokens: Sequence[int]) -> List[range]:
+        """
+        Pack texts, in order, into batches.
+
+        Parameters:
+            tokens (Sequence[int]): The number of tokens of each text.
+
+        Returns:
+            List[range]: The positions of the texts in each batch.
+        """
+        batches, start, total = [], 0, 0
+        for i, count in enumerate(tokens):
+            if i > start and (total + count > self.max_batch_tokens or i - start == self.max_batch_size):
+                batches.append(range(start, i))
+                start, total = i, 0
+            total += count
+        if start < len(tokens):
+            batches.append(range(start, len(tokens)))
+        return batches
+
+    def _pause(self, seconds: float) -> None:
+        """Hold back every batch for a while."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait(self, tokens: int) -> None:
+        """Block until a batch of the given tokens may be sent."""
+        delay = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if delay > 0:
+            time.sleep(delay)
+        # Including while another batch, throttled in the meantime, has paused sending
+        while True:
+            paused = self._paused_until - time.monotonic()
+            if paused <= 0:
+                return
+            time.sleep(paused)
+
+    def _embed_batch(self, texts: List[str], tokens: int) -> List[List[float]]:
+        """Embed a batch, retrying it while the provider throttles it."""
+        for attempt in range(self.max_retries + 1):
+            self._wait(tokens)
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                delay = retry_delay(e)
+                if delay is None or attempt == self.max_retries:
+                    EMBEDDING_REQUESTS.labels("failed").inc()
+                    raise
+                EMBEDDING_REQUESTS.labels("throttled").inc()
+                with self._lock:
+                    self._retries += 1
+                delay = delay or self.backoff_factor * (2 ** attempt)
+                logger.warning(f"Embedding batch of {len(texts)} texts failed ({e}), retrying in {delay:.2f}s")
+                self._pause(delay)
+                continue
+            EMBEDDING_REQUESTS.labels("embedded").inc()
+            EMBEDDING_TOKENS.inc(tokens)
+            return vectors
+
+    def embed(
+            self,
+            texts: List[str],
+            on_batch: Optional[Callable[[List[str], List[List[float]]], None]] = None
+    ) -> List[List[float]]:
+        """
+        Embed texts in concurrent batches.
+
+        If a batch fails for good, the error is raised once the batches in flight are done, and no more are sent.
+        Batches already handed to on_batch are not lost.
+
+        Parameters:
+            texts (List[str]): The texts.
+            on_batch (Callable[[List[str], List[List[float]]], None], optional): Called with the texts and vectors of
+                each batch as it completes, from the thread that embedded it.
+
+        Returns:
+            List[List[float]]: The vector of each text.
+        """
+        start = time.perf_counter()
+        counts = self.token_counter.count(texts)
+        batches = self.batches(counts)
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        self._retries = 0
+
+        # Set when a batch fails for good, after which no more are sent
+        failed = threading.Event()
+
+        def run(batch: range) -> None:
+            if failed.is_set():
+                return
+            batch_texts = texts[batch.start:batch.stop]
+            try:
+                batch_vectors = self._embed_batch(batch_texts, sum(counts[batch.start:batch.stop]))
+            except Exception:
+                failed.set()
+                raise
+            vectors[batch.start:batch.stop] = batch_vectors
+            if on_batch is not None:
+                on_batch(batch_texts, batch_vectors)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches) or 1)) as executor:
+            futures = [executor.submit(run, batch) for batch in batches]
+        for future in futures:
+            future.result()
+
+        stats = self.last_stats = ScheduleStats(
+            len(texts), sum(counts), len(batches), self._retries, time.perf_counter() - start
+        )
+        if texts:
+            logger.info(
+                f"Embedded {stats.texts} texts ({stats.tokens} tokens) in {stats.batches} batches and "
+                f"{stats.seconds:.1f}s - {stats.texts_per_second:.1f} texts/s, {stats.tokens_per_minute:.0f} "
+                f"tokens/min, {stats.retries} retries"
+            )
+        return vectors
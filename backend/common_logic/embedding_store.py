@@ -0,0 +1,268 @@
+"""Single-file SQLite store for cached embeddings."""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Sequence, Tuple, Union, cast
+
+import numpy as np
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.embeddings.base import Embeddings
+from langchain.schema import BaseStore
+from langchain.storage import LocalFileStore
+from langchain.storage.encoder_backed import EncoderBackedStore
+
+from common_logic.metrics import EMBEDDING_CACHE_HITS, EMBEDDING_CACHE_MISSES
+from config import logger
+
+if TYPE_CHECKING:
+    from common_logic.embedding_scheduler import EmbeddingScheduler
+
+# Maximum number of keys bound in one SQL statement, below SQLite's default variable limit
+BATCH_SIZE = 500
+# Stores that can back the embedding cache
+EMBEDDING_STORES = ("sqlite", "file")
+# UUID namespace of cache keys, the one CacheBackedEmbeddings uses, so that keys match those of from_bytes_store
+KEY_NAMESPACE_UUID = uuid.UUID(int=1985)
+
+
+def key_encoder(namespace: str) -> Callable[[str], str]:
+    """
+    Encode texts as cache keys: the namespace followed by a UUID of the SHA-1 hash of the text.
+
+    Keys are the same as CacheBackedEmbeddings.from_bytes_store's, so that embeddings cached in a LocalFileStore are
+    found under the same keys once migrated.
+    """
+    def encode(text: str) -> str:
+        return namespace + str(uuid.uuid5(KEY_NAMESPACE_UUID, hashlib.sha1(text.encode("utf-8")).hexdigest()))
+    return encode
+
+
+def serialize_vector(vector: Sequence[float]) -> bytes:
+    """Serialise an embedding as packed float32."""
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def deserialize_vector(data: bytes) -> List[float]:
+    """Deserialise an embedding packed as float32."""
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+
+class SQLiteByteStore(BaseStore[str, bytes]):
+    """
+    Byte store holding every key in one SQLite file, in place of LocalFileStore's file per key.
+
+    Reads and writes are batched into a few statements, so looking up thousands of embeddings costs a handful of
+    queries rather than one filesystem lookup each.
+    """
+
+    def __init__(self, path: Union[str, Path], table: str = "store"):
+        """
+        Open the store, creating it if needed.
+
+        Parameters:
+            path (str or Path): The SQLite file to store values in.
+            table (str): The table to store values in, so that one file can hold several stores.
+        """
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name {table!r}")
+        self.path = Path(path)
+        self.table = table
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID"
+            )
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """Get the values of the given keys, with None for missing keys."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), BATCH_SIZE):
+                batch = keys[start:start + BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+                found.update(rows)
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
+        """Set the values of the given keys in one transaction."""
+        with self._lock, self._conn:
+            self._conn.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)", key_value_pairs)
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        """Delete the given keys."""
+        with self._lock, self._conn:
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in keys])
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
+        """Iterate over the keys that start with the given prefix."""
+        with self._lock:
+            if prefix:
+                rows = self._conn.execute(
+                    f"SELECT key FROM {self.table} WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(f"SELECT key FROM {self.table}").fetchall()
+        for row in rows:
+            yield row[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_file_store(source_dir: Union[str, Path], store: SQLiteByteStore, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Copy the embeddings cached by a LocalFileStore into a SQLite store, converting them from JSON to float32.
+
+    Keys are copied unchanged, so embeddings cached under a namespace are found under the same namespace.
+
+    Parameters:
+        source_dir (str or Path): The cache directory of the LocalFileStore.
+        store (SQLiteByteStore): The store to copy into.
+        batch_size (int): Number of embeddings read and written at a time.
+
+    Returns:
+        int: The number of embeddings copied.
+    """
+    file_store = LocalFileStore(source_dir)
+    copied = 0
+    keys = list(file_store.yield_keys())
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        pairs = [
+            (key, serialize_vector(json.loads(value)))
+            for key, value in zip(batch, file_store.mget(batch)) if value is not None
+        ]
+        store.mset(pairs)
+        copied += len(pairs)
+    return copied
+
+
+def open_embedding_store(data_dir: Path, kind: str = "sqlite") -> BaseStore[str, bytes]:
+    """
+    Open the byte store used to cache embeddings.
+
+    The SQLite store is created from the legacy 'embeddings_cache' directory the first time it is opened, after
+    which the directory is renamed to 'embeddings_cache.migrated' and can be deleted.
+
+    Parameters:
+        data_dir (Path): The data directory.
+        kind (str): 'sqlite' for a single-file SQLite store or 'file' for LocalFileStore's file per embedding.
+
+    Returns:
+        BaseStore[str, bytes]: The store.
+    """
+    if kind not in EMBEDDING_STORES:
+        raise ValueError(f"Unknown embedding store '{kind}', expected one of {EMBEDDING_STORES}")
+    legacy_dir = data_dir / "embeddings_cache"
+    if kind == "file":
+        return LocalFileStore(legacy_dir)
+    store = SQLiteByteStore(data_dir / "embeddings.sqlite3")
+    if legacy_dir.is_dir():
+        logger.info(f"Migrating cached embeddings from {legacy_dir}")
+        copied = migrate_file_store(legacy_dir, store)
+        legacy_dir.rename(legacy_dir.with_name(legacy_dir.name + ".migrated"))
+        logger.info(f"Migrated {copied} cached embeddings")
+    return store
+
+
+def open_token_count_store(store: BaseStore[str, bytes]) -> Optional[SQLiteByteStore]:
+    """
+    Open the store token counts are cached in beside an embedding store.
+
+    Counts are kept in a table of their own in the SQLite file of the embeddings, so the embedding cache holds only
+    vectors. Counts that earlier versions cached among the embeddings, under 'tokens:' keys, are removed.
+
+    Parameters:
+        store (BaseStore[str, bytes]): The embedding store.
+
+    Returns:
+        Optional[SQLiteByteStore]: The store, or None if the embedding store is not a SQLiteByteStore, in which case
+            counts are not cached.
+    """
+    if not isinstance(store, SQLiteByteStore):
+        return None
+    store.mdelete(list(store.yield_keys(prefix="tokens:")))
+    return SQLiteByteStore(store.path, table="token_counts")
+
+
+class CountingCacheBackedEmbeddings(CacheBackedEmbeddings):
+    """
+    CacheBackedEmbeddings that counts the texts found in the cache and those that had to be embedded.
+
+    With a scheduler, texts that are not cached are embedded by it in concurrent batches, and each batch is cached as
+    soon as it is embedded, so that an ingest that fails part way resumes from the batches already done.
+    """
+
+    def __init__(
+            self,
+            underlying_embeddings: Embeddings,
+            document_embedding_store: BaseStore[str, List[float]],
+            scheduler: Optional["EmbeddingScheduler"] = None
+    ):
+        super().__init__(underlying_embeddings, document_embedding_store)
+        self.scheduler = scheduler
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.document_embedding_store.mget(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        EMBEDDING_CACHE_HITS.inc(len(texts) - len(missing))
+        if missing:
+            EMBEDDING_CACHE_MISSES.inc(len(missing))
+            missing_texts = [texts[i] for i in missing]
+            if self.scheduler is not None:
+                missing_vectors = self.scheduler.embed(
+                    missing_texts, on_batch=lambda batch, batch_vectors: self.document_embedding_store.mset(
+                        list(zip(batch, batch_vectors))
+                    )
+                )
+            else:
+                missing_vectors = self.underlying_embeddings.embed_documents(missing_texts)
+                self.document_embedding_store.mset(list(zip(missing_texts, missing_vectors)))
+            for i, vector in zip(missing, missing_vectors):
+                vectors[i] = vector
+        return cast(List[List[float]], vectors)
+
+
+def cache_backed_embeddings(
+        embeddings: Embeddings,
+        store: BaseStore[str, bytes],
+        namespace: str = "",
+        scheduler: Optional["EmbeddingScheduler"] = None
+) -> CacheBackedEmbeddings:
+    """
+    Wrap an embedding model in a cache over a byte store.
+
+    Keys are encoded as in CacheBackedEmbeddings.from_bytes_store. Values in a SQLiteByteStore are packed float32,
+    and JSON in any other store so that a LocalFileStore stays readable by from_bytes_store.
+
+    Parameters:
+        embeddings (Embeddings): The embedding model.
+        store (BaseStore[str, bytes]): The byte store to cache embeddings in.
+        namespace (str): Prefix of the cache keys, normally the name of the model.
+        scheduler (EmbeddingScheduler, optional): Embeds the documents that are not cached, in place of the model.
+    """
+    if not isinstance(store, SQLiteByteStore):
+        cached = CacheBackedEmbeddings.from_bytes_store(embeddings, store, namespace=namespace)
+        return CountingCacheBackedEmbeddings(embeddings, cached.document_embedding_store, scheduler)
+    return CountingCacheBackedEmbeddings(
+        embeddings,
+        EncoderBackedStore[str, List[float]](
+            store, key_encoder(namespace), serialize_vector, deserialize_vector
+        ),
+        scheduler
+    )
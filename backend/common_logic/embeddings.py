@@ -0,0 +1,112 @@
+"""Embedding providers - OpenAI's API, or hashed word counts computed locally."""
+
+import zlib
+from typing import Dict, List
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.embeddings.openai import OpenAIEmbeddings
+
+from common_logic.retrieval import tokenize
+
+# Providers that can embed documents and queries
+EMBEDDING_PROVIDERS = ("openai", "hashing")
+# Version of the hashing scheme, part of the model name so that cached vectors are not reused if it changes
+HASHING_VERSION = 1
+# Features whose bucket is remembered, beyond which the memo is cleared
+MAX_MEMO_FEATURES = 1 << 20
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings computed on the CPU from the words of a text, without a model or any API calls.
+
+    Each word and pair of consecutive words, without stopwords, is hashed to one of `dimensions` buckets with a
+    random sign, counts are damped to 1 + log(count) and the vector is normalised to unit length. Texts that share
+    words and phrases get similar vectors, which is enough to run and test ingestion and retrieval offline.
+
+    A text's vector depends on nothing but the text, so vectors can be cached per text like those of a remote model.
+    Learned weights, such as IDF or an SVD of the corpus, would change every vector whenever the corpus changed.
+    """
+
+    def __init__(self, dimensions: int = 1024):
+        """
+        Parameters:
+            dimensions (int): Size of the vectors.
+        """
+        self.dimensions = dimensions
+        self.model = f"hashing-v{HASHING_VERSION}-{dimensions}"
+        self._buckets: Dict[str, int] = {}
+
+    def _bucket(self, feature: str) -> int:
+        """The bucket of a feature, plus `dimensions` if it is counted negatively."""
+        bucket = self._buckets.get(feature)
+        if bucket is None:
+            if len(self._buckets) >= MAX_MEMO_FEATURES:
+                self._buckets = {}
+            # crc32 rather than hash(), which differs between processes
+            value = zlib.crc32(feature.encode())
+            bucket = self._buckets[feature] = value % self.dimensions + (self.dimensions if value >> 31 else 0)
+        return bucket
+
+    def _features(self, text: str) -> List[int]:
+        words = tokenize(text)
+        bucket = self._bucket
+        return [bucket(word) for word in words] + [bucket(f"{a} {b}") for a, b in zip(words, words[1:])]
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts as the rows of an array.
+
+        Parameters:
+            texts (List[str]): The texts.
+
+        Returns:
+            np.ndarray: A float32 array with a unit vector per text, or a zero vector for a text without words.
+        """
+        features = [self._features(text) for text in texts]
+        lengths = np.fromiter((len(row) for row in features), dtype=np.int64, count=len(texts))
+        buckets = np.fromiter((bucket for row in features for bucket in row), dtype=np.int64, count=lengths.sum())
+        # Count every (text, bucket, sign) in a single bincount over all the texts
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        negative = buckets >= self.dimensions
+        counts = np.bincount(
+            rows * self.dimensions + buckets % self.dimensions,
+            weights=np.where(negative, -1.0, 1.0),
+            minlength=len(texts) * self.dimensions
+        ).reshape(len(texts), self.dimensions)
+        vectors = (np.sign(counts) * np.log1p(np.abs(counts))).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist() if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Embedding takes microseconds, less than handing the texts to a worker thread
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
+
+
+def create_embeddings(provider: str = "openai", dimensions: int = 1024) -> Embeddings:
+    """
+    Create the embedding model of a provider.
+
+    Parameters:
+        provider (str): 'openai' for OpenAI's API, or 'hashing' for HashingEmbeddings computed locally.
+        dimensions (int): Size of the vectors of the hashing provider.
+
+    Returns:
+        Embeddings: The model. Its 'model' attribute names it, and namespaces its vectors in the embedding cache.
+    """
+    if provider not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown embedding provider '{provider}', expected one of {EMBEDDING_PROVIDERS}")
+    if provider == "hashing":
+        return HashingEmbeddings(dimensions)
+    # Use the OpenAIEmbeddings model - means it's easier to host remotely as we don't need a GPU
+    return OpenAIEmbeddings()
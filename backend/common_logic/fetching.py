@@ -0,0 +1,169 @@
+"""Concurrent, connection-pooled fetching of legislation XML."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common_logic.http_cache import HTTPCache
+from common_logic.metrics import FETCHES, FETCH_SECONDS
+from common_logic.utils import data_xml_url
+from config import logger
+
+# HTTP status codes that are worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Limit the rate of requests made to each host."""
+
+    def __init__(self, requests_per_second: Optional[float] = None):
+        """
+        Initialise the rate limiter.
+
+        Parameters:
+            requests_per_second (float): Maximum requests per second per host. None or 0 disables limiting.
+        """
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        """Block until a request to the host of the given URL is allowed."""
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SectionFetcher:
+    """Fetch legislation XML documents over a shared, pooled HTTP session."""
+
+    def __init__(
+            self,
+            max_workers: int = 8,
+            requests_per_second: Optional[float] = None,
+            max_retries: int = 3,
+            backoff_factor: float = 0.5,
+            timeout: float = 30,
+            session: Optional[requests.Session] = None,
+            cache: Optional[HTTPCache] = None
+    ):
+        """
+        Initialise the fetcher.
+
+        Parameters:
+            max_workers (int): Maximum number of concurrent requests.
+            requests_per_second (float): Per-host rate limit. None or 0 disables limiting.
+            max_retries (int): Number of retries for failed or throttled requests.
+            backoff_factor (float): Base delay in seconds for exponential backoff between retries.
+            timeout (float): Timeout in seconds for each request.
+            session (requests.Session): Optional session to use instead of creating a pooled one.
+            cache (HTTPCache): Optional HTTP cache used to revalidate previously fetched XML with conditional GETs.
+        """
+        self.max_workers = max(1, max_workers)
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.cache = cache
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Return the delay before the next attempt, honouring any Retry-After header."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        return self.backoff_factor * (2 ** attempt)
+
+    def fetch(self, base_url: str) -> Union[bytes, None]:
+        """
+        Fetch the raw XML for a single resource, retrying with backoff.
+
+        Parameters:
+            base_url (str): The base URL of the resource.
+
+        Returns:
+            bytes: The raw XML content if successful, None otherwise.
+        """
+        start = time.perf_counter()
+        content, outcome = self._fetch(data_xml_url(base_url))
+        FETCH_SECONDS.observe(time.perf_counter() - start)
+        FETCHES.labels(outcome).inc()
+        return content
+
+    def _fetch(self, full_url: str, conditional: bool = True) -> Tuple[Optional[bytes], str]:
+        """
+        Fetch a URL, returning its content, or None, and whether it was downloaded, not_modified or failed.
+
+        With a cache, requests are conditional on the cached validators unless conditional is False.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait(full_url)
+            response = None
+            headers = self.cache.request_headers(full_url) if self.cache is not None and conditional else {}
+            try:
+                response = self.session.get(full_url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                logger.warning(f"Error fetching {full_url} (attempt {attempt + 1}): {e}")
+            else:
+                if self.cache is not None:
+                    content = self.cache.resolve(
+                        full_url, response.status_code, response.content, response.headers
+                    )
+                    if content is not None:
+                        return content, "not_modified" if response.status_code == 304 else "downloaded"
+                    if response.status_code == 304 and conditional:
+                        # Evicted by another writer after its validators were sent, so fetch it again in full
+                        return self._fetch(full_url, conditional=False)
+                elif response.status_code == 200:
+                    return response.content, "downloaded"
+                if response.status_code not in RETRY_STATUSES:
+                    logger.warning(f"Failed to fetch {full_url}. Status code: {response.status_code}")
+                    return None, "failed"
+                logger.warning(
+                    f"Retryable status {response.status_code} fetching {full_url} (attempt {attempt + 1})"
+                )
+            if attempt < self.max_retries:
+                time.sleep(self._backoff(attempt, response))
+        logger.error(f"Giving up on {full_url} after {self.max_retries + 1} attempts")
+        return None, "failed"
+
+    def fetch_all(self, base_urls: Iterable[str]) -> List[Union[bytes, None]]:
+        """
+        Fetch many resources concurrently.
+
+        Parameters:
+            base_urls (Iterable[str]): The base URLs of the resources.
+
+        Returns:
+            List[Union[bytes, None]]: The raw XML content for each URL, in the same order as the input.
+        """
+        base_urls = list(base_urls)
+        if self.max_workers == 1:
+            return [self.fetch(url) for url in base_urls]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.fetch, base_urls))
+
+    def close(self) -> None:
+        """Close the underlying session."""
+        self.session.close()
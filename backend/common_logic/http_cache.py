@@ -0,0 +1,153 @@
+"""Persistent HTTP cache with conditional-GET revalidation for legislation XML."""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Union
+
+from config import logger
+
+
+class CacheEntry(NamedTuple):
+    """A cached response body with its validators."""
+    content: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+    def validators(self) -> Dict[str, str]:
+        """Return the conditional request headers used to revalidate this entry."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HTTPCache:
+    """
+    Disk-backed cache of raw response bodies keyed by URL, with LRU eviction above a size cap.
+
+    Entries are stored in a single SQLite file so the cache is safe to share between threads and processes.
+    """
+
+    def __init__(self, path: Union[str, Path], max_bytes: int = 512 * 1024 * 1024):
+        """
+        Initialise the cache.
+
+        Parameters:
+            path (str or Path): The SQLite file to store the cache in.
+            max_bytes (int): Maximum total size of cached bodies before least recently used entries are evicted.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = {'not_modified': 0, 'downloaded': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    url TEXT PRIMARY KEY,
+                    content BLOB NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """Return the cached entry for the URL, or None if it is not cached."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, etag, last_modified FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(bytes(row[0]), row[1], row[2])
+
+    def put(self, url: str, content: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Store a response body and its validators, evicting old entries if the cache is over its size cap."""
+        if len(content) > self.max_bytes:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (url, content, etag, last_modified, size, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, sqlite3.Binary(content), etag, last_modified, len(content), time.time())
+            )
+            self._evict()
+
+    def touch(self, url: str) -> None:
+        """Mark an entry as recently used."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE url = ?", (time.time(), url))
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache fits its size cap. Caller holds the lock."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT url, size FROM entries ORDER BY accessed").fetchall()
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+            total -= size
+            self.stats['evictions'] += 1
+
+    def total_bytes(self) -> int:
+        """Return the total size of cached bodies."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def request_headers(self, url: str) -> Dict[str, str]:
+        """Return the conditional request headers for the URL, if it is cached."""
+        with self._lock:
+            row = self._conn.execute("SELECT etag, last_modified FROM entries WHERE url = ?", (url,)).fetchone()
+        return CacheEntry(b"", *row).validators() if row is not None else {}
+
+    def resolve(self, url: str, status_code: int, content: bytes, headers) -> Optional[bytes]:
+        """
+        Resolve a response to a (possibly conditional) request against the cache.
+
+        Parameters:
+            url (str): The requested URL.
+            status_code (int): The response status code.
+            content (bytes): The response body.
+            headers (Mapping): The response headers.
+
+        Returns:
+            bytes: The body to use - the cached body for a 304, the new body for a 200, otherwise None.
+        """
+        if status_code == 304:
+            entry = self.get(url)
+            if entry is not None:
+                self.touch(url)
+                self._count('not_modified')
+                return entry.content
+            logger.warning(f"Received 304 for {url} but it is not cached")
+            return None
+        if status_code == 200:
+            self._count('downloaded')
+            etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+            # Without validators the entry could never be revalidated, so there is no point keeping it
+            if etag or last_modified:
+                self.put(url, content, etag, last_modified)
+            return content
+        return None
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        self._conn.close()
@@ -0,0 +1,108 @@
+"""Persisted FAISS indexes, keyed by a fingerprint of everything they were built from."""
+
+import json
+import pickle
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import faiss
+from langchain.embeddings.base import Embeddings
+from langchain.schema.document import Document
+from langchain.vectorstores import FAISS
+
+from common_logic.manifest import document_hash
+from config import logger
+
+# Bump when the layout of a saved index changes, so old indexes are rebuilt
+INDEX_FORMAT_VERSION = 1
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.pkl"
+FINGERPRINT_FILE = "fingerprint.json"
+
+
+def index_fingerprint(
+        ids: List[str], documents: List[Document], embedding_namespace: str, params: Dict[str, Any]
+) -> str:
+    """
+    Fingerprint the inputs of a vector index.
+
+    Parameters:
+        ids (List[str]): The vector store id of each document.
+        documents (List[Document]): The indexed documents.
+        embedding_namespace (str): Name of the embedding model.
+        params (Dict[str, Any]): Parameters of the index, such as its type.
+
+    Returns:
+        str: A hash that changes whenever the documents, their order, the model or the index parameters change.
+    """
+    return document_hash(Document(
+        page_content=json.dumps([[id_, document_hash(doc)] for id_, doc in zip(ids, documents)]),
+        metadata={'version': INDEX_FORMAT_VERSION, 'embeddings': embedding_namespace, 'params': params}
+    ))
+
+
+def read_fingerprint(directory: Path) -> Optional[str]:
+    """Return the fingerprint of the index saved in a directory, or None if there is no complete index."""
+    try:
+        with open(directory / FINGERPRINT_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)['fingerprint']
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+
+def save_index(vectorstore: FAISS, directory: Path, fingerprint: str) -> None:
+    """
+    Save a FAISS vector store with its fingerprint.
+
+    The fingerprint is written last, so an interrupted save leaves no index that would be loaded.
+
+    Parameters:
+        vectorstore (FAISS): The vector store to save.
+        directory (Path): The directory to save it in.
+        fingerprint (str): The fingerprint of the inputs of the index.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / FINGERPRINT_FILE).unlink(missing_ok=True)
+    # Write to temporary files so that an index memory-mapped by another process is never overwritten in place
+    index_tmp = directory / (INDEX_FILE + ".tmp")
+    faiss.write_index(vectorstore.index, str(index_tmp))
+    index_tmp.replace(directory / INDEX_FILE)
+    docstore_tmp = directory / (DOCSTORE_FILE + ".tmp")
+    with open(docstore_tmp, 'wb') as f:
+        pickle.dump((vectorstore.docstore, vectorstore.index_to_docstore_id), f, protocol=pickle.HIGHEST_PROTOCOL)
+    docstore_tmp.replace(directory / DOCSTORE_FILE)
+    fingerprint_tmp = directory / (FINGERPRINT_FILE + ".tmp")
+    with open(fingerprint_tmp, 'w', encoding='utf-8') as f:
+        json.dump({'fingerprint': fingerprint, 'ntotal': vectorstore.index.ntotal}, f)
+    fingerprint_tmp.replace(directory / FINGERPRINT_FILE)
+
+
+def load_index(directory: Path, fingerprint: str, embeddings: Embeddings, **kwargs) -> Optional[FAISS]:
+    """
+    Load a saved FAISS vector store if it was built from the same inputs.
+
+    The index is memory-mapped where the index type supports it, so its vectors are paged in on demand rather than
+    read at startup.
+
+    Parameters:
+        directory (Path): The directory the index was saved in.
+        fingerprint (str): The fingerprint of the current inputs.
+        embeddings (Embeddings): The embedding model used to embed queries.
+        **kwargs: Further arguments for the FAISS vector store.
+
+    Returns:
+        Optional[FAISS]: The vector store, or None if there is no saved index with a matching fingerprint.
+    """
+    saved = read_fingerprint(directory)
+    if saved != fingerprint:
+        if saved is not None:
+            logger.info(f"Saved index in {directory} is out of date, it will be rebuilt")
+        return None
+    try:
+        index = faiss.read_index(str(directory / INDEX_FILE), faiss.IO_FLAG_MMAP)
+    except RuntimeError:
+        index = faiss.read_index(str(directory / INDEX_FILE))
+    with open(directory / DOCSTORE_FILE, 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings.embed_query, index, docstore, index_to_docstore_id, **kwargs)
@@ -0,0 +1,138 @@
+"""Streaming lxml engine for parsing section XML, equivalent to parse_recursive on a BeautifulSoup tree."""
+
+from io import BytesIO
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from lxml import etree
+
+# Elements whose full text content is needed, so their descendants must not be cleared while inside them
+TEXT_ELEMENTS = {"Text", "Pnumber", "Title"}
+
+
+def _local_name(tag) -> Optional[str]:
+    """Return the local name of an element tag, or None for comments and processing instructions."""
+    if not isinstance(tag, str):
+        return None
+    return tag.rsplit('}', 1)[-1]
+
+
+def _provision_depth(name: str, suffix: str = "") -> int:
+    """Return n for an element named 'P{n}{suffix}', or 0 if the name does not match."""
+    if not name.startswith("P") or not name.endswith(suffix):
+        return 0
+    digits = name[1:len(name) - len(suffix)]
+    return int(digits) if digits.isdigit() else 0
+
+
+def _walk(content: bytes) -> Iterator[Tuple]:
+    """
+    Stream through the XML, yielding the parsed provisions as they complete.
+
+    Yields:
+        ('title', text) for each 'P1group > Title' and ('P1', attributes, group_title, data) for each P1 that is
+        not nested inside another P1, where group_title is the title of its parent P1group, if any.
+    """
+    # One frame per open element: [kind, local name, depth n, data, group title]
+    # kind is 'P' for a P{n} provision, 'para' for the P{n}para it owns and 'other' for everything else
+    frames: List[list] = []
+    capturing = 0
+    open_p1 = 0
+
+    for event, element in etree.iterparse(
+            BytesIO(content), events=("start", "end"), remove_comments=True, recover=True
+    ):
+        name = _local_name(element.tag)
+        if event == "start":
+            parent = frames[-1] if frames else None
+            n = _provision_depth(name)
+            if n:
+                frames.append(["P", name, n, {'text': []}, None])
+                if n == 1:
+                    open_p1 += 1
+            elif parent is not None and parent[0] == "P" and _provision_depth(name, "para") == parent[2]:
+                frames.append(["para", name, parent[2], None, None])
+            else:
+                frames.append(["other", name, 0, None, None])
+            if name in TEXT_ELEMENTS:
+                capturing += 1
+            continue
+
+        kind, _, n, data, _ = frames.pop()
+        parent = frames[-1] if frames else None
+        if name in TEXT_ELEMENTS:
+            capturing -= 1
+        if parent is not None:
+            if name == "Pnumber" and parent[0] == "P":
+                parent[3]['label'] = ''.join(element.itertext()).strip()
+            elif name == "Title" and parent[1] == "P1group":
+                parent[4] = ''.join(element.itertext()).strip()
+                yield 'title', parent[4]
+            elif parent[0] == "para":
+                # The data of the P{n} element that owns this P{n}para
+                owner_data = frames[-2][3]
+                if name == "Text":
+                    owner_data['text'].append(' '.join(''.join(element.itertext()).strip().split()))
+                elif kind == "P" and n == parent[2] + 1:
+                    owner_data['text'].append(data)
+        if kind == "P" and n == 1:
+            open_p1 -= 1
+            if not open_p1:
+                group_title = parent[4] if parent is not None and parent[1] == "P1group" else None
+                yield 'P1', dict(element.attrib), group_title, data
+
+        if not capturing:
+            element.clear()
+            # Drop references to earlier siblings that have already been consumed
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def parse_section(content: Union[bytes, None]) -> Tuple[Optional[str], Dict]:
+    """
+    Parse the title and provisions of a section from its raw XML using a streaming lxml iterparse.
+
+    The result is identical to taking the first 'P1group > Title' as the title and running parse_recursive on the
+    first P1 element of a BeautifulSoup tree. Elements are cleared as soon as they have been consumed.
+
+    Parameters:
+        content (bytes): The raw section XML, or None if the fetch failed.
+
+    Returns:
+        Tuple[Optional[str], Dict]: The section title (or None) and the parsed provision data.
+    """
+    if content is None:
+        return None, {}
+
+    title = None
+    root = None
+    for event in _walk(content):
+        if event[0] == 'title':
+            if title is None:
+                title = event[1]
+        elif root is None:
+            root = event[3]
+        if root is not None and title is not None:
+            break
+    return title, root if root is not None else {}
+
+
+def parse_body_sections(content: Union[bytes, None]) -> Dict[str, Dict]:
+    """
+    Parse every section of a whole-Act document in a single streaming pass.
+
+    Parameters:
+        content (bytes): The raw XML of the whole Act, or None if the fetch failed.
+
+    Returns:
+        Dict[str, Dict]: The 'title' and 'parsed_data' of each top-level P1, keyed by its DocumentURI.
+    """
+    sections = {}
+    if content is None:
+        return sections
+    for event in _walk(content):
+        if event[0] == 'P1':
+            _, attributes, group_title, data = event
+            uri = attributes.get('DocumentURI')
+            if uri is not None and uri not in sections:
+                sections[uri] = {'title': group_title, 'parsed_data': data}
+    return sections
@@ -0,0 +1,67 @@
+"""Manifest of content hashes used to re-ingest legislation incrementally."""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+from langchain.schema.document import Document
+
+from common_logic.utils import content_hash
+
+MANIFEST_VERSION = 1
+
+
+def document_hash(document: Document) -> str:
+    """Return a hash of everything about a document that ends up in the vector index."""
+    return content_hash(
+        json.dumps([document.page_content, document.metadata], sort_keys=True, ensure_ascii=False)
+    )
+
+
+class Manifest:
+    """
+    Record of what has been ingested for a data source.
+
+    Attributes:
+        sources (Dict[str, str]): Hash of the raw XML of each fetched document, keyed by normalised URI.
+        sections (Dict[str, str]): Hash of each indexed document, keyed by its vector store id.
+    """
+
+    def __init__(self, sources: Dict[str, str] = None, sections: Dict[str, str] = None):
+        self.sources = sources or {}
+        self.sections = sections or {}
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "Manifest":
+        """Load a manifest, returning an empty one if the file is missing or from another version."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        if data.get('version') != MANIFEST_VERSION:
+            return cls()
+        return cls(data['sources'], data['sections'])
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Save the manifest as JSON."""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'sources': self.sources, 'sections': self.sections}, f)
+        tmp_path.replace(path)
+
+    def diff(self, sections: Dict[str, str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Compare the recorded section hashes with a new set.
+
+        Parameters:
+            sections (Dict[str, str]): The new section hashes, keyed by vector store id.
+
+        Returns:
+            Tuple[List[str], List[str], List[str]]: The ids that were added, changed and removed.
+        """
+        added = [id_ for id_ in sections if id_ not in self.sections]
+        changed = [id_ for id_, hash_ in sections.items() if id_ in self.sections and self.sections[id_] != hash_]
+        removed = [id_ for id_ in self.sections if id_ not in sections]
+        return added, changed, removed
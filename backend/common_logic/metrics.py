@@ -0,0 +1,103 @@
+"""
+Prometheus metrics of the query and ingestion pipelines.
+
+Metrics live in the default registry. When several processes serve or ingest - API workers, or the processes Acts
+are parsed in - set PROMETHEUS_MULTIPROC_DIR to a directory shared by them before they start, and render_metrics
+aggregates every process's metrics.
+"""
+
+import os
+from typing import Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Buckets from a millisecond to a minute, to cover both index lookups and LLM calls
+QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PARSE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0)
+BUILD_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+TOKEN_BUCKETS = (0, 100, 250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 16000)
+
+QUERY_STAGE_SECONDS = Histogram(
+    "query_stage_seconds",
+    "Seconds spent in each stage of answering a query - receive (from the message arriving to the query being "
+    "dispatched), embed, retrieve, llm (including forwarding streamed tokens), post_process and send",
+    ["stage"], buckets=QUERY_BUCKETS
+)
+RECEIVE_SECONDS = QUERY_STAGE_SECONDS.labels("receive")
+EMBED_SECONDS = QUERY_STAGE_SECONDS.labels("embed")
+RETRIEVE_SECONDS = QUERY_STAGE_SECONDS.labels("retrieve")
+LLM_SECONDS = QUERY_STAGE_SECONDS.labels("llm")
+POST_PROCESS_SECONDS = QUERY_STAGE_SECONDS.labels("post_process")
+SEND_SECONDS = QUERY_STAGE_SECONDS.labels("send")
+
+QUERIES_IN_FLIGHT = Gauge(
+    "queries_in_flight", "Queries being answered, including those waiting for a slot", multiprocess_mode="livesum"
+)
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "executor_queue_depth", "Jobs submitted to the API's thread pool that have not started", multiprocess_mode="livesum"
+)
+
+CONTEXT_TOKENS = Histogram(
+    "context_tokens", "Tokens of the retrieved documents passed to the LLM with each query", buckets=TOKEN_BUCKETS
+)
+CONTEXT_TOKENS_SAVED = Histogram(
+    "context_tokens_saved",
+    "Tokens of retrieved documents left out of the context of each query, as duplicates or over the token budget",
+    buckets=TOKEN_BUCKETS
+)
+
+EMBEDDING_CACHE_REQUESTS = Counter(
+    "embedding_cache_requests", "Texts looked up in the embedding cache, by whether they were cached", ["result"]
+)
+EMBEDDING_CACHE_HITS = EMBEDDING_CACHE_REQUESTS.labels("hit")
+EMBEDDING_CACHE_MISSES = EMBEDDING_CACHE_REQUESTS.labels("miss")
+EMBEDDING_REQUESTS = Counter(
+    "embedding_requests",
+    "Batches of documents sent to the embedding model at ingest, by outcome - embedded, throttled (and sent again) "
+    "or failed",
+    ["outcome"]
+)
+EMBEDDING_TOKENS = Counter("embedding_tokens", "Tokens of the documents embedded at ingest")
+ANSWER_CACHE_REQUESTS = Counter(
+    "answer_cache_requests", "Queries looked up in the answer cache, by whether they were answered from it", ["result"]
+)
+ANSWER_CACHE_HITS = ANSWER_CACHE_REQUESTS.labels("hit")
+ANSWER_CACHE_MISSES = ANSWER_CACHE_REQUESTS.labels("miss")
+
+FETCHES = Counter(
+    "legislation_fetches", "Legislation XML fetches, by outcome - downloaded, not_modified or failed", ["outcome"]
+)
+FETCH_SECONDS = Histogram(
+    "legislation_fetch_seconds", "Seconds to fetch a legislation XML document, including retries",
+    buckets=QUERY_BUCKETS
+)
+SECTIONS = Counter("legislation_sections", "Sections ingested, by whether they were parsed or reused", ["outcome"])
+SECTION_PARSE_SECONDS = Histogram(
+    "legislation_section_parse_seconds", "Seconds to parse the XML of one section", buckets=PARSE_BUCKETS
+)
+ACT_PARSE_SECONDS = Histogram(
+    "legislation_act_parse_seconds", "Seconds to split the XML of a whole Act into parsed sections",
+    buckets=PARSE_BUCKETS
+)
+INDEX_BUILD_SECONDS = Histogram(
+    "index_build_seconds",
+    "Seconds to set up the vector index, by operation - build, load (a saved index), update (on refresh) or attach "
+    "(to a shared snapshot)",
+    ["operation"], buckets=BUILD_BUCKETS
+)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Render the metrics in the Prometheus text format.
+
+    Returns:
+        Tuple[bytes, str]: The metrics, and their content type.
+    """
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
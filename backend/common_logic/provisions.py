@@ -0,0 +1,203 @@
+"""
+A compact model of parsed sections, and an iterative renderer of their text.
+
+Parsers produce sections as nested dicts - {'text': [str | dict, ...], 'label': str} - which `flatten_text` renders
+recursively. Provision and Section hold the same data in slotted objects, which take a fraction of the memory of the
+dicts, and `render` writes their text in a single pass into one buffer. The output is byte-identical to
+`flatten_text`, and both convert to and from the dict shape.
+"""
+
+from typing import Any, Dict, List, Optional, Union
+
+
+class Provision:
+    """A level of a section - its label (e.g. '2' or 'a') and text, of strings and nested provisions."""
+
+    __slots__ = ('label', 'text')
+
+    def __init__(self, text: Optional[List[Union[str, "Provision"]]] = None, label: Optional[str] = None):
+        """
+        Parameters:
+            text (List[Union[str, Provision]], optional): The text and nested provisions, in document order, or None
+                if the provision has no 'text' key.
+            label (str, optional): The label, or None if the provision has no 'label' key.
+        """
+        self.text = text
+        self.label = label
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Provision) and self.label == other.label and self.text == other.text
+
+    def __repr__(self) -> str:
+        return f"Provision(label={self.label!r}, text={self.text!r})"
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Provision":
+        """
+        Build a provision tree from the parsed data of a section.
+
+        Parameters:
+            data (Dict[str, Any]): Parsed data, as returned by parse_recursive or lxml_parser.parse_section.
+
+        Returns:
+            Provision: The root of the tree.
+        """
+        root = cls(label=data.get('label'))
+        stack = [(data, root)]
+        while stack:
+            node, provision = stack.pop()
+            if 'text' not in node:
+                continue
+            text = provision.text = []
+            for item in node['text']:
+                if isinstance(item, dict):
+                    child = cls(label=item.get('label'))
+                    text.append(child)
+                    stack.append((item, child))
+                else:
+                    text.append(item)
+        return root
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the provision tree back to the parsed data it was built from.
+
+        Returns:
+            Dict[str, Any]: The parsed data, with 'text' and 'label' keys where the provisions have them.
+        """
+        root = {}
+        stack = [(self, root)]
+        while stack:
+            provision, node = stack.pop()
+            if provision.text is not None:
+                text = node['text'] = []
+                for item in provision.text:
+                    if isinstance(item, Provision):
+                        child = {}
+                        text.append(child)
+                        stack.append((item, child))
+                    else:
+                        text.append(item)
+            if provision.label is not None:
+                node['label'] = provision.label
+        return root
+
+    def render(self, prefix: str = '', depth: int = 0) -> str:
+        """Render the text of the provision, as flatten_text renders its dict."""
+        return render(self, prefix, depth)
+
+
+def _prefix(provision: Provision, prefix: str, depth: int) -> str:
+    """The prefix of the first line of a provision - the labels of the provisions it opens."""
+    # The first level is the section number, which is added separately with the title
+    if provision.label is None or depth == 0:
+        return prefix
+    return f"{prefix}{provision.label}) " if prefix else f"{provision.label}) "
+
+
+def render(provision: Provision, prefix: str = '', depth: int = 0) -> str:
+    """
+    Render the text of a provision tree, with an indented line per text labelled with the provisions it opens.
+
+    Walks the tree with an explicit stack and collects every line into one list, joined once, instead of joining the
+    lines of each level and then joining those strings again at the level above.
+
+    Parameters:
+        provision (Provision): The root of the tree.
+        prefix (str): The current prefix for the labels. Defaults to an empty string.
+        depth (int): The current depth in the tree. Defaults to 0.
+
+    Returns:
+        str: The text, identical to flatten_text(provision.to_dict(), prefix, depth).
+    """
+    lines = []
+    append = lines.append
+    # The levels above the current one, each with its remaining items, the prefix of its next line and its depth
+    stack = []
+    items, prefix, indent = iter(provision.text or ()), _prefix(provision, prefix, depth), '    ' * depth
+    while True:
+        for item in items:
+            if isinstance(item, Provision):
+                # A nested provision without text still takes a line of its own
+                if not item.text:
+                    append('')
+                    continue
+                stack.append((items, prefix, depth))
+                depth += 1
+                items, prefix, indent = iter(item.text), _prefix(item, prefix, depth), '    ' * depth
+                break
+            append(f"{indent}{prefix}{item}")
+            # Only the first line of a provision carries its labels
+            prefix = ''
+        else:
+            if not stack:
+                return '\n'.join(lines)
+            items, prefix, depth = stack.pop()
+            indent = '    ' * depth
+
+
+class Section:
+    """A section of an Act - its number, title, URIs and provisions."""
+
+    __slots__ = ('number', 'title', 'id_uri', 'document_uri', 'body')
+
+    def __init__(
+            self,
+            number: Optional[str],
+            title: Optional[str],
+            body: Provision,
+            id_uri: Optional[str] = None,
+            document_uri: Optional[str] = None
+    ):
+        self.number = number
+        self.title = title
+        self.body = body
+        self.id_uri = id_uri
+        self.document_uri = document_uri
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Section) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        return f"Section(number={self.number!r}, title={self.title!r}, document_uri={self.document_uri!r})"
+
+    @classmethod
+    def from_dict(cls, item: Dict[str, Any]) -> "Section":
+        """
+        Build a section from a parsed section dict, as returned by UKLegislationParser.get_section_dicts.
+
+        Parameters:
+            item (Dict[str, Any]): The section, with its 'number', 'title', 'IdURI', 'DocumentURI' and 'parsed_data'.
+
+        Returns:
+            Section: The section. Its flattened text and source XML are not kept, the text is rendered on demand.
+        """
+        return cls(
+            number=item.get('number'),
+            title=item.get('title'),
+            body=Provision.from_dict(item.get('parsed_data') or {}),
+            id_uri=item.get('IdURI'),
+            document_uri=item.get('DocumentURI')
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the section back to a parsed section dict.
+
+        Returns:
+            Dict[str, Any]: The section, with its 'parsed_data' and 'flattened_text'.
+        """
+        return {
+            'number': self.number,
+            'title': self.title,
+            'IdURI': self.id_uri,
+            'DocumentURI': self.document_uri,
+            'parsed_data': self.body.to_dict(),
+            'flattened_text': self.render()
+        }
+
+    def render(self) -> str:
+        """Render the section as its flattened text - the number and title, then the text of its provisions."""
+        return f"{self.number}. {self.title}\n\n{render(self.body)}"
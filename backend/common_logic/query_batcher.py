@@ -0,0 +1,172 @@
+"""Micro-batching of query embeddings across concurrent requests."""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Set, Tuple
+
+from langchain.embeddings.base import Embeddings
+
+from config import logger
+
+# Put on the queue to stop the worker thread
+_STOP = None
+
+
+async def aembed_documents(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """Embed texts with a model's async API, or on a worker thread if it only has a synchronous one."""
+    try:
+        return await embeddings.aembed_documents(texts)
+    except NotImplementedError:
+        return await asyncio.get_running_loop().run_in_executor(None, embeddings.embed_documents, texts)
+
+
+async def aembed_query(embeddings: Embeddings, text: str) -> List[float]:
+    """Embed a query with a model's async API, or on a worker thread if it only has a synchronous one."""
+    try:
+        return await embeddings.aembed_query(text)
+    except NotImplementedError:
+        return await asyncio.get_running_loop().run_in_executor(None, embeddings.embed_query, text)
+
+
+class QueryEmbeddingBatcher(Embeddings):
+    """
+    Embeddings that gather queries embedded concurrently from many threads into one call of the model.
+
+    A worker thread takes the first waiting query, collects any others that are waiting or arrive within max_wait
+    seconds, up to max_batch_size, embeds them with a single embed_documents call and hands each caller its vector.
+    Queries embedded with aembed_query are batched the same way on the event loop, without the worker thread, and
+    several of their batches may be in flight at once. Documents are embedded directly, without batching.
+    """
+
+    def __init__(
+            self,
+            embeddings: Embeddings,
+            max_batch_size: int = 32,
+            max_wait: float = 0.005,
+            document_embeddings: Optional[Embeddings] = None
+    ):
+        """
+        Parameters:
+            embeddings (Embeddings): The model used to embed batches of queries.
+            max_batch_size (int): Maximum number of queries embedded in one call.
+            max_wait (float): Seconds to wait for more queries after the first one of a batch arrives.
+            document_embeddings (Embeddings, optional): Used to embed documents, e.g. a cache over the model.
+                Defaults to the model itself.
+        """
+        self.embeddings = embeddings
+        self.document_embeddings = document_embeddings if document_embeddings is not None else embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = {'queries': 0, 'batches': 0}
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # Queries awaiting the next async batch, and the timer that sends it
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Async batches being embedded - the event loop only keeps weak references to tasks
+        self._batches: Set[asyncio.Task] = set()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.document_embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query as part of the next batch, blocking until its vector is ready."""
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+                self._thread.start()
+            self._queue.put((text, future))
+        return future.result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a query as part of the next async batch. Use from a single event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Send the pending async queries as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._aembed_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _aembed_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = [text for text, _ in batch]
+        try:
+            vectors = await aembed_documents(self.embeddings, texts)
+        except Exception as e:
+            logger.exception(f"Failed to embed a batch of {len(texts)} queries")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.stats['queries'] += len(batch)
+        self.stats['batches'] += 1
+        for (_, future), vector in zip(batch, vectors):
+            # The query may have been cancelled while its batch was embedded
+            if not future.done():
+                future.set_result(vector)
+
+    def _collect(self, first: Tuple[str, Future]) -> Tuple[List[Tuple[str, Future]], bool]:
+        """
+        Collect the queries that are already waiting or arrive within max_wait of the first.
+
+        Returns:
+            Tuple[List, bool]: The batch, and whether the batcher was closed while collecting it.
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Past the deadline, still take the queries that are already waiting
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch, stopped = self._collect(item)
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                logger.exception(f"Failed to embed a batch of {len(texts)} queries")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.stats['queries'] += len(batch)
+            self.stats['batches'] += 1
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def close(self) -> None:
+        """Stop the worker thread once the queries already waiting have been embedded."""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join()
+                self._thread = None
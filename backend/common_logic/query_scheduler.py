@@ -0,0 +1,150 @@
+"""Admission control for queries - a bounded number run at once, a bounded number wait, the rest are turned away."""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, Optional
+
+# Called with a waiting query's position in the queue (1 is next) and the estimated seconds until it starts
+QueuedCallback = Callable[[int, Optional[float]], Awaitable[None]]
+
+
+class SchedulerBusy(Exception):
+    """Raised when a query arrives while every slot is taken and the queue is full."""
+
+
+class _Waiter:
+    """A query waiting for a slot."""
+
+    def __init__(self):
+        self.granted = False
+        # Set whenever the waiter is granted a slot or moves up the queue
+        self.changed = asyncio.Event()
+
+
+class QueryScheduler:
+    """
+    First-come, first-served scheduler bounding the number of queries answered concurrently.
+
+    Up to max_concurrent queries hold a slot at once. Further queries wait in a queue of at most max_queued, and are
+    told their position and an estimate of when they will start each time it changes. Queries arriving when the
+    queue is full are rejected straight away, so that under overload the queries that are admitted keep their latency
+    instead of every query slowing down together. A query that is cancelled while it waits leaves the queue.
+
+    The scheduler is not thread-safe - use it from a single event loop.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, smoothing: float = 0.2):
+        """
+        Parameters:
+            max_concurrent (int): Maximum number of queries holding a slot at once.
+            max_queued (int): Maximum number of queries waiting for a slot.
+            smoothing (float): Weight of the latest query in the moving average of query durations used for ETAs.
+        """
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.smoothing = smoothing
+        # Moving average of the seconds a query holds a slot, None until one has finished
+        self.average_duration: Optional[float] = None
+        self.stats = {'admitted': 0, 'queued': 0, 'rejected': 0, 'cancelled': 0, 'completed': 0}
+        self._active = 0
+        self._waiters: Deque[_Waiter] = deque()
+
+    @property
+    def active(self) -> int:
+        """Number of queries holding a slot."""
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        """Number of queries waiting for a slot."""
+        return len(self._waiters)
+
+    def eta(self, position: int) -> Optional[float]:
+        """Estimated seconds until the query at a position in the queue starts, or None before any query finished."""
+        if self.average_duration is None:
+            return None
+        return self.average_duration * position / self.max_concurrent
+
+    async def acquire(self, on_queued: Optional[QueuedCallback] = None) -> None:
+        """
+        Wait for a slot.
+
+        Parameters:
+            on_queued (QueuedCallback, optional): Awaited with the query's position and ETA when it has to wait,
+                and again each time its position changes.
+
+        Raises:
+            SchedulerBusy: If every slot is taken and the queue is full.
+        """
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            self.stats['admitted'] += 1
+            return
+        if len(self._waiters) >= self.max_queued:
+            self.stats['rejected'] += 1
+            raise SchedulerBusy(f"{self._active} queries running and {len(self._waiters)} waiting")
+
+        waiter = _Waiter()
+        self._waiters.append(waiter)
+        self.stats['queued'] += 1
+        reported = None
+        try:
+            while True:
+                waiter.changed.clear()
+                if waiter.granted:
+                    break
+                position = self._waiters.index(waiter) + 1
+                if on_queued is not None and position != reported:
+                    reported = position
+                    await on_queued(position, self.eta(position))
+                await waiter.changed.wait()
+        except BaseException:
+            if waiter.granted:
+                # Granted a slot as it was cancelled - pass the slot on
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+                self._notify_waiters()
+            self.stats['cancelled'] += 1
+            raise
+        self.stats['admitted'] += 1
+
+    def release(self, duration: Optional[float] = None) -> None:
+        """
+        Give up a slot, handing it to the next waiting query.
+
+        Parameters:
+            duration (float, optional): Seconds the slot was held for, to update the ETA estimate.
+        """
+        self._active -= 1
+        if duration is not None:
+            self.stats['completed'] += 1
+            self.average_duration = duration if self.average_duration is None \
+                else self.smoothing * duration + (1 - self.smoothing) * self.average_duration
+        while self._active < self.max_concurrent and self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            waiter.changed.set()
+            self._active += 1
+        self._notify_waiters()
+
+    def _notify_waiters(self) -> None:
+        for waiter in self._waiters:
+            waiter.changed.set()
+
+    @asynccontextmanager
+    async def slot(self, on_queued: Optional[QueuedCallback] = None) -> AsyncIterator[None]:
+        """Hold a slot for the duration of a block, waiting for one first if needed."""
+        await self.acquire(on_queued)
+        start = time.perf_counter()
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            # Only queries that ran to the end are representative of how long a query takes
+            self.release(time.perf_counter() - start if completed else None)
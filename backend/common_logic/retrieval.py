@@ -0,0 +1,641 @@
+"""Hybrid lexical and vector retrieval, with direct lookup of sections referred to by number."""
+
+import json
+import math
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain.callbacks.manager import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain.embeddings.base import Embeddings
+from langchain.schema import BaseRetriever
+from langchain.schema.document import Document
+from langchain.vectorstores import FAISS
+
+from common_logic.chunking import estimate_tokens, section_heading
+from common_logic.context import ContextStats, TokenCounter, fit_to_budget, is_duplicate
+from common_logic.metrics import CONTEXT_TOKENS, CONTEXT_TOKENS_SAVED, EMBED_SECONDS, RETRIEVE_SECONDS
+from common_logic.query_batcher import aembed_query
+from config import logger
+
+# Constant of reciprocal rank fusion - larger values flatten the difference between the top ranks
+RRF_K = 60
+
+# Number of metadata filters whose masks are kept
+MAX_MASKS = 256
+
+# Metadata fields indexed for filtering, so that masks are built without reading every document
+FILTER_FIELDS = ('act',)
+
+# Description of the saved indexes, written last when a retrieval index is saved
+RETRIEVAL_INDEX_FILE = "retrieval.json"
+
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which will with "
+    "what when where who how does do may shall under any such".split()
+)
+
+# An explicit reference to a section, e.g. "s.60", "ss. 1", "s60", "sec. 4A" or "section 2(1)(a)"
+SECTION_REFERENCE = re.compile(
+    r"\b(?:sections?\s+|sec\.?\s*|ss?\.\s*|s(?=\d))(\d+[A-Za-z]{0,2})\b((?:\s*\(\s*[0-9A-Za-z]+\s*\))*)",
+    re.IGNORECASE
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens of a text, without stopwords."""
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class SectionReference(NamedTuple):
+    """A reference to a section of an Act, with the path of the subsection it points into, if any."""
+    section: str
+    subsections: Tuple[str, ...] = ()
+
+    @property
+    def label(self) -> str:
+        """The reference as written in legislation, e.g. '2(1)(a)'."""
+        return self.section + "".join(f"({part})" for part in self.subsections)
+
+
+def parse_section_references(query: str) -> List[SectionReference]:
+    """
+    Find the explicit section references in a query.
+
+    Parameters:
+        query (str): The query, e.g. "What does s.60(2) say?".
+
+    Returns:
+        List[SectionReference]: The references in the order they appear, without duplicates.
+    """
+    references = []
+    for match in SECTION_REFERENCE.finditer(query):
+        reference = SectionReference(
+            match.group(1).upper(), tuple(re.findall(r"\(\s*([0-9A-Za-z]+)\s*\)", match.group(2)))
+        )
+        if reference not in references:
+            references.append(reference)
+    return references
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = RRF_K) -> List[int]:
+    """
+    Fuse several rankings of the same items by reciprocal rank.
+
+    Each item scores the sum of 1 / (k + rank) over the rankings it appears in, so items ranked highly by several
+    retrievers come first without their scores having to be comparable.
+
+    Parameters:
+        rankings (Iterable[Sequence[int]]): Rankings of items, best first.
+        k (int): Constant damping the weight of the top ranks.
+
+    Returns:
+        List[int]: Every ranked item, best first.
+    """
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+class InvertedIndex:
+    """
+    Positions of the documents listed under each key, with an optional weight for each.
+
+    Keys are held in a sorted array and their lists in flat arrays, so the index can be saved as .npy files and
+    memory-mapped by other processes without being copied into each of them.
+    """
+
+    def __init__(
+            self, keys: np.ndarray, offsets: np.ndarray, positions: np.ndarray, weights: Optional[np.ndarray] = None
+    ):
+        """
+        Parameters:
+            keys (np.ndarray): The sorted keys.
+            offsets (np.ndarray): Start of the list of each key in positions, followed by the end of the last list.
+            positions (np.ndarray): The lists of document positions, one after another.
+            weights (np.ndarray, optional): A weight for each item of positions.
+        """
+        self.keys = keys
+        self.offsets = offsets
+        self.positions = positions
+        self.weights = weights
+
+    @classmethod
+    def from_lists(
+            cls, lists: Dict[str, Sequence[int]], weights: Optional[Dict[str, Sequence[float]]] = None
+    ) -> "InvertedIndex":
+        """Build an index from the list of positions of each key, and the list of their weights if weighted."""
+        keys = sorted(lists)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(lists[key]) for key in keys])
+
+        def concatenate(columns, dtype):
+            return np.concatenate([np.asarray(column, dtype=dtype) for column in columns]) if keys \
+                else np.zeros(0, dtype=dtype)
+
+        return cls(
+            np.array(keys, dtype=str) if keys else np.zeros(0, dtype="<U1"),
+            offsets,
+            concatenate((lists[key] for key in keys), np.int64),
+            concatenate((weights[key] for key in keys), np.float32) if weights is not None else None
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """The positions listed under a key and their weights, or None if the key is not indexed."""
+        i = int(np.searchsorted(self.keys, key))
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.positions[start:end], self.weights[start:end] if self.weights is not None else None
+
+    def save(self, directory: Path, name: str) -> None:
+        """Save the arrays of the index as name.*.npy files in a directory."""
+        arrays = {'keys': self.keys, 'offsets': self.offsets, 'positions': self.positions}
+        if self.weights is not None:
+            arrays['weights'] = self.weights
+        for suffix, array in arrays.items():
+            np.save(directory / f"{name}.{suffix}.npy", array)
+
+    @classmethod
+    def load(cls, directory: Path, name: str) -> "InvertedIndex":
+        """Memory-map an index saved in a directory."""
+        def load(suffix):
+            return np.load(directory / f"{name}.{suffix}.npy", mmap_mode='r')
+
+        weighted = (directory / f"{name}.weights.npy").exists()
+        return cls(load('keys'), load('offsets'), load('positions'), load('weights') if weighted else None)
+
+
+class RetrievalIndex:
+    """
+    Indexes over the documents of a FAISS vector store, addressed by their position in the FAISS index.
+
+    Holds a BM25 inverted index of the document text, an index of the documents of each section by section number
+    alone, so that a number lists its section in every Act, an index of the values of the metadata fields used to
+    filter searches, and the number of tokens of each document.
+    """
+
+    def __init__(
+            self,
+            documents: Sequence[Document],
+            lexical: bool = True,
+            sections: bool = True,
+            k1: float = 1.5,
+            b: float = 0.75,
+            tokens: Optional[Sequence[int]] = None
+    ):
+        """
+        Parameters:
+            documents (Sequence[Document]): The documents, in the order of the FAISS index.
+            lexical (bool): Build the BM25 index.
+            sections (bool): Build the index of section numbers.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 document length normalisation.
+            tokens (Sequence[int], optional): The number of tokens of each document, estimated where needed if not
+                given.
+        """
+        self.documents = documents
+        self.tokens: Optional[np.ndarray] = np.asarray(tokens, dtype=np.int32) if tokens is not None else None
+        self._masks: Dict[str, np.ndarray] = {}
+        # Each term lists the positions of the documents containing it, weighted by their BM25 weight for the term
+        self.postings: Optional[InvertedIndex] = None
+        if lexical:
+            self.postings = self._build_postings(documents, k1, b)
+        # Positions of the documents of each section number, across every Act
+        self.sections: Optional[InvertedIndex] = None
+        if sections:
+            numbers = defaultdict(list)
+            for position, doc in enumerate(documents):
+                if doc.metadata.get("section"):
+                    numbers[str(doc.metadata["section"]).upper()].append(position)
+            self.sections = InvertedIndex.from_lists(numbers)
+        # Positions of the documents with each value of the filter fields
+        self.fields: Dict[str, InvertedIndex] = {}
+        for name in FILTER_FIELDS:
+            values = defaultdict(list)
+            for position, doc in enumerate(documents):
+                if doc.metadata.get(name) is not None:
+                    values[str(doc.metadata[name])].append(position)
+            self.fields[name] = InvertedIndex.from_lists(values)
+
+    @classmethod
+    def from_vectorstore(
+            cls, vectorstore: FAISS, token_counter: Optional[TokenCounter] = None, **kwargs
+    ) -> "RetrievalIndex":
+        """Build the indexes over the documents of a FAISS vector store, counting their tokens with token_counter."""
+        documents = [
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+            for position in range(len(vectorstore.index_to_docstore_id))
+        ]
+        if token_counter is not None:
+            kwargs['tokens'] = token_counter.count([doc.page_content for doc in documents])
+        return cls(documents, **kwargs)
+
+    @staticmethod
+    def _build_postings(documents: Sequence[Document], k1: float, b: float) -> InvertedIndex:
+        frequencies: Dict[str, Dict[int, int]] = defaultdict(dict)
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for position, doc in enumerate(documents):
+            tokens = tokenize(doc.page_content)
+            lengths[position] = len(tokens)
+            for token in tokens:
+                frequencies[token][position] = frequencies[token].get(position, 0) + 1
+        average_length = float(lengths.mean()) if len(documents) else 0.0
+        positions, weights = {}, {}
+        for term, counts in frequencies.items():
+            positions[term] = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            idf = math.log(1 + (len(documents) - len(counts) + 0.5) / (len(counts) + 0.5))
+            norm = k1 * (1 - b + b * lengths[positions[term]] / (average_length or 1.0))
+            weights[term] = idf * tf * (k1 + 1) / (tf + norm)
+        return InvertedIndex.from_lists(positions, weights)
+
+    def save(self, directory: Path) -> None:
+        """
+        Save the indexes in a directory, to be memory-mapped with load.
+
+        The documents are not saved - they are passed to load.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        if self.postings is not None:
+            self.postings.save(directory, "postings")
+        if self.sections is not None:
+            self.sections.save(directory, "sections")
+        for name, field in self.fields.items():
+            field.save(directory, f"field.{name}")
+        if self.tokens is not None:
+            np.save(directory / "tokens.npy", self.tokens)
+        with open(directory / RETRIEVAL_INDEX_FILE, 'w', encoding='utf-8') as f:
+            json.dump({
+                'documents': len(self.documents),
+                'lexical': self.postings is not None,
+                'sections': self.sections is not None,
+                'fields': list(self.fields),
+                'tokens': self.tokens is not None
+            }, f)
+
+    @classmethod
+    def load(cls, directory: Path, documents: Sequence[Document]) -> "RetrievalIndex":
+        """
+        Memory-map indexes saved in a directory, so that processes loading the same indexes share their memory.
+
+        Parameters:
+            directory (Path): The directory the indexes were saved in.
+            documents (Sequence[Document]): The documents they were built from, in the same order.
+
+        Raises:
+            ValueError: If the number of documents differs from the number the indexes were built from.
+        """
+        with open(directory / RETRIEVAL_INDEX_FILE, 'r', encoding='utf-8') as f:
+            description = json.load(f)
+        if description['documents'] != len(documents):
+            raise ValueError(
+                f"Indexes in {directory} are of {description['documents']} documents, not {len(documents)}"
+            )
+        index = cls.__new__(cls)
+        index.documents = documents
+        index._masks = {}
+        index.postings = InvertedIndex.load(directory, "postings") if description['lexical'] else None
+        index.sections = InvertedIndex.load(directory, "sections") if description['sections'] else None
+        index.fields = {name: InvertedIndex.load(directory, f"field.{name}") for name in description['fields']}
+        index.tokens = np.load(directory / "tokens.npy", mmap_mode='r') if description.get('tokens') else None
+        return index
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def token_count(self, position: int) -> int:
+        """The number of tokens of a document, as counted when the index was built or estimated."""
+        if self.tokens is not None:
+            return int(self.tokens[position])
+        return estimate_tokens(self.documents[position].page_content)
+
+    def mask(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Positions of the documents matching a metadata filter, as a boolean mask, or None if there is no filter.
+
+        A filter value that is a list matches any of its items, as in FAISS.
+        """
+        if not filter:
+            return None
+        key = json.dumps(filter, sort_keys=True)
+        if key not in self._masks:
+            if len(self._masks) >= MAX_MASKS:
+                self._masks.clear()
+            if all(name in self.fields for name in filter):
+                self._masks[key] = self._field_mask(filter)
+            else:
+                self._masks[key] = np.fromiter(
+                    (all(doc.metadata.get(name) in value if isinstance(value, list) else doc.metadata.get(name) == value
+                         for name, value in filter.items()) for doc in self.documents),
+                    dtype=bool, count=len(self.documents)
+                )
+        return self._masks[key]
+
+    def _field_mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Mask of a filter on indexed fields, built from the positions listed under the values it matches."""
+        mask = np.ones(len(self.documents), dtype=bool)
+        for name, value in filter.items():
+            matches = np.zeros(len(self.documents), dtype=bool)
+            for item in value if isinstance(value, list) else [value]:
+                found = self.fields[name].get(str(item))
+                if found is not None:
+                    matches[found[0]] = True
+            mask &= matches
+        return mask
+
+    def lexical_search(self, query: str, n: int, mask: Optional[np.ndarray] = None) -> List[int]:
+        """Positions of the n documents with the highest BM25 score for a query, best first."""
+        if self.postings is None or not len(self.documents):
+            return []
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for term in set(tokenize(query)):
+            found = self.postings.get(term)
+            if found is not None:
+                positions, weights = found
+                scores[positions] += weights
+        if mask is not None:
+            scores[~mask] = 0
+        n = min(n, int(np.count_nonzero(scores)))
+        if n == 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        return top[np.argsort(-scores[top], kind="stable")].tolist()
+
+    def lookup_sections(self, query: str, mask: Optional[np.ndarray] = None) -> Optional[List[int]]:
+        """
+        Positions of the documents of the sections a query refers to explicitly.
+
+        A reference into a subsection, such as "s.60(2)", is narrowed to the chunks of the subsection and of the parts
+        it is in, if the section is chunked.
+
+        Returns:
+            Optional[List[int]]: The documents in the order they are referred to, or None if the query refers to no
+                section, or to one that is not indexed.
+        """
+        references = parse_section_references(query) if self.sections is not None else []
+        if not references:
+            return None
+        found = []
+        for reference in references:
+            listed = self.sections.get(reference.section)
+            positions = [int(p) for p in listed[0] if mask is None or mask[p]] if listed is not None else []
+            if not positions:
+                return None
+            if reference.subsections:
+                positions = [
+                    p for p in positions if _within(self.documents[p].metadata.get("label"), reference.label)
+                ] or positions
+            found.extend(p for p in positions if p not in found)
+        return found
+
+    def spans_acts(self, positions: Sequence[int]) -> bool:
+        """Whether the documents at positions are from more than one Act."""
+        return len({self.documents[p].metadata.get("act") for p in positions}) > 1
+
+    def section_chunks(self, position: int) -> List[int]:
+        """
+        Positions of the chunks of the section a chunk is part of, in order, or just the chunk if it is not one.
+
+        Chunks are put back in order, as those of a section that changed are re-added at the end of the index.
+        """
+        doc = self.documents[position]
+        if "label" not in doc.metadata or self.sections is None:
+            return [position]
+        listed = self.sections.get(str(doc.metadata["section"]).upper())
+        if listed is None:
+            return [position]
+        chunks = {}
+        for p in listed[0]:
+            metadata = self.documents[p].metadata
+            if "label" in metadata and metadata.get("act") == doc.metadata.get("act") \
+                    and metadata.get("source") == doc.metadata.get("source"):
+                chunks[int(p)] = metadata.get("chunk", 0)
+        return sorted(chunks, key=chunks.get)
+
+    def expand_sections(self, positions: Sequence[int], max_tokens: int) -> List[Document]:
+        """
+        The documents at positions, with chunks replaced by their whole section while the total text fits a budget.
+
+        Chunks are expanded in the order given, so the best matches are expanded first. A section replaces all its
+        chunks among the documents, in the place of the first, and its text is that of its chunks in order.
+
+        Parameters:
+            positions (Sequence[int]): Positions of the retrieved documents, best first.
+            max_tokens (int): Tokens the retrieved text may reach by expanding chunks.
+
+        Returns:
+            List[Document]: The documents, some of them sections built from chunks.
+        """
+        return [doc for doc, _ in self._expand(positions, max_tokens)]
+
+    def _expand(self, positions: Sequence[int], max_tokens: int) -> List[Tuple[Document, int]]:
+        """The documents of expand_sections, with their number of tokens."""
+        tokens = [self.token_count(position) for position in positions]
+        total = sum(tokens)
+        result: List[Optional[Tuple[Document, int]]] = [
+            (self.documents[position], count) for position, count in zip(positions, tokens)
+        ]
+        for i, position in enumerate(positions):
+            if result[i] is None or "label" not in result[i][0].metadata or not max_tokens:
+                continue
+            chunks = self.section_chunks(position)
+            if len(chunks) < 2:
+                continue
+            section, section_tokens = self._join_chunks(chunks)
+            retrieved = [j for j, other in enumerate(positions) if other in chunks and result[j] is not None]
+            extra = section_tokens - sum(tokens[j] for j in retrieved)
+            if total + extra > max_tokens:
+                continue
+            total += extra
+            result[i] = (section, section_tokens)
+            for j in retrieved:
+                if j != i:
+                    result[j] = None
+        return [item for item in result if item is not None]
+
+    def deduplicate(self, positions: Sequence[int], n: int, similarity: float) -> Tuple[List[int], int, int]:
+        """
+        The first n positions whose documents are not near-duplicates of documents ranked above them.
+
+        Documents are compared by the words of their text after the heading, so sections that only differ in their
+        number and title, such as "Repealed" stubs, are duplicates.
+
+        Parameters:
+            positions (Sequence[int]): Positions of the candidate documents, best first.
+            n (int): Number of positions to return.
+            similarity (float): Jaccard similarity of their words from which documents are duplicates.
+
+        Returns:
+            Tuple[List[int], int, int]: The positions kept, and the number of duplicates passed over and their tokens.
+        """
+        kept, terms, duplicates, duplicate_tokens = [], [], 0, 0
+        for position in positions:
+            if len(kept) == n:
+                break
+            heading, _, body = self.documents[position].page_content.partition("\n\n")
+            words = frozenset(tokenize(body or heading))
+            if is_duplicate(words, terms, similarity):
+                duplicates += 1
+                duplicate_tokens += self.token_count(position)
+                continue
+            kept.append(position)
+            terms.append(words)
+        return kept, duplicates, duplicate_tokens
+
+    def _join_chunks(self, chunks: List[int]) -> Tuple[Document, int]:
+        """A document of a whole section, joined from its chunks, and its number of tokens."""
+        first = self.documents[chunks[0]]
+        heading = section_heading(first.metadata["section"], first.metadata["title"])
+        text = heading + "\n".join(self.documents[p].page_content[len(heading):] for p in chunks)
+        metadata = {key: value for key, value in first.metadata.items() if key not in ("label", "chunk")}
+        if self.tokens is None:
+            return Document(page_content=text, metadata=metadata), estimate_tokens(text)
+        # Each chunk repeats the heading, which the section holds once
+        tokens = sum(self.token_count(p) for p in chunks) - (len(chunks) - 1) * estimate_tokens(heading)
+        return Document(page_content=text, metadata=metadata), tokens
+
+
+def _within(label: Optional[str], reference: str) -> bool:
+    """Whether a chunk label is the part a reference points to, one of the parts it is in or a part within it."""
+    if label is None:
+        return False
+    label, reference = label.upper(), reference.upper()
+    return label == reference or reference.startswith(label + "(") or label.startswith(reference + "(")
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever fusing FAISS vector search and BM25 lexical search by reciprocal rank.
+
+    Queries that refer to sections by number, such as "s.60" or "section 2(1)", are answered with those sections
+    straight from the section index, without embedding the query. If the number matches sections in more than one
+    of the Acts searched, the matches are ranked by the fused search instead, so that the Act the query is about comes
+    first rather than the Acts first in the index.
+    """
+
+    vectorstore: FAISS
+    # Embeds queries for the vector search
+    embeddings: Embeddings
+    index: RetrievalIndex
+    # Number of documents returned
+    k: int = 4
+    # Number of candidates taken from each search before they are fused
+    fetch_k: int = 20
+    # Metadata the documents must match, e.g. {'act': ['ukpga/1977/37']}
+    filter: Optional[Dict[str, Any]] = None
+    # Whether the vectors of the index are L2-normalised, so that query vectors must be too
+    normalize_L2: bool = False
+    # Tokens the returned text may reach by expanding chunks to their sections, 0 to return the chunks
+    expansion_tokens: int = 0
+    # Jaccard similarity of their words from which documents are dropped as duplicates of those ranked above them,
+    # 0 to keep duplicates
+    dedup_similarity: float = 0.0
+    # Tokens of the returned documents, 0 for no limit
+    max_tokens: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        start = time.perf_counter()
+        mask = self.index.mask(self.filter)
+        referred = self.index.lookup_sections(query, mask)
+        positions = referred
+        if referred is None or self.index.spans_acts(referred):
+            embedding_start = time.perf_counter()
+            embedding = self.embeddings.embed_query(query)
+            embedding_time = time.perf_counter() - embedding_start
+            EMBED_SECONDS.observe(embedding_time)
+            positions = self._search(query, embedding, mask) if referred is None \
+                else self._rank(query, embedding, referred)
+            # Retrieval time excludes the embedding call
+            start += embedding_time
+        documents = self._documents(positions, deduplicate=referred is None)
+        RETRIEVE_SECONDS.observe(time.perf_counter() - start)
+        return documents
+
+    async def _aget_relevant_documents(
+            self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        start = time.perf_counter()
+        mask = self.index.mask(self.filter)
+        referred = self.index.lookup_sections(query, mask)
+        positions = referred
+        if referred is None or self.index.spans_acts(referred):
+            embedding_start = time.perf_counter()
+            embedding = await aembed_query(self.embeddings, query)
+            embedding_time = time.perf_counter() - embedding_start
+            EMBED_SECONDS.observe(embedding_time)
+            positions = self._search(query, embedding, mask) if referred is None \
+                else self._rank(query, embedding, referred)
+            # Retrieval time excludes the embedding call
+            start += embedding_time
+        documents = self._documents(positions, deduplicate=referred is None)
+        RETRIEVE_SECONDS.observe(time.perf_counter() - start)
+        return documents
+
+    def _documents(self, positions: List[int], deduplicate: bool = True) -> List[Document]:
+        """
+        Assemble the context of a query from the ranked positions of its candidate documents.
+
+        Duplicates are dropped, the best k documents kept, chunks expanded to their sections and the documents cut
+        down to the token budget. The tokens of the context and those saved are recorded per query.
+
+        Sections a query refers to by number are not deduplicated - each was asked for, even if it has the same text
+        as another.
+        """
+        duplicates = duplicate_tokens = 0
+        if deduplicate and self.dedup_similarity:
+            positions, duplicates, duplicate_tokens = self.index.deduplicate(positions, self.k, self.dedup_similarity)
+        documents, tokens, truncated = fit_to_budget(
+            self.index._expand(positions[:self.k], self.expansion_tokens), self.max_tokens
+        )
+        stats = ContextStats(tokens, duplicates, duplicate_tokens, truncated)
+        CONTEXT_TOKENS.observe(stats.tokens)
+        CONTEXT_TOKENS_SAVED.observe(stats.saved_tokens)
+        if stats.saved_tokens:
+            logger.info(
+                f"Context of {len(documents)} documents, {stats.tokens} tokens - saved {stats.saved_tokens} tokens "
+                f"({stats.duplicates} duplicates, {stats.truncated_tokens} over the budget)"
+            )
+        return documents
+
+    def _search(self, query: str, embedding: List[float], mask: Optional[np.ndarray]) -> List[int]:
+        """Search both indexes for the candidates of a query and fuse them."""
+        vector = self._vector_search(embedding, mask)
+        if self.index.postings is None:
+            return vector
+        return reciprocal_rank_fusion([vector, self.index.lexical_search(query, self.fetch_k, mask)])
+
+    def _rank(self, query: str, embedding: List[float], positions: List[int]) -> List[int]:
+        """Order the documents of the sections a query refers to by the fused search, keeping any it does not find."""
+        candidates = np.zeros(len(self.index.documents), dtype=bool)
+        candidates[positions] = True
+        ranked = self._search(query, embedding, candidates)
+        return ranked + [p for p in positions if p not in ranked]
+
+    def _vector_search(self, embedding: List[float], mask: Optional[np.ndarray]) -> List[int]:
+        """Positions of the documents nearest an embedding, best first."""
+        total = self.vectorstore.index.ntotal
+        if total == 0:
+            return []
+        depth = self.fetch_k
+        if mask is not None:
+            # The index is searched before filtering, so search deep enough to expect fetch_k from the subset
+            depth *= math.ceil(2 * total / (int(mask.sum()) or 1))
+        vector = np.array([embedding], dtype=np.float32)
+        if self.normalize_L2:
+            faiss.normalize_L2(vector)
+        _, positions = self.vectorstore.index.search(vector, min(total, depth))
+        return [int(p) for p in positions[0] if p != -1 and (mask is None or mask[p])][:self.fetch_k]
@@ -0,0 +1,176 @@
+"""Snapshots of a loaded index, published by one loader process and memory-mapped read-only by worker processes."""
+
+import json
+import mmap
+import shutil
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Union
+
+import faiss
+import numpy as np
+from langchain.schema.document import Document
+from langchain.vectorstores import FAISS
+
+from common_logic.retrieval import RetrievalIndex
+from config import logger
+
+# Bump when the layout of a snapshot changes, so workers do not attach to snapshots they cannot read
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Names the directory of the snapshot workers attach to
+CURRENT_FILE = "CURRENT"
+# Written last, so a snapshot without it is incomplete
+SNAPSHOT_FILE = "snapshot.json"
+INDEX_FILE = "index.faiss"
+DOCUMENTS_FILE = "documents.bin"
+OFFSETS_FILE = "documents.offsets.npy"
+RETRIEVAL_DIR = "retrieval"
+
+
+class DocumentFile(Sequence[Document]):
+    """
+    Documents saved one after another in a file, which is memory-mapped and decoded a document at a time.
+
+    Processes reading the same file share its pages, and only hold the documents they are using.
+    """
+
+    def __init__(self, directory: Path):
+        """
+        Parameters:
+            directory (Path): The directory the documents were written to.
+        """
+        self._offsets = np.load(directory / OFFSETS_FILE, mmap_mode='r')
+        with open(directory / DOCUMENTS_FILE, 'rb') as f:
+            # An empty file cannot be mapped
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else b""
+
+    @staticmethod
+    def write(directory: Path, documents: Iterable[Document]) -> int:
+        """
+        Write documents to a directory.
+
+        Returns:
+            int: The number of documents written.
+        """
+        offsets = [0]
+        with open(directory / DOCUMENTS_FILE, 'wb') as f:
+            for doc in documents:
+                record = json.dumps({'page_content': doc.page_content, 'metadata': doc.metadata}).encode()
+                f.write(record)
+                offsets.append(offsets[-1] + len(record))
+        np.save(directory / OFFSETS_FILE, np.array(offsets, dtype=np.int64))
+        return len(offsets) - 1
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Document, List[Document]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Document {i} out of range")
+        record = json.loads(self._data[int(self._offsets[i]):int(self._offsets[i + 1])])
+        return Document(page_content=record['page_content'], metadata=record['metadata'])
+
+
+class Snapshot(NamedTuple):
+    """A published snapshot of an index."""
+    directory: Path
+    # Fingerprint of the inputs of the index, which changes whenever answers may change
+    fingerprint: str
+    # Name of the embedding model the index was built with, which must also embed the queries
+    embeddings: str
+    # Whether vectors are normalised before they are added or searched
+    normalize_L2: bool
+
+
+def publish_snapshot(
+        directory: Path,
+        vectorstore: FAISS,
+        retrieval_index: RetrievalIndex,
+        fingerprint: str,
+        embeddings: str,
+        normalize_L2: bool = False
+) -> Snapshot:
+    """
+    Publish a snapshot of a loaded index for workers to attach to.
+
+    The snapshot is written to a directory of its own, then made current by replacing the CURRENT file, so workers
+    attaching while it is published see the previous snapshot. Older snapshots are removed, except the previous
+    one, which workers may still be opening.
+
+    Parameters:
+        directory (Path): The directory snapshots are published in.
+        vectorstore (FAISS): The vector store.
+        retrieval_index (RetrievalIndex): The retrieval index over the documents of the vector store.
+        fingerprint (str): The fingerprint of the inputs of the index.
+        embeddings (str): Name of the embedding model.
+        normalize_L2 (bool): Whether the vectors of the index are L2-normalised.
+
+    Returns:
+        Snapshot: The published snapshot.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    snapshot = Snapshot(directory / fingerprint[:32], fingerprint, embeddings, normalize_L2)
+    if _read_snapshot(snapshot.directory) != snapshot:
+        logger.info(f"Publishing index snapshot to {snapshot.directory}")
+        staging = snapshot.directory.with_name(snapshot.directory.name + ".tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+        faiss.write_index(vectorstore.index, str(staging / INDEX_FILE))
+        DocumentFile.write(staging, retrieval_index.documents)
+        retrieval_index.save(staging / RETRIEVAL_DIR)
+        with open(staging / SNAPSHOT_FILE, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': SNAPSHOT_FORMAT_VERSION, 'fingerprint': fingerprint, 'embeddings': embeddings,
+                'normalize_L2': snapshot.normalize_L2
+            }, f)
+        shutil.rmtree(snapshot.directory, ignore_errors=True)
+        staging.rename(snapshot.directory)
+
+    previous = current_snapshot(directory)
+    current_tmp = directory / (CURRENT_FILE + ".tmp")
+    current_tmp.write_text(snapshot.directory.name, encoding='utf-8')
+    current_tmp.replace(directory / CURRENT_FILE)
+    keep = {snapshot.directory.name, previous.directory.name if previous is not None else None}
+    for path in directory.iterdir():
+        if path.is_dir() and path.name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+    return snapshot
+
+
+def _read_snapshot(directory: Path) -> Optional[Snapshot]:
+    """Read the description of a complete snapshot, or None if it is incomplete or of another format."""
+    try:
+        with open(directory / SNAPSHOT_FILE, 'r', encoding='utf-8') as f:
+            description = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if description.get('version') != SNAPSHOT_FORMAT_VERSION:
+        return None
+    return Snapshot(directory, description['fingerprint'], description['embeddings'], description['normalize_L2'])
+
+
+def current_snapshot(directory: Path) -> Optional[Snapshot]:
+    """Return the current snapshot published in a directory, or None if none has been published."""
+    try:
+        name = (directory / CURRENT_FILE).read_text(encoding='utf-8').strip()
+    except FileNotFoundError:
+        return None
+    return _read_snapshot(directory / name)
+
+
+def open_index(snapshot: Snapshot) -> faiss.Index:
+    """Memory-map the FAISS index of a snapshot, reading it into memory if its type cannot be mapped."""
+    path = str(snapshot.directory / INDEX_FILE)
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+def open_retrieval_index(snapshot: Snapshot) -> RetrievalIndex:
+    """Memory-map the documents and retrieval index of a snapshot."""
+    return RetrievalIndex.load(snapshot.directory / RETRIEVAL_DIR, DocumentFile(snapshot.directory))
@@ -0,0 +1,159 @@
+"""Compact, versioned on-disk format for parsed legislation."""
+
+import json
+import mmap
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+FORMAT_NAME = "talking-legislation/parsed"
+FORMAT_VERSION = 1
+
+# Fields of each section that are written to disk - the raw XML is deliberately left out
+SECTION_FIELDS = ('number', 'title', 'IdURI', 'DocumentURI', 'parsed_data', 'flattened_text')
+# Fields of each section kept in the contents tree in the header
+CONTENTS_ITEM_FIELDS = ('number', 'title', 'IdURI', 'DocumentURI')
+
+
+def save_parsed_legislation(parser, path: Union[str, Path]) -> None:
+    """
+    Save the parsed structure of a legislation parser as JSON Lines.
+
+    The first line is a header holding the format version, metadata, contents tree and the byte offset of each
+    section record. Each following line is one section record, so sections can be loaded individually.
+
+    Parameters:
+        parser: A parser exposing base_url, metadata, contents and get_section_dicts().
+        path (str or Path): The file to write.
+    """
+    section_lines = []
+    offsets = []
+    position = 0
+    for item in parser.get_section_dicts():
+        record = {field: item.get(field) for field in SECTION_FIELDS}
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+        offsets.append([position, len(line)])
+        section_lines.append(line)
+        position += len(line)
+
+    # Replace the items in the contents tree with light references to the section records
+    index = 0
+    contents = {key: value for key, value in parser.contents.items() if key != 'parts'}
+    contents['parts'] = []
+    for part in parser.contents.get('parts', []):
+        part_dict = {key: value for key, value in part.items() if key != 'blocks'}
+        part_dict['blocks'] = []
+        for block in part['blocks']:
+            block_dict = {key: value for key, value in block.items() if key != 'items'}
+            block_dict['items'] = []
+            for item in block['items']:
+                item_dict = {field: item.get(field) for field in CONTENTS_ITEM_FIELDS}
+                item_dict['section'] = index
+                block_dict['items'].append(item_dict)
+                index += 1
+            part_dict['blocks'].append(block_dict)
+        contents['parts'].append(part_dict)
+
+    header = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'base_url': parser.base_url,
+        'metadata': parser.metadata,
+        'contents': contents,
+        'sections': offsets
+    }
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+        f.writelines(section_lines)
+    tmp_path.replace(path)
+
+
+class ParsedLegislation:
+    """
+    Read-only view of parsed legislation saved with save_parsed_legislation.
+
+    Loading only reads the header. Section records are memory-mapped and decoded when they are first accessed.
+    It offers the same read methods as UKLegislationParser.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Open a saved file.
+
+        Parameters:
+            path (str or Path): The file to open.
+
+        Raises:
+            ValueError: If the file is not in a supported format or version.
+        """
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            header_line = f.readline()
+        header = json.loads(header_line)
+        if header.get('format') != FORMAT_NAME:
+            raise ValueError(f"{self.path} is not a parsed legislation file")
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError(
+                f"{self.path} has format version {header.get('version')}, expected {FORMAT_VERSION}"
+            )
+        self.base_url = header['base_url']
+        self.metadata = header['metadata']
+        self.contents = header['contents']
+        self._offsets = header['sections']
+        self._data_start = len(header_line)
+        self._sections: List[Optional[Dict[str, Any]]] = [None] * len(self._offsets)
+        self._mmap = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "ParsedLegislation":
+        """Open a saved file."""
+        return cls(path)
+
+    def _read(self, index: int) -> Dict[str, Any]:
+        """Decode the section record at the given index."""
+        with self._lock:
+            if self._mmap is None:
+                with open(self.path, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            offset, length = self._offsets[index]
+            start = self._data_start + offset
+            return json.loads(self._mmap[start:start + length])
+
+    def get_section(self, index: int) -> Dict[str, Any]:
+        """Return the section record at the given index, loading it if needed."""
+        section = self._sections[index]
+        if section is None:
+            section = self._sections[index] = self._read(index)
+        return section
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def iter_section_dicts(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over the section records in order."""
+        for index in range(len(self)):
+            yield self.get_section(index)
+
+    def get_metadata(self) -> Dict[str, Any]:
+        return self.metadata
+
+    def get_contents(self) -> Dict[str, Any]:
+        return self.contents
+
+    def get_section_strings(self) -> List[str]:
+        """Return a list of sections as strings."""
+        return [section['flattened_text'] for section in self.iter_section_dicts()]
+
+    def get_section_dicts(self) -> List[Dict[str, Any]]:
+        """Return a list of sections as dictionaries."""
+        return list(self.iter_section_dicts())
+
+    def close(self) -> None:
+        """Release the memory map of the section records."""
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
@@ -1,33 +1,56 @@
 """Common utility functions."""
 
+import hashlib
 import re
 from bs4 import BeautifulSoup, Tag
 import requests
-from typing import Union, Dict, List
+from typing import Union, Dict, List, Optional, TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from common_logic.http_cache import HTTPCache
 
-def fetch_xml(base_url: str) -> Union[BeautifulSoup, None]:
+
+def fetch_xml(base_url: str, cache: Optional["HTTPCache"] = None) -> Union[BeautifulSoup, None]:
     """
     Fetch XML data from the given URL endpoint and parse it using BeautifulSoup.
 
     Parameters:
     - base_url (str): The base URL where the XML resides.
+    - cache (HTTPCache): Optional HTTP cache used to revalidate previously fetched XML with a conditional GET.
 
     Returns:
     - BeautifulSoup object containing the parsed XML if successful, None otherwise.
     """
+    return parse_xml(fetch_xml_content(base_url, cache=cache))
+
+
+def fetch_xml_content(base_url: str, cache: Optional["HTTPCache"] = None) -> Union[bytes, None]:
+    """
+    Fetch the raw XML data from the given URL endpoint without parsing it.
+
+    Parameters:
+    - base_url (str): The base URL where the XML resides.
+    - cache (HTTPCache): Optional HTTP cache used to revalidate previously fetched XML with a conditional GET.
+
+    Returns:
+    - bytes containing the raw XML if successful, None otherwise.
+    """
     try:
         # Append 'data.xml' to the base URL
-        full_url = f"{base_url}/data.xml"
+        full_url = data_xml_url(base_url)
 
         # Fetch the XML data
+        if cache is not None:
+            response = requests.get(full_url, headers=cache.request_headers(full_url))
+            content = cache.resolve(full_url, response.status_code, response.content, response.headers)
+            if content is None:
+                print(f"Failed to fetch XML. Status code: {response.status_code}")
+            return content
         response = requests.get(full_url)
 
         # Check if the request was successful
         if response.status_code == 200:
-            # Parse the XML using BeautifulSoup
-            soup = BeautifulSoup(response.content, 'xml')
-            return soup
+            return response.content
         else:
             print(f"Failed to fetch XML. Status code: {response.status_code}")
             return None
@@ -36,6 +59,91 @@ def fetch_xml(base_url: str) -> Union[BeautifulSoup, None]:
         return None
 
 
+def data_xml_url(base_url: str) -> str:
+    """
+    Build the URL of the CLML document for a legislation.gov.uk resource.
+
+    Parameters:
+    - base_url (str): The base URL of the resource.
+
+    Returns:
+    - str: The URL of the resource's 'data.xml' representation.
+    """
+    return f"{base_url}/data.xml"
+
+
+def act_url_from_contents_url(url: str) -> str:
+    """
+    Convert the URL of an Act's table of contents into the URL of the whole Act.
+
+    Parameters:
+    - url (str): The contents URL, e.g. 'https://www.legislation.gov.uk/ukpga/1977/37/contents/'.
+
+    Returns:
+    - str: The whole-Act URL, e.g. 'https://www.legislation.gov.uk/ukpga/1977/37'.
+    """
+    url = url.rstrip('/')
+    if url.endswith('/contents'):
+        url = url[:-len('/contents')]
+    return url
+
+
+def normalise_uri(uri: str) -> str:
+    """
+    Normalise a legislation URI for comparison, ignoring the scheme and any trailing slash.
+
+    Parameters:
+    - uri (str): The URI to normalise.
+
+    Returns:
+    - str: The normalised URI.
+    """
+    return re.sub(r"^https?://", "", uri).rstrip('/')
+
+
+def act_id(url: str) -> str:
+    """
+    Identify an Act by the path of its URL, independent of the host it is served from.
+
+    Parameters:
+    - url (str): The contents or whole-Act URL, e.g. 'https://www.legislation.gov.uk/ukpga/1977/37/contents/'.
+
+    Returns:
+    - str: The Act identifier, e.g. 'ukpga/1977/37'.
+    """
+    return normalise_uri(act_url_from_contents_url(url)).split('/', 1)[-1]
+
+
+def content_hash(content: Union[bytes, str]) -> str:
+    """
+    Hash content for change detection.
+
+    Parameters:
+    - content (bytes or str): The content to hash.
+
+    Returns:
+    - str: The SHA-256 hex digest of the content.
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def parse_xml(content: Union[bytes, str, None]) -> Union[BeautifulSoup, None]:
+    """
+    Parse raw XML content using BeautifulSoup.
+
+    Parameters:
+    - content (bytes or str): The raw XML content, or None if the fetch failed.
+
+    Returns:
+    - BeautifulSoup object containing the parsed XML, or None if there was no content.
+    """
+    if content is None:
+        return None
+    return BeautifulSoup(content, 'xml')
+
+
 def parse_element(element, depth: int = 0, parent_label: str = "") -> dict:
     """
     Recursively parses an XML element to extract legislative text and metadata.
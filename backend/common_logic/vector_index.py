@@ -0,0 +1,142 @@
+"""Exact, approximate and quantized FAISS indexes, trained on the corpus they index."""
+
+import math
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+from config import logger
+
+# Index types, from exact to most compressed
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'pq', 'ivfpq')
+
+# Parameters of the exact index - kept as they were before other index types existed, so saved indexes stay valid
+FLAT_PARAMS = {'index': 'IndexFlatL2'}
+
+
+def index_params(
+        kind: str = 'flat',
+        nlist: int = 0,
+        hnsw_m: int = 32,
+        pq_m: int = 0,
+        pq_bits: int = 8
+) -> Dict[str, Any]:
+    """
+    Parameters that determine how an index is built, which are part of its fingerprint.
+
+    Parameters:
+        kind (str): One of INDEX_TYPES.
+        nlist (int): Number of inverted lists of IVF indexes - 0 picks 4 * sqrt(number of vectors).
+        hnsw_m (int): Neighbours of each node of HNSW indexes.
+        pq_m (int): Sub-quantizers of PQ indexes - 0 picks one per 16 dimensions.
+        pq_bits (int): Bits of each sub-quantizer code.
+
+    Returns:
+        Dict[str, Any]: The parameters relevant to the index type.
+
+    Raises:
+        ValueError: If the index type is unknown.
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type {kind!r}, expected one of {INDEX_TYPES}")
+    if kind == 'flat':
+        return dict(FLAT_PARAMS)
+    params = {'index': kind}
+    if kind in ('ivf', 'ivfpq'):
+        params['nlist'] = nlist
+    if kind == 'hnsw':
+        params['hnsw_m'] = hnsw_m
+    if kind in ('pq', 'ivfpq'):
+        params.update(pq_m=pq_m, pq_bits=pq_bits)
+    return params
+
+
+def is_exact(params: Dict[str, Any]) -> bool:
+    """Whether the parameters describe the exact flat index, whose vectors can be removed in place."""
+    return params == FLAT_PARAMS
+
+
+def _sub_quantizers(dimensions: int, pq_m: int) -> int:
+    """Number of sub-quantizers, which must divide the dimension."""
+    if pq_m:
+        return pq_m
+    target = max(1, dimensions // 16)
+    return max(m for m in range(1, target + 1) if dimensions % m == 0)
+
+
+def factory_string(params: Dict[str, Any], dimensions: int, count: int) -> Optional[str]:
+    """
+    The faiss index factory description of an index, or None if there are too few vectors to train it.
+
+    Parameters:
+        params (Dict[str, Any]): Parameters from index_params.
+        dimensions (int): Dimension of the vectors.
+        count (int): Number of vectors the index is trained on.
+    """
+    kind = params['index']
+    if is_exact(params):
+        return "Flat"
+    if kind == 'hnsw':
+        return f"HNSW{params['hnsw_m']}"
+    parts = []
+    if kind in ('ivf', 'ivfpq'):
+        nlist = params['nlist'] or max(1, int(4 * math.sqrt(count)))
+        if count < nlist:
+            return None
+        parts.append(f"IVF{nlist}")
+    if kind in ('pq', 'ivfpq'):
+        m = _sub_quantizers(dimensions, params['pq_m'])
+        if dimensions % m or count < 2 ** params['pq_bits']:
+            return None
+        parts.append(f"PQ{m}x{params['pq_bits']}")
+    else:
+        parts.append("Flat")
+    return ",".join(parts)
+
+
+def build_index(vectors: np.ndarray, params: Dict[str, Any]) -> faiss.Index:
+    """
+    Build an index of the given type over vectors, training it on them first if it needs training.
+
+    Falls back to the exact index if there are too few vectors to train the requested one.
+
+    Parameters:
+        vectors (np.ndarray): float32 vectors, one per row.
+        params (Dict[str, Any]): Parameters from index_params.
+
+    Returns:
+        faiss.Index: The index, holding every vector at the position of its row.
+    """
+    count, dimensions = vectors.shape
+    description = factory_string(params, dimensions, count)
+    if description is None:
+        logger.warning(f"Too few vectors ({count}) to train a {params['index']} index, using a flat index")
+        description = "Flat"
+    # The exact index is the class langchain builds, as it was before other index types existed
+    index = faiss.IndexFlatL2(dimensions) if description == "Flat" \
+        else faiss.index_factory(dimensions, description, faiss.METRIC_L2)
+    if not index.is_trained:
+        logger.info(f"Training {description} index on {count} vectors")
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def configure_search(index: faiss.Index, nprobe: int = 0, ef_search: int = 0) -> None:
+    """
+    Set the search parameters of an index, where they apply to its type.
+
+    Parameters:
+        index (faiss.Index): The index.
+        nprobe (int): Inverted lists searched per query by IVF indexes - more is slower and more accurate.
+        ef_search (int): Depth of the search of HNSW indexes - more is slower and more accurate.
+    """
+    space = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value:
+            try:
+                space.set_index_parameter(index, name, value)
+            except RuntimeError:
+                # The parameter does not apply to this type of index
+                pass
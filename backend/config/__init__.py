@@ -1,5 +1,117 @@
+import os
 from config.init_logger import logger
 from pathlib import Path
 
 # Define a data folder using a relative path
-DATA_DIR = Path(__file__).parent.parent / "data"
\ No newline at end of file
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+# Section fetching - number of concurrent requests, per-host rate limit (requests per second, 0 to disable),
+# retries and request timeout (seconds)
+FETCH_CONCURRENCY = int(os.environ.get('FETCH_CONCURRENCY', 8))
+FETCH_RATE_LIMIT = float(os.environ.get('FETCH_RATE_LIMIT', 10))
+FETCH_MAX_RETRIES = int(os.environ.get('FETCH_MAX_RETRIES', 3))
+FETCH_TIMEOUT = float(os.environ.get('FETCH_TIMEOUT', 30))
+
+# Maximum size in bytes of the persistent HTTP cache of fetched legislation XML
+HTTP_CACHE_MAX_BYTES = int(os.environ.get('HTTP_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Engine used to parse section XML - 'lxml' (streaming) or 'bs4' (BeautifulSoup)
+PARSER_ENGINE = os.environ.get('PARSER_ENGINE', 'lxml')
+
+# Download each Act once and split it into sections locally, instead of one request per section
+WHOLE_ACT_INGEST = (os.environ.get('WHOLE_ACT_INGEST', 'True') == 'True')
+
+# JSON list of the URLs of the Acts served by the API, and the number of processes used to parse them
+# (0 uses one per CPU)
+CORPUS_MANIFEST = Path(os.environ.get('CORPUS_MANIFEST', Path(__file__).parent / "corpus.json"))
+INGEST_PROCESSES = int(os.environ.get('INGEST_PROCESSES', 0))
+
+# Store for cached embeddings - 'sqlite' (a single file of float32 vectors) or 'file' (LocalFileStore)
+EMBEDDING_STORE = os.environ.get('EMBEDDING_STORE', 'sqlite')
+
+# Embedding provider - 'openai' (OpenAI's API) or 'hashing' (hashed word and word pair counts computed on the CPU,
+# with no API calls, for development and CI) - and the size of the hashing provider's vectors. Cached embeddings are
+# kept apart per provider, and changing provider rebuilds the vector index.
+EMBEDDING_PROVIDER = os.environ.get('EMBEDDING_PROVIDER', 'openai')
+HASHING_DIMENSIONS = int(os.environ.get('HASHING_DIMENSIONS', 1024))
+
+# Ingest embedding - documents missing from the embedding cache are embedded in batches of up to EMBED_BATCH_TOKENS
+# tokens and EMBED_BATCH_SIZE documents, EMBED_CONCURRENCY batches at once, within requests and tokens per minute
+# limits (0 for no limit) a little under the provider's. Throttled batches are sent again after the provider's
+# Retry-After, up to EMBED_MAX_RETRIES times, and each batch is cached as soon as it is embedded so that an
+# interrupted ingest resumes where it stopped. The local hashing provider embeds documents directly.
+EMBED_BATCH_TOKENS = int(os.environ.get('EMBED_BATCH_TOKENS', 50000))
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', 1000))
+EMBED_CONCURRENCY = int(os.environ.get('EMBED_CONCURRENCY', 4))
+EMBED_REQUESTS_PER_MINUTE = float(os.environ.get('EMBED_REQUESTS_PER_MINUTE', 2700))
+EMBED_TOKENS_PER_MINUTE = float(os.environ.get('EMBED_TOKENS_PER_MINUTE', 900000))
+EMBED_MAX_RETRIES = int(os.environ.get('EMBED_MAX_RETRIES', 6))
+
+# Save the vector index under DATA_DIR and load it on startup while its inputs are unchanged
+PERSIST_INDEX = (os.environ.get('PERSIST_INDEX', 'True') == 'True')
+
+# Answer cache - maximum entries, seconds each answer is served for, minimum cosine similarity of query embeddings
+# for a near-duplicate query to be answered from the cache (0 to only serve exact matches) and whether answers are
+# also kept on disk across restarts. A size of 0 disables the cache.
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', 1024))
+ANSWER_CACHE_TTL = float(os.environ.get('ANSWER_CACHE_TTL', 24 * 60 * 60))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', 0))
+ANSWER_CACHE_DISK = (os.environ.get('ANSWER_CACHE_DISK', 'False') == 'True')
+
+# Queries embedded concurrently are batched into one embedding call - maximum batch size (1 disables batching) and
+# how long to wait for more queries after the first one arrives (seconds)
+QUERY_BATCH_SIZE = int(os.environ.get('QUERY_BATCH_SIZE', 32))
+QUERY_BATCH_WAIT = float(os.environ.get('QUERY_BATCH_WAIT', 0.005))
+
+# Admission control - number of queries answered at once, and number that may wait for a slot before further
+# queries are turned away as busy. Queries are answered on the event loop, so the limit protects the upstream APIs
+# rather than a thread pool.
+QUERY_CONCURRENCY = int(os.environ.get('QUERY_CONCURRENCY', 64))
+QUERY_QUEUE_SIZE = int(os.environ.get('QUERY_QUEUE_SIZE', 256))
+
+# Retrieval - number of sections passed to the LLM, candidates taken from each of the vector and lexical (BM25)
+# searches before they are fused by reciprocal rank, whether the lexical search is used, and whether queries that
+# refer to sections by number (e.g. "s.60") are answered with those sections - without a search, unless the number
+# matches sections of several Acts, which the search then ranks
+RETRIEVAL_K = int(os.environ.get('RETRIEVAL_K', 4))
+RETRIEVAL_FETCH_K = int(os.environ.get('RETRIEVAL_FETCH_K', 20))
+HYBRID_RETRIEVAL = (os.environ.get('HYBRID_RETRIEVAL', 'True') == 'True')
+SECTION_LOOKUP = (os.environ.get('SECTION_LOOKUP', 'True') == 'True')
+
+# Vector index - 'flat' (exact), 'ivf' (inverted lists), 'hnsw' (graph), 'pq' (product quantized) or 'ivfpq' (both),
+# trained on the corpus when it is built. IVF lists (0 picks 4 * sqrt(sections)) and lists searched per query, HNSW
+# neighbours per node and search depth, and PQ sub-quantizers (0 picks one per 16 dimensions) and bits per code.
+# A corpus too small to train the index uses a flat one.
+VECTOR_INDEX = os.environ.get('VECTOR_INDEX', 'flat')
+IVF_NLIST = int(os.environ.get('IVF_NLIST', 0))
+IVF_NPROBE = int(os.environ.get('IVF_NPROBE', 8))
+HNSW_M = int(os.environ.get('HNSW_M', 32))
+HNSW_EF_SEARCH = int(os.environ.get('HNSW_EF_SEARCH', 64))
+PQ_M = int(os.environ.get('PQ_M', 0))
+PQ_BITS = int(os.environ.get('PQ_BITS', 8))
+
+# Shared index - workers attach read-only to the index snapshot published under SHARED_INDEX_DIR by a loader process
+# (python -m app.publish_index), memory-mapping it instead of each loading their own copy. A worker started before a
+# snapshot is published checks for one every SHARED_INDEX_POLL seconds, and gives up (reported by /readyz) if none is
+# published within SHARED_INDEX_TIMEOUT seconds.
+SHARED_INDEX = (os.environ.get('SHARED_INDEX', 'False') == 'True')
+SHARED_INDEX_DIR = Path(os.environ.get('SHARED_INDEX_DIR', DATA_DIR / "shared"))
+SHARED_INDEX_POLL = float(os.environ.get('SHARED_INDEX_POLL', 1))
+SHARED_INDEX_TIMEOUT = float(os.environ.get('SHARED_INDEX_TIMEOUT', 600))
+
+# Sub-section chunking - sections are indexed as a document per subsection, labelled with its path (e.g. "60(2)(a)"),
+# and subsections of more than CHUNK_MAX_TOKENS are split into their paragraphs. Retrieved chunks are expanded to
+# their whole section while the retrieved text stays within CHUNK_EXPANSION_TOKENS (0 never expands them).
+# Turning chunking on re-embeds the corpus, as every chunk is a new text.
+SUBSECTION_CHUNKS = (os.environ.get('SUBSECTION_CHUNKS', 'False') == 'True')
+CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS', 256))
+CHUNK_EXPANSION_TOKENS = int(os.environ.get('CHUNK_EXPANSION_TOKENS', 1000))
+
+# Context assembly - retrieved documents whose words are at least CONTEXT_DEDUP_SIMILARITY alike (Jaccard similarity,
+# 1 only drops exact duplicates, 0 keeps duplicates) to a document ranked above them are dropped, and documents are
+# kept in rank order up to CONTEXT_MAX_TOKENS tokens (0 for no limit). Tokens are counted with the CONTEXT_ENCODING
+# tiktoken encoding when the index is built and cached in a table beside the embeddings, or estimated if the encoding
+# cannot be loaded.
+CONTEXT_MAX_TOKENS = int(os.environ.get('CONTEXT_MAX_TOKENS', 3000))
+CONTEXT_DEDUP_SIMILARITY = float(os.environ.get('CONTEXT_DEDUP_SIMILARITY', 0.9))
+CONTEXT_ENCODING = os.environ.get('CONTEXT_ENCODING', 'cl100k_base')
@@ -0,0 +1,6 @@
+#! /usr/bin/env bash
+# Run by the base image before the workers start. With SHARED_INDEX=True the index is loaded once here and every
+# worker attaches to the published snapshot.
+if [ "$SHARED_INDEX" = "True" ]; then
+    python -m app.publish_index
+fi
@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Keep the caches and indexes data sources write out of the repo's data directory."""
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    return tmp_path
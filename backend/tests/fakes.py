@@ -0,0 +1,139 @@
+"""Deterministic stand-ins for the OpenAI models, so tests can run offline."""
+import asyncio
+import hashlib
+import math
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain.llms.fake import FakeListLLM
+
+from langchain.embeddings.base import Embeddings
+from langchain.schema.document import Document
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings that record every text they embed."""
+
+    def __init__(self, size: int = 64):
+        self.size = size
+        self.model = "fake-embeddings"
+        self.embedded: List[str] = []
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.size] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        return self._vector(text)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into word tokens, each keeping its trailing whitespace."""
+    return re.findall(r"\S+\s*", text)
+
+
+class FakeStreamingLLM(FakeListLLM):
+    """LLM that streams each response word by word through the callbacks, with a delay per token."""
+
+    token_delay: float = 0.0
+
+    def _call(
+            self,
+            prompt: str,
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any
+    ) -> str:
+        response = super()._call(prompt, stop=stop, **kwargs)
+        for token in tokenize(response):
+            time.sleep(self.token_delay)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token)
+        return response
+
+    async def _acall(
+            self,
+            prompt: str,
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any
+    ) -> str:
+        response = await super()._acall(prompt, stop=stop, **kwargs)
+        for token in tokenize(response):
+            await asyncio.sleep(self.token_delay)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(token)
+        return response
+
+
+class FakeDataSource:
+    """Data source answering every query from a fixed set of documents, without an index or an LLM."""
+
+    def __init__(self, answer: str = "The answer", acts=("ukpga/1977/37",), token_delay: float = 0.0):
+        self.answer = answer
+        self.token_delay = token_delay
+        self.fingerprint = "fake-index"
+        self.embeddings = FakeEmbeddings()
+        self.acts = {act: None for act in acts}
+        self.documents = [
+            Document(
+                page_content=f"{number}. Section text",
+                metadata={"section": number, "title": f"Section {number}", "source": f"{act}/section/{number}",
+                          "act": act}
+            )
+            for act in acts for number in ("1", "2")
+        ]
+        self.queries = []
+        # Queries abandoned part way through their answer
+        self.cancelled = []
+
+    def embed_query(self, query):
+        return self.embeddings.embed_query(query)
+
+    def _retrieve(self, query, acts):
+        self.queries.append((query, acts))
+        if acts is not None and any(act not in self.acts for act in acts):
+            raise ValueError(f"Unknown Acts: {acts}")
+        return [doc for doc in self.documents if acts is None or doc.metadata["act"] in acts]
+
+    def get_answers_and_documents(self, query, acts=None):
+        documents = self._retrieve(query, acts)
+        time.sleep(self.token_delay * len(tokenize(self.answer)))
+        return {"query": query, "result": self.answer, "source_documents": documents}
+
+    def stream_answers_and_documents(self, query, on_documents, on_token, acts=None):
+        documents = self._retrieve(query, acts)
+        on_documents(documents)
+        for token in tokenize(self.answer):
+            time.sleep(self.token_delay)
+            on_token(token)
+        return {"query": query, "result": self.answer, "source_documents": documents}
+
+    async def aget_answers_and_documents(self, query, acts=None):
+        documents = self._retrieve(query, acts)
+        await asyncio.sleep(self.token_delay * len(tokenize(self.answer)))
+        return {"query": query, "result": self.answer, "source_documents": documents}
+
+    async def astream_answers_and_documents(self, query, on_documents, on_token, acts=None):
+        documents = self._retrieve(query, acts)
+        await on_documents(documents)
+        try:
+            for token in tokenize(self.answer):
+                await asyncio.sleep(self.token_delay)
+                await on_token(token)
+        except asyncio.CancelledError:
+            self.cancelled.append(query)
+            raise
+        return {"query": query, "result": self.answer, "source_documents": documents}
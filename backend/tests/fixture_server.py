@@ -0,0 +1,192 @@
+"""Local HTTP server serving CLML fixtures in place of legislation.gov.uk."""
+import hashlib
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from lxml import etree
+
+FIXTURES_DIR = Path(__file__).parent / "tests_logic"
+NAMESPACE = "http://www.legislation.gov.uk/namespaces/legislation"
+
+LEGISLATION_HOST = re.compile(rb"https?://www\.legislation\.gov\.uk")
+SECTION_PATH = re.compile(r"^/ukpga/1977/37/section/([0-9A-Z]+)$")
+
+
+def section_fixture(number: str) -> str:
+    """Return the fixture file served for a section - section 129 has its own, every other section uses section 1."""
+    return "test_section_2.xml" if number == "129" else "test_section.xml"
+
+
+@lru_cache(maxsize=None)
+def build_act_xml(omit: Tuple[str, ...] = ()) -> bytes:
+    """
+    Build a whole-Act document whose body holds the section fixture served for every section in the contents.
+
+    Parameters:
+        omit (Tuple[str, ...]): Section numbers to leave out of the body.
+    """
+    ns = {'leg': NAMESPACE}
+    contents = etree.parse(str(FIXTURES_DIR / "test_xml.xml"))
+    groups = []
+    for item in contents.iterfind('.//leg:ContentsPart/leg:ContentsPblock/leg:ContentsItem', ns):
+        number = item.findtext('leg:ContentsNumber', namespaces=ns)
+        if number in omit:
+            continue
+        section = etree.parse(str(FIXTURES_DIR / section_fixture(number)))
+        group = section.find('.//leg:P1group', ns)
+        group.find('leg:P1', ns).set('DocumentURI', item.get('DocumentURI'))
+        groups.append(etree.tostring(group))
+    return (
+        f'<Legislation xmlns="{NAMESPACE}"><Primary><Body>'.encode()
+        + b"".join(groups)
+        + b'</Body></Primary></Legislation>'
+    )
+
+
+def default_resolver(path: str) -> Optional[bytes]:
+    """
+    Map a resource path to fixture content for the Patents Act 1977.
+
+    The contents path returns the contents fixture, the Act path returns a whole-Act document built from the section
+    fixtures and each section path returns its section fixture.
+    """
+    if path == "/ukpga/1977/37/contents":
+        return (FIXTURES_DIR / "test_xml.xml").read_bytes()
+    if path == "/ukpga/1977/37":
+        return build_act_xml()
+    match = SECTION_PATH.match(path)
+    if match:
+        return (FIXTURES_DIR / section_fixture(match.group(1))).read_bytes()
+    return None
+
+
+def corpus_resolver(acts: Iterable[str]) -> Callable[[str], Optional[bytes]]:
+    """
+    Build a resolver that serves a copy of the Patents Act 1977 fixtures under each of the given Act paths.
+
+    Parameters:
+        acts (Iterable[str]): Act identifiers such as 'ukpga/2000/1'.
+    """
+    acts = set(acts)
+
+    def resolve(path: str) -> Optional[bytes]:
+        match = re.match(r"^/(\w+/\d+/\d+)(.*)$", path)
+        if match is None or match.group(1) not in acts:
+            return None
+        content = default_resolver("/ukpga/1977/37" + match.group(2))
+        if content is None:
+            return None
+        return content.replace(b"/ukpga/1977/37", f"/{match.group(1)}".encode())
+
+    return resolve
+
+
+class ClmlFixtureServer:
+    """
+    Threaded HTTP server that serves CLML fixtures with links rewritten to point back at the server.
+
+    Parameters:
+        resolver (Callable): Maps a resource path (without '/data.xml') to XML bytes, or None for a 404.
+        latency (float): Artificial delay in seconds added to each response.
+        fail_first (int): Number of 503 responses to return for each path before succeeding.
+    """
+
+    def __init__(
+            self,
+            resolver: Callable[[str], Optional[bytes]] = default_resolver,
+            latency: float = 0.0,
+            fail_first: int = 0
+    ):
+        self.resolver = resolver
+        self.latency = latency
+        self.fail_first = fail_first
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def rewrite(self, content: bytes) -> bytes:
+        """Point legislation.gov.uk links in the content at this server."""
+        return LEGISLATION_HOST.sub(self.url.encode(), content)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path.endswith("/data.xml"):
+                    path = path[:-len("/data.xml")]
+                path = path.rstrip("/")
+                with server._lock:
+                    server.requests[path] += 1
+                    attempt = server.requests[path]
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    if attempt <= server.fail_first:
+                        self._respond(503, b"")
+                        return
+                    content = server.resolver(path)
+                    if content is None:
+                        self._respond(404, b"")
+                        return
+                    content = server.rewrite(content)
+                    etag = '"' + hashlib.sha1(content).hexdigest() + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self._respond(304, b"", {"ETag": etag})
+                    else:
+                        self._respond(200, content, {"ETag": etag})
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _respond(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+                with server._lock:
+                    server.statuses[status] += 1
+                self.send_response(status)
+                self.send_header("Content-Type", "application/xml")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "ClmlFixtureServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "ClmlFixtureServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,273 @@
+"""Local stub of the OpenAI HTTP API, for tests and benchmarks that must not call the real service."""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+import aiohttp
+import numpy as np
+import requests
+import requests.adapters
+from langchain.embeddings.base import Embeddings
+
+from common_logic.chunking import estimate_tokens
+
+
+def stub_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic unit vector for a text."""
+    seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Accept bursts of connections from many concurrent clients
+    request_queue_size = 256
+
+
+class StubOpenAIServer:
+    """
+    Threaded HTTP server answering the OpenAI embeddings and chat completions endpoints.
+
+    Point a client at it with openai_api_base=server.url.
+
+    Parameters:
+        latency (float): Seconds each embeddings request takes, regardless of its size.
+        latency_per_input (float): Further seconds for each text in an embeddings request.
+        dimensions (int): Size of the returned embeddings.
+        answer (str): The reply to every chat completion, streamed a word at a time if requested.
+        chat_latency (float): Seconds before the first token of a chat completion.
+        token_latency (float): Seconds between the tokens of a chat completion.
+        requests_per_minute (float): Embeddings requests allowed per period, 0 for no limit.
+        tokens_per_minute (float): Tokens of embedded texts allowed per period, 0 for no limit. Tokens are estimated
+            from the length of texts.
+        limit_period (float): Seconds the limits are given for. The allowances are replenished continuously, as
+            OpenAI's are, and requests over them are answered 429 with a Retry-After header.
+    """
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            latency_per_input: float = 0.0,
+            dimensions: int = 64,
+            answer: str = "The answer",
+            chat_latency: float = 0.0,
+            token_latency: float = 0.0,
+            requests_per_minute: float = 0,
+            tokens_per_minute: float = 0,
+            limit_period: float = 60.0
+    ):
+        self.latency = latency
+        self.latency_per_input = latency_per_input
+        self.dimensions = dimensions
+        self.answer = answer
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.requests = Counter()
+        # Streamed chat completions the client stopped reading before the end
+        self.disconnects = 0
+        self.inputs = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Embeddings requests refused for going over a limit
+        self.throttled = 0
+        self._limits = [
+            [limit, limit / limit_period, limit] for limit in (requests_per_minute, tokens_per_minute)
+        ]
+        self._limits_updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._httpd = _Server(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        """Base URL of the API."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def retry_after(self, body: Dict) -> Optional[float]:
+        """
+        Take an embeddings request from the limits.
+
+        Returns:
+            Optional[float]: None if the request is within the limits, otherwise the seconds until it would be.
+        """
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        costs = (1, sum(estimate_tokens(str(text)) for text in texts))
+        with self._lock:
+            now = time.monotonic()
+            elapsed, self._limits_updated = now - self._limits_updated, now
+            for limit in self._limits:
+                capacity, rate, _ = limit
+                if capacity:
+                    limit[2] = min(capacity, limit[2] + elapsed * rate)
+            waits = [
+                (cost - level) / rate for (capacity, rate, level), cost in zip(self._limits, costs)
+                if capacity and level + 1e-6 < cost
+            ]
+            if waits:
+                self.throttled += 1
+                return max(waits)
+            for limit, cost in zip(self._limits, costs):
+                limit[2] -= cost
+        return None
+
+    def embeddings(self, body: Dict) -> Dict:
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        with self._lock:
+            self.inputs["embeddings"] += len(texts)
+        time.sleep(self.latency + self.latency_per_input * len(texts))
+        return {
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": stub_embedding(str(text), self.dimensions)}
+                for i, text in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}
+        }
+
+    def chat_chunks(self, body: Dict) -> Iterator[Dict]:
+        """Chunks of a streamed chat completion, sleeping as a real model would."""
+        model = body.get("model", "stub")
+        time.sleep(self.chat_latency)
+        yield self._chat_chunk(model, {"role": "assistant", "content": ""})
+        for index, token in enumerate(re.findall(r"\S+\s*", self.answer)):
+            if index:
+                time.sleep(self.token_latency)
+            yield self._chat_chunk(model, {"content": token})
+        yield self._chat_chunk(model, {}, finish_reason="stop")
+
+    @staticmethod
+    def _chat_chunk(model: str, delta: Dict, finish_reason: Optional[str] = None) -> Dict:
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+
+    def chat_completion(self, body: Dict) -> Dict:
+        for _ in self.chat_chunks(body):
+            pass
+        message = {"role": "assistant", "content": self.answer}
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, which would otherwise stall on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                endpoint = self.path.rstrip("/").rsplit("/", 1)[-1]
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests[endpoint] += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    retry_after = server.retry_after(body) if endpoint == "embeddings" else None
+                    if retry_after is not None:
+                        self._respond(
+                            429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                            {"Retry-After": f"{retry_after:.3f}"}
+                        )
+                    elif endpoint == "embeddings":
+                        self._respond(200, server.embeddings(body))
+                    elif endpoint == "completions" and body.get("stream"):
+                        self._stream(server.chat_chunks(body))
+                    elif endpoint == "completions":
+                        self._respond(200, server.chat_completion(body))
+                    else:
+                        self._respond(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _respond(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, chunks: Iterator[Dict]):
+                """Send server-sent events with chunked transfer encoding, as each chunk is produced."""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    with server._lock:
+                        server.disconnects += 1
+                    self.close_connection = True
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubOpenAIServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class StubEmbeddingsClient(Embeddings):
+    """Minimal client for the embeddings endpoint, standing in for OpenAIEmbeddings, which needs tiktoken data."""
+
+    def __init__(self, url: str, model: str = "stub-embeddings"):
+        self.url = url
+        self.model = model
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=64))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        response = self.session.post(f"{self.url}/embeddings", json={"input": texts, "model": self.model})
+        response.raise_for_status()
+        return [item["embedding"] for item in sorted(response.json()["data"], key=lambda item: item["index"])]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{self.url}/embeddings", json={"input": texts, "model": self.model}) as response:
+                response.raise_for_status()
+                data = (await response.json())["data"]
+        return [item["embedding"] for item in sorted(data, key=lambda item: item["index"])]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
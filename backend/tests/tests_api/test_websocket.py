@@ -1,20 +1,252 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
 from fastapi.testclient import TestClient
-from fastapi import WebSocketDisconnect
-from app.main import app
+from prometheus_client import REGISTRY
+from app.main import app, run_in_executor
+from tests.fakes import FakeDataSource
+
+
+@pytest.fixture
+def data_source(monkeypatch):
+    data_source = FakeDataSource()
+    monkeypatch.setattr("app.main.create_data_source", lambda: data_source)
+    return data_source
+
+
+def wait_until_ready(client, timeout=5.0):
+    for _ in range(int(timeout / 0.01)):
+        if client.get("/readyz").status_code == 200:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("Data source did not become ready")
+
+
+def receive_answer(websocket):
+    """Receive the messages for a query up to its final message, returning the streamed ones and the final one."""
+    streamed = []
+    while (message := websocket.receive_json())['state'] == 'STREAMING':
+        streamed.append(message)
+    return streamed, message
+
+
+def test_websocket_connection(data_source):
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        with client.websocket_connect("/ws") as websocket:
+            data = {"query": "What is the meaning of life?"}
+            websocket.send_json(data)
+            response = websocket.receive_json()
+            expected_response = {
+                'query': 'What is the meaning of life?',
+                'result': None,
+                'sources': [],
+                'state': 'PROCESSING'
+            }
+            assert response == expected_response
+            streamed, response = receive_answer(websocket)
+            assert response['state'] == 'SUCCESS'
+            assert response['result'] == 'The answer'
+            assert len(response['sources']) == 2
+            # The sources come first, then the tokens of the answer
+            assert streamed[0]['sources'] == response['sources']
+            assert "".join(message['token'] for message in streamed) == 'The answer'
+            assert [message['token'] for message in streamed[1:]] == ['The ', 'answer']
+
+
+def test_websocket_query_subset_of_acts(monkeypatch):
+    data_source = FakeDataSource(acts=("ukpga/1977/37", "ukpga/2000/1"))
+    monkeypatch.setattr("app.main.create_data_source", lambda: data_source)
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_json({"query": "Patents", "acts": ["ukpga/2000/1"]})
+            assert websocket.receive_json()['state'] == 'PROCESSING'
+            _, response = receive_answer(websocket)
+            assert response['state'] == 'SUCCESS'
+            assert all("ukpga/2000/1" in source['citation'] for source in response['sources'])
+            websocket.send_json({"query": "Patents", "acts": ["ukpga/1999/99"]})
+            assert websocket.receive_json()['state'] == 'PROCESSING'
+            response = websocket.receive_json()
+            assert response['state'] == 'ERROR'
+            assert "ukpga/1999/99" in response['error']
+    assert data_source.queries == [("Patents", ["ukpga/2000/1"])]
+
+
+def test_warming_until_loaded(monkeypatch):
+    loaded = threading.Event()
+    data_source = FakeDataSource()
+
+    def slow_data_source():
+        loaded.wait(5)
+        return data_source
+
+    monkeypatch.setattr("app.main.create_data_source", slow_data_source)
+    with TestClient(app) as client:
+        # The server answers straight away while the data source loads
+        assert client.get("/healthz").json() == {"status": "ok"}
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json() == {"status": "warming"}
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_json({"query": "Patents"})
+            assert websocket.receive_json() == {"query": "Patents", "result": None, "sources": [], "state": "WARMING"}
+            loaded.set()
+            wait_until_ready(client)
+            assert client.get("/readyz").json() == {"status": "ready"}
+            websocket.send_json({"query": "Patents"})
+            assert websocket.receive_json()['state'] == 'PROCESSING'
+            assert receive_answer(websocket)[1]['state'] == 'SUCCESS'
+
+
+def test_failed_warm_up(monkeypatch):
+    def broken_data_source():
+        raise RuntimeError("no legislation")
+
+    monkeypatch.setattr("app.main.create_data_source", broken_data_source)
+    with TestClient(app) as client:
+        for _ in range(500):
+            if client.get("/readyz").json()["status"] != "warming":
+                break
+            threading.Event().wait(0.01)
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json() == {"status": "failed", "error": "no legislation"}
+        assert client.get("/healthz").status_code == 200
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_json({"query": "Patents"})
+            response = websocket.receive_json()
+            assert response['state'] == 'ERROR'
+            assert response['error'] == "no legislation"
+
+
+def test_time_to_first_token(monkeypatch):
+    """The sources and the first token arrive long before generation finishes."""
+    token_delay = 0.05
+    data_source = FakeDataSource(answer=" ".join(["word"] * 20), token_delay=token_delay)
+    monkeypatch.setattr("app.main.create_data_source", lambda: data_source)
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        with client.websocket_connect("/ws") as websocket:
+            start = time.perf_counter()
+            websocket.send_json({"query": "Patents"})
+            assert websocket.receive_json()['state'] == 'PROCESSING'
+            sources = websocket.receive_json()
+            time_to_sources = time.perf_counter() - start
+            first_token = websocket.receive_json()
+            time_to_first_token = time.perf_counter() - start
+            streamed, response = receive_answer(websocket)
+            total = time.perf_counter() - start
+    assert sources['sources'] and sources['token'] == ""
+    assert first_token['token'] == "word "
+    assert len(streamed) == 19
+    assert response['state'] == 'SUCCESS'
+    assert total >= 20 * token_delay
+    assert time_to_sources <= time_to_first_token < total / 4
+
+
+def test_repeated_query_is_answered_from_cache(data_source):
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_json({"query": "What is a patent?"})
+            assert websocket.receive_json()['state'] == 'PROCESSING'
+            _, answer = receive_answer(websocket)
+            websocket.send_json({"query": "what is a patent"})
+            assert websocket.receive_json()['state'] == 'PROCESSING'
+            cached = websocket.receive_json()
+        assert client.get("/stats").json()["answer_cache"]["hits"] == 1
+    assert cached == {**answer, "query": "what is a patent", "cached": True}
+    assert len(data_source.queries) == 1
+
+
+def test_queueing_rejection_and_cancellation(monkeypatch):
+    """One query runs, one waits its turn, the next is turned away, and a client that leaves frees its slot."""
+    monkeypatch.setattr("app.main.QUERY_CONCURRENCY", 1)
+    monkeypatch.setattr("app.main.QUERY_QUEUE_SIZE", 1)
+    data_source = FakeDataSource(answer=" ".join(["word"] * 20), token_delay=0.05)
+    monkeypatch.setattr("app.main.create_data_source", lambda: data_source)
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        with client.websocket_connect("/ws") as running, client.websocket_connect("/ws") as waiting:
+            running.send_json({"query": "First"})
+            assert running.receive_json()['state'] == 'PROCESSING'
+            assert running.receive_json()['state'] == 'STREAMING'
+
+            waiting.send_json({"query": "Second"})
+            assert waiting.receive_json()['state'] == 'PROCESSING'
+            assert waiting.receive_json() == {
+                "query": "Second", "result": None, "sources": [], "state": "QUEUED", "position": 1, "eta": None
+            }
+
+            with client.websocket_connect("/ws") as rejected:
+                rejected.send_json({"query": "Third"})
+                assert rejected.receive_json()['state'] == 'PROCESSING'
+                assert rejected.receive_json()['state'] == 'BUSY'
+
+            # The first client leaves part way through its answer, so the waiting query starts
+            running.close()
+            streamed, response = receive_answer(waiting)
+            assert response['state'] == 'SUCCESS'
+            assert "".join(message['token'] for message in streamed) == data_source.answer
+        stats = client.get("/stats").json()["scheduler"]
+    assert data_source.cancelled == ["First"]
+    assert stats['rejected'] == 1 and stats['queued'] == 1
+    assert stats['active'] == 0 and stats['waiting'] == 0
+
+
+def test_metrics(data_source):
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    before = {stage: sample("query_stage_seconds_count", stage=stage) for stage in ("receive", "post_process", "send")}
+    hits = sample("answer_cache_requests_total", result="hit")
+    misses = sample("answer_cache_requests_total", result="miss")
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        with client.websocket_connect("/ws") as websocket:
+            for _ in range(2):
+                websocket.send_json({"query": "What is a patent?"})
+                websocket.receive_json()
+                receive_answer(websocket)
+        response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for name in ("query_stage_seconds_bucket", "queries_in_flight", "executor_queue_depth",
+                 "answer_cache_requests_total", "embedding_cache_requests_total"):
+        assert name in response.text
+    assert sample("answer_cache_requests_total", result="hit") == hits + 1
+    assert sample("answer_cache_requests_total", result="miss") == misses + 1
+    assert sample("query_stage_seconds_count", stage="receive") == before["receive"] + 2
+    # The answer is post-processed once, and the cached answer is sent without it
+    assert sample("query_stage_seconds_count", stage="post_process") == before["post_process"] + 1
+    # The sources and the answer, then the cached answer
+    assert sample("query_stage_seconds_count", stage="send") == before["send"] + 3
+    assert sample("queries_in_flight") == 0
+
+
+def test_executor_queue_depth_after_cancelled_job(monkeypatch):
+    """A job cancelled before it starts, as when its client leaves, leaves the executor queue."""
+    monkeypatch.setattr("app.main.executor", ThreadPoolExecutor(max_workers=1))
 
-client = TestClient(app)
+    def depth():
+        return REGISTRY.get_sample_value("executor_queue_depth") or 0.0
 
+    before = depth()
+    release = threading.Event()
 
-def test_websocket_connection():
-    with client.websocket_connect("/ws") as websocket:
-        data = {"query": "What is the meaning of life?"}
-        websocket.send_json(data)
-        response = websocket.receive_json()
-        expected_response = {
-            'query': 'What is the meaning of life?',
-            'result': None,
-            'sources': [],
-            'state': 'PROCESSING'
-        }
-        assert response == expected_response
+    async def cancel_queued_job():
+        running = asyncio.ensure_future(run_in_executor(release.wait))
+        queued = asyncio.ensure_future(run_in_executor(lambda: None))
+        await asyncio.sleep(0.05)
+        assert depth() == before + 1
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        release.set()
+        await running
 
+    asyncio.run(cancel_queued_job())
+    assert depth() == before
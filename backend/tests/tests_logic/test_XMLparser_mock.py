@@ -132,9 +132,9 @@ def mock_contents():
 
 @pytest.fixture
 def mock_fetch_simple_xml(mocker):
-    """Mock fetch_xml method to return a dummy BeautifulSoup object."""
-    mock_xml = "<xml>Dummy Data</xml>"
-    return mocker.patch('common_logic.XMLparser.fetch_xml', return_value=mock_xml)
+    """Mock fetch_xml_content method to return dummy XML."""
+    mock_xml = b"<xml>Dummy Data</xml>"
+    return mocker.patch('common_logic.XMLparser.fetch_xml_content', return_value=mock_xml)
 
 
 def test_fetch_section_data(mock_fetch_simple_xml, mock_contents):
@@ -149,4 +149,4 @@ def test_fetch_section_data(mock_fetch_simple_xml, mock_contents):
         for block in part['blocks']:
             for item in block['items']:
                 assert 'xml_data' in item
-                assert item['xml_data'] == "<xml>Dummy Data</xml>"  # This should match your mock XML data
+                assert item['xml_data'].find('xml').text == "Dummy Data"  # This should match your mock XML data
@@ -0,0 +1,106 @@
+"""Tests for the answer cache."""
+import pytest
+from common_logic.answer_cache import AnswerCache, normalize_query
+
+ANSWER = {"result": "A patent may be granted.", "sources": [{"text": "1. Patentable inventions", "citation": "1"}],
+          "state": "SUCCESS"}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def embed(query):
+    """Embeddings where queries about patents are close to each other and far from everything else."""
+    return [1.0, 0.1 * len(query) % 1] if "patent" in query.casefold() else [0.0, 1.0]
+
+
+def test_normalize_query():
+    assert normalize_query("  What is   a Patent? ") == normalize_query("what is a patent") == "what is a patent"
+
+
+def test_exact_hits_and_scopes():
+    cache = AnswerCache()
+    assert cache.get("What is a patent?", "index-1").answer is None
+    cache.put("What is a patent?", "index-1", ANSWER)
+    assert cache.get("what is a PATENT", "index-1").answer == ANSWER
+    # Another index, or another subset of Acts, does not share answers
+    assert cache.get("What is a patent?", "index-2").answer is None
+    assert cache.get("What is a patent?", "index-1", acts=["ukpga/1977/37"]).answer is None
+    cache.put("What is a patent?", "index-1", ANSWER, acts=["ukpga/2000/1", "ukpga/1977/37"])
+    assert cache.get("What is a patent?", "index-1", acts=["ukpga/1977/37", "ukpga/2000/1"]).answer == ANSWER
+    assert cache.stats['hits'] == 2
+    assert cache.stats['misses'] == 3
+
+
+def test_ttl():
+    clock = Clock()
+    cache = AnswerCache(ttl=60, clock=clock)
+    cache.put("What is a patent?", "index", ANSWER)
+    clock.now += 59
+    assert cache.get("What is a patent?", "index").answer == ANSWER
+    clock.now += 2
+    assert cache.get("What is a patent?", "index").answer is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    cache.put("one", "index", ANSWER)
+    cache.put("two", "index", ANSWER)
+    cache.get("one", "index")
+    cache.put("three", "index", ANSWER)
+    assert cache.get("two", "index").answer is None
+    assert cache.get("one", "index").answer == ANSWER
+    assert cache.get("three", "index").answer == ANSWER
+    assert cache.stats['evictions'] == 1
+
+
+def test_near_duplicate_queries():
+    cache = AnswerCache(similarity_threshold=0.95)
+    lookup = cache.get("When can a patent be granted?", "index", embed=embed)
+    assert lookup.answer is None and lookup.embedding is not None
+    cache.put("When can a patent be granted?", "index", ANSWER, embedding=lookup.embedding)
+    assert cache.get("When may a patent be granted", "index", embed=embed).answer == ANSWER
+    assert cache.get("Who owns the copyright?", "index", embed=embed).answer is None
+    assert cache.get("When may a patent be granted", "other-index", embed=embed).answer is None
+    assert cache.stats['semantic_hits'] == 1
+
+
+def test_exact_matching_does_not_embed():
+    cache = AnswerCache()
+
+    def fail(query):
+        raise AssertionError("Queries should not be embedded without a similarity threshold")
+
+    assert cache.get("What is a patent?", "index", embed=fail) == (None, None)
+
+
+def test_disk_tier(tmp_path):
+    clock = Clock()
+    cache = AnswerCache(path=tmp_path / "answers.sqlite3", ttl=60, clock=clock)
+    cache.put("What is a patent?", "index", ANSWER)
+    cache.close()
+    reopened = AnswerCache(path=tmp_path / "answers.sqlite3", ttl=60, clock=clock)
+    assert reopened.get("what is a patent", "index").answer == ANSWER
+    assert reopened.stats['disk_hits'] == 1
+    clock.now += 61
+    reopened.clear()
+    assert reopened.get("what is a patent", "index").answer is None
+    reopened.close()
+
+
+@pytest.mark.parametrize("max_entries", [1, 3])
+def test_disk_tier_is_bounded(tmp_path, max_entries):
+    clock = Clock()
+    cache = AnswerCache(max_entries=max_entries, path=tmp_path / "answers.sqlite3", clock=clock)
+    for query in ["one", "two", "three", "four"]:
+        clock.now += 1
+        cache.put(query, "index", ANSWER)
+    count = cache._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+    assert count == max_entries
+    cache.close()
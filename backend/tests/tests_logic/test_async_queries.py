@@ -0,0 +1,109 @@
+"""Load test of the async query path against stub embedding and chat servers."""
+import asyncio
+import time
+
+import pytest
+from langchain.chat_models import ChatOpenAI
+from langchain.schema.document import Document
+from common_logic.data_source import DataSource
+from common_logic.embedding_store import open_embedding_store
+from tests.stub_server import StubEmbeddingsClient, StubOpenAIServer
+
+ANSWER = "A patent may be granted only for an invention which is new."
+CONCURRENT_QUERIES = 100
+
+
+class DocumentsDataSource(DataSource):
+    """Data source over a fixed list of documents."""
+
+    def __init__(self, documents, **kwargs):
+        super().__init__(**kwargs)
+        self.documents = documents
+
+    def load_data(self):
+        self.data = self.documents
+        self.post_data_load_setup()
+
+
+@pytest.fixture
+def server():
+    with StubOpenAIServer(answer=ANSWER, latency=0.02, chat_latency=0.1, token_latency=0.02) as server:
+        yield server
+
+
+@pytest.fixture
+def data_source(server, tmp_path):
+    documents = [
+        Document(page_content=f"{number}. Section {number} about patents",
+                 metadata={"section": str(number), "title": f"Section {number}", "source": f"section/{number}"})
+        for number in range(1, 51)
+    ]
+    data_source = DocumentsDataSource(
+        documents,
+        embedding_model=StubEmbeddingsClient(server.url),
+        llm=ChatOpenAI(streaming=True, openai_api_base=server.url, openai_api_key="sk-test"),
+        store=open_embedding_store(tmp_path)
+    )
+    data_source.load_data()
+    yield data_source
+    data_source.store.close()
+
+
+def test_many_concurrent_queries_in_one_thread(server, data_source):
+    tokens = {}
+
+    async def ask(number):
+        query = f"Question {number} about patents"
+        tokens[query] = []
+
+        async def on_documents(documents):
+            pass
+
+        async def on_token(token):
+            tokens[query].append(token)
+
+        return await data_source.astream_answers_and_documents(query, on_documents, on_token)
+
+    async def ask_all():
+        return await asyncio.gather(*(ask(number) for number in range(CONCURRENT_QUERIES)))
+
+    start = time.perf_counter()
+    results = asyncio.run(ask_all())
+    elapsed = time.perf_counter() - start
+    one_query = 0.1 + 0.02 * len(ANSWER.split())
+    assert all(result['result'] == ANSWER and len(result['source_documents']) == 4 for result in results)
+    assert all("".join(streamed) == ANSWER for streamed in tokens.values())
+    # Every query was in flight at once, rather than as many as a thread pool has threads
+    assert server.requests["completions"] == CONCURRENT_QUERIES
+    assert server.max_in_flight >= CONCURRENT_QUERIES
+    # Well within the time a pool of 8 threads would take
+    assert elapsed < CONCURRENT_QUERIES / 8 * one_query / 2
+    # Concurrent query embeddings were batched
+    assert data_source.query_embedder.stats['batches'] < CONCURRENT_QUERIES / 4
+
+
+def test_cancelling_a_query_closes_its_llm_request(server, data_source):
+    async def on_documents(documents):
+        pass
+
+    async def ask_then_leave():
+        streamed = []
+
+        async def on_token(token):
+            streamed.append(token)
+
+        task = asyncio.create_task(data_source.astream_answers_and_documents("patents", on_documents, on_token))
+        while len(streamed) < 2:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return streamed
+
+    streamed = asyncio.run(ask_then_leave())
+    assert 2 <= len(streamed) < len(ANSWER.split())
+    for _ in range(100):
+        if server.disconnects:
+            break
+        time.sleep(0.02)
+    assert server.disconnects == 1
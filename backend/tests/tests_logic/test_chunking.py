@@ -0,0 +1,155 @@
+"""Tests for sub-section chunking and the expansion of retrieved chunks to their sections."""
+import re
+from pathlib import Path
+
+import pytest
+from langchain.llms.fake import FakeListLLM
+from langchain.vectorstores import FAISS
+from common_logic.chunking import chunk_section, estimate_tokens
+from common_logic.data_source import LegislationDataSource
+from common_logic.lxml_parser import parse_section
+from common_logic.retrieval import HybridRetriever, RetrievalIndex
+from common_logic.utils import flatten_text
+from tests.fakes import FakeEmbeddings
+from tests.fixture_server import ClmlFixtureServer, default_resolver
+
+FIXTURES_DIR = Path(__file__).parent
+
+
+def parsed(fixture):
+    return parse_section((FIXTURES_DIR / fixture).read_bytes())
+
+
+def test_chunks_are_subsections():
+    title, data = parsed("test_section.xml")
+    chunks = chunk_section("1", title, data, max_tokens=1000)
+    assert [chunk.label for chunk in chunks] == ["1(1)", "1(2)", "1(3)", "1(4)", "1(5)"]
+    assert chunks[0].path == ("1", "1")
+    assert chunks[2].text == (
+        "1. Patentable inventions.\n\n    3) A patent shall not be granted for an invention the commercial "
+        "exploitation of which would be contrary to public policy or morality."
+    )
+    # Together the chunks hold the section as it is flattened
+    assert "\n".join(chunk.text.split("\n\n", 1)[1] for chunk in chunks) == flatten_text(data)
+
+
+def test_long_subsections_are_split_into_paragraphs():
+    title, data = parsed("test_section.xml")
+    chunks = chunk_section("1", title, data, max_tokens=50)
+    labels = [chunk.label for chunk in chunks]
+    assert labels[:6] == ["1(1)", "1(1)(a)", "1(1)(b)", "1(1)(c)", "1(1)(d)", "1(2)"]
+    assert chunks[labels.index("1(1)(b)")].text == (
+        "1. Patentable inventions.\n\n        1) b) it involves an inventive step;"
+    )
+    # The words around the paragraphs stay with their subsection
+    assert "and references in this Act" in chunks[0].text
+    assert "1(3)" in labels
+
+
+def test_section_without_subsections_is_one_chunk():
+    title, data = parsed("test_section_2.xml")
+    chunks = chunk_section("129", title, data, max_tokens=1)
+    assert len(chunks) == 1
+    assert chunks[0].label == "129"
+    assert chunks[0].text == f"129. {title}\n\n{flatten_text(data)}"
+
+
+@pytest.fixture
+def chunked_index():
+    embeddings = FakeEmbeddings()
+    title, data = parsed("test_section.xml")
+    texts, metadatas = [], []
+    for act in ("ukpga/1977/37", "ukpga/2004/16"):
+        for number in ("1", "2"):
+            for i, chunk in enumerate(chunk_section(number, title, data, max_tokens=1000)):
+                texts.append(chunk.text)
+                metadatas.append({
+                    "section": number, "title": title, "source": f"{act}/section/{number}", "act": act,
+                    "label": chunk.label, "chunk": i
+                })
+    vectorstore = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
+    return vectorstore, embeddings, RetrievalIndex.from_vectorstore(vectorstore)
+
+
+def test_subsection_lookup_returns_its_chunk(chunked_index):
+    vectorstore, embeddings, index = chunked_index
+    hybrid = HybridRetriever(
+        vectorstore=vectorstore, embeddings=embeddings, index=index, k=4, filter={"act": "ukpga/2004/16"}
+    )
+    found = hybrid.get_relevant_documents("What does s.2(3) say?")
+    assert [(doc.metadata["act"], doc.metadata["label"]) for doc in found] == [("ukpga/2004/16", "2(3)")]
+    # A reference into a paragraph finds the subsection it is in
+    assert [doc.metadata["label"] for doc in hybrid.get_relevant_documents("s.2(1)(b)")] == ["2(1)"]
+    assert len(hybrid.get_relevant_documents("section 2")) == 4
+
+
+def test_chunks_expand_to_their_section_within_budget(chunked_index):
+    vectorstore, embeddings, index = chunked_index
+    title, data = parsed("test_section.xml")
+    section_text = f"2. {title}\n\n{flatten_text(data)}"
+    section = [p for p, doc in enumerate(index.documents)
+               if doc.metadata["act"] == "ukpga/1977/37" and doc.metadata["section"] == "2"]
+    other = [p for p, doc in enumerate(index.documents) if doc.metadata["section"] == "1"]
+    # Every chunk of the section, in order
+    assert index.section_chunks(section[3]) == section
+
+    expanded = index.expand_sections([section[3], other[0], section[1]], max_tokens=10000)
+    assert [doc.page_content for doc in expanded] == [section_text, section_text.replace("2. ", "1. ", 1)]
+    assert "label" not in expanded[0].metadata and expanded[0].metadata["section"] == "2"
+
+    # Expanding the best chunk alone fits, but not both sections
+    budget = estimate_tokens(section_text) + estimate_tokens(index.documents[other[0]].page_content)
+    expanded = index.expand_sections([section[3], other[0]], max_tokens=budget)
+    assert [doc.page_content for doc in expanded] == [section_text, index.documents[other[0]].page_content]
+    # A chunk whose section does not fit is kept, and the budget left may expand the next
+    expanded = index.expand_sections([section[3], other[0]], max_tokens=budget - 1)
+    assert [doc.page_content for doc in expanded] == [
+        index.documents[section[3]].page_content, section_text.replace("2. ", "1. ", 1)
+    ]
+    assert index.expand_sections([section[3], other[0]], max_tokens=1) == [
+        index.documents[section[3]], index.documents[other[0]]
+    ]
+
+
+def test_data_source_indexes_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    monkeypatch.setattr("common_logic.data_source.SUBSECTION_CHUNKS", True)
+    monkeypatch.setattr("common_logic.data_source.CHUNK_EXPANSION_TOKENS", 0)
+    with ClmlFixtureServer() as server:
+        ds = LegislationDataSource(
+            f"{server.url}/ukpga/1977/37/contents", embedding_model=FakeEmbeddings(),
+            llm=FakeListLLM(responses=["answer"])
+        )
+        ds.load_data(use_cache=False)
+    ids = set(ds.doc_ids)
+    assert f"{server.url}/ukpga/1977/37/section/60/2" in ids
+    # Section 129 has no subsections, so it is indexed whole
+    assert f"{server.url}/ukpga/1977/37/section/129" in ids
+    result = ds.get_answers_and_documents("What does s.60(2) say?")
+    assert [doc.metadata["label"] for doc in result["source_documents"]] == ["60(2)"]
+    assert result["source_documents"][0].page_content.startswith("60. ")
+
+
+def test_unlabelled_subsections_have_unique_ids(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    monkeypatch.setattr("common_logic.data_source.SUBSECTION_CHUNKS", True)
+
+    def unnumbered(path):
+        content = default_resolver(path)
+        return re.sub(rb"<Pnumber[^>]*>.*?</Pnumber>", b"", content, flags=re.S) if content is not None else None
+
+    with ClmlFixtureServer(resolver=unnumbered) as server:
+        ds = LegislationDataSource(
+            f"{server.url}/ukpga/1977/37/contents", embedding_model=FakeEmbeddings(),
+            llm=FakeListLLM(responses=["answer"])
+        )
+        ds.load_data(use_cache=False)
+    assert len(set(ds.doc_ids)) == len(ds.doc_ids)
+    assert len(ds.vectorstore.docstore._dict) == len(ds.data)
+    chunks = [doc for doc in ds.data if doc.metadata["section"] == "60"]
+    assert len(chunks) > 1
+    assert [ds.doc_ids[ds.data.index(doc)] for doc in chunks[:2]] == [
+        f"{server.url}/ukpga/1977/37/section/60/_0", f"{server.url}/ukpga/1977/37/section/60/_1"
+    ]
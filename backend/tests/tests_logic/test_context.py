@@ -0,0 +1,130 @@
+"""Tests for token counting and the assembly of retrieved documents into the LLM's context."""
+import pytest
+from langchain.schema.document import Document
+from langchain.storage import InMemoryStore
+from langchain.vectorstores import FAISS
+from prometheus_client import REGISTRY
+from common_logic.chunking import estimate_tokens
+from common_logic.context import TokenCounter, fit_to_budget, truncate_text
+from common_logic.retrieval import HybridRetriever, RetrievalIndex
+from tests.fakes import FakeEmbeddings
+
+
+class WordEncoding:
+    """Stands in for a tiktoken encoding, with a token per word."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text, disallowed_special=()):
+        self.encoded.append(text)
+        return text.split()
+
+
+def word_counter(store=None):
+    counter = TokenCounter(store)
+    counter._encoding, counter._loaded = WordEncoding(), True
+    return counter
+
+
+def test_token_counts_are_cached():
+    store = InMemoryStore()
+    counter = word_counter(store)
+    assert counter.count(["one two three", "four"]) == [3, 1]
+    assert counter.count(["four", "five six"]) == [1, 2]
+    assert counter.encoding.encoded == ["one two three", "four", "five six"]
+    # Counts are cached per encoding, so another encoding counts again
+    assert all(key.startswith("tiktoken-cl100k_base:") for key in store.yield_keys())
+    assert word_counter(store).count(["one two three"]) == [3]
+
+
+def test_token_counter_estimates_without_the_encoding(monkeypatch):
+    def unavailable(name):
+        raise ConnectionError("offline")
+
+    monkeypatch.setattr("tiktoken.get_encoding", unavailable)
+    counter = TokenCounter(InMemoryStore())
+    assert counter.name == "estimate"
+    assert counter.count(["a" * 40]) == [estimate_tokens("a" * 40)]
+
+
+def test_fit_to_budget():
+    docs = [Document(page_content=text) for text in ("a b c d", "e f g h i j", "k l")]
+    kept, tokens, dropped = fit_to_budget([(doc, len(doc.page_content.split())) for doc in docs], 7)
+    # The second document does not fit, the third still does
+    assert kept == [docs[0], docs[2]]
+    assert (tokens, dropped) == (6, 6)
+    assert fit_to_budget([(docs[1], 6)], 0)[0] == [docs[1]]
+    # The best document is truncated if it does not fit on its own
+    kept, tokens, dropped = fit_to_budget([(docs[1], 6), (docs[0], 4)], 3)
+    assert kept[0].page_content == "e f g"
+    assert (tokens, dropped) == (3, 7)
+
+
+def test_truncate_text_at_a_word_boundary():
+    assert truncate_text("alpha beta gamma delta", 4, 2) == "alpha beta"
+    assert truncate_text("abcdefgh", 4, 2) == "abcd"
+
+
+REPEALED = "Repealed by the Patents Act 2004, section 16 and Schedule 2 paragraph 1, with effect from 1 January 2005"
+
+
+@pytest.fixture
+def repealed():
+    texts = {
+        "1": "Patentable inventions.\n\nA patent may be granted only for an invention which is new.",
+        "2": f"Repealed.\n\n{REPEALED} in England.",
+        "3": f"Repealed.\n\n{REPEALED} in England.",
+        "4": f"Repealed.\n\n{REPEALED}.",
+        "5": "Novelty.\n\nAn invention shall be taken to be new if it does not form part of the state of the art.",
+    }
+    documents = [
+        Document(page_content=f"{number}. {text}", metadata={"section": number, "title": text.split(".")[0]})
+        for number, text in texts.items()
+    ]
+    embeddings = FakeEmbeddings()
+    vectorstore = FAISS.from_documents(documents, embeddings)
+    return vectorstore, embeddings, RetrievalIndex.from_vectorstore(vectorstore, token_counter=TokenCounter())
+
+
+def test_deduplicate_passes_over_near_duplicates(repealed):
+    _, _, index = repealed
+    positions, duplicates, duplicate_tokens = index.deduplicate([1, 2, 3, 0, 4], 3, 0.9)
+    assert positions == [1, 0, 4]
+    assert duplicates == 2
+    assert duplicate_tokens == index.token_count(2) + index.token_count(3)
+    # Only exact duplicates
+    assert index.deduplicate([1, 2, 3, 0, 4], 3, 1.0)[0] == [1, 3, 0]
+
+
+def test_retriever_assembles_context_within_budget(repealed):
+    vectorstore, embeddings, index = repealed
+
+    def saved():
+        return REGISTRY.get_sample_value("context_tokens_saved_sum") or 0.0
+
+    before = saved()
+    hybrid = HybridRetriever(
+        vectorstore=vectorstore, embeddings=embeddings, index=index, k=5, dedup_similarity=0.9
+    )
+    found = hybrid.get_relevant_documents("Which sections were repealed by the Patents Act?")
+    sections = [doc.metadata["section"] for doc in found]
+    # One of the repealed stubs stands for all three
+    assert len(found) == 3 and len({"2", "3", "4"} & set(sections)) == 1
+    dropped = [p for p in (1, 2, 3) if index.documents[p].metadata["section"] not in sections]
+    assert saved() - before == sum(index.token_count(p) for p in dropped)
+
+    hybrid.max_tokens = index.token_count(0) + index.token_count(1)
+    found = hybrid.get_relevant_documents("Which sections were repealed by the Patents Act?")
+    assert sum(index.token_count(int(doc.metadata["section"]) - 1) for doc in found) <= hybrid.max_tokens
+
+    # Sections asked for by number are all returned
+    hybrid.max_tokens = 0
+    assert [doc.metadata["section"] for doc in hybrid.get_relevant_documents("ss. 2 and s.3")] == ["2", "3"]
+
+
+def test_token_counts_are_saved_with_the_index(repealed, tmp_path):
+    _, _, index = repealed
+    index.save(tmp_path)
+    loaded = RetrievalIndex.load(tmp_path, index.documents)
+    assert [loaded.token_count(p) for p in range(5)] == index.tokens.tolist()
@@ -0,0 +1,116 @@
+"""Tests for the multi-Act corpus data source."""
+import pytest
+from langchain.llms.fake import FakeListLLM
+from common_logic.data_source import CorpusDataSource
+from common_logic.utils import act_id
+from tests.fakes import FakeEmbeddings
+from tests.fixture_server import ClmlFixtureServer, corpus_resolver
+
+ACTS = ["ukpga/1977/37", "ukpga/2000/1", "ukpga/2010/15"]
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    # The sections of the fixture Acts are copies of one section, which would be dropped as duplicates
+    monkeypatch.setattr("common_logic.data_source.CONTEXT_DEDUP_SIMILARITY", 0)
+    with ClmlFixtureServer(resolver=corpus_resolver(ACTS)) as server:
+        yield server
+
+
+def make_corpus(server, processes=2, acts=ACTS):
+    return CorpusDataSource(
+        [f"{server.url}/{act}/contents/" for act in acts], processes=processes,
+        embedding_model=FakeEmbeddings(), llm=FakeListLLM(responses=["answer"] * 10)
+    )
+
+
+def test_act_id():
+    assert act_id("https://www.legislation.gov.uk/ukpga/1977/37/contents/") == "ukpga/1977/37"
+    assert act_id("http://127.0.0.1:8000/ukpga/2000/1") == "ukpga/2000/1"
+
+
+@pytest.mark.parametrize("processes", [1, 3])
+def test_corpus_shares_one_index(server, processes):
+    corpus = make_corpus(server, processes=processes)
+    corpus.load_data()
+    assert list(corpus.acts) == ACTS
+    assert len(corpus.vectorstore.index_to_docstore_id) == 3 * 166
+    assert {doc.metadata['act'] for doc in corpus.data} == set(ACTS)
+    for act in ACTS:
+        assert corpus.act_counts[act] == 166
+        assert corpus.acts[act].vectorstore is None
+
+
+def test_query_subset_of_acts(server):
+    corpus = make_corpus(server)
+    corpus.load_data()
+    result = corpus.get_answers_and_documents("Patents Act", acts=["ukpga/2000/1"])
+    assert result['result'] == "answer"
+    assert result['source_documents']
+    assert {doc.metadata['act'] for doc in result['source_documents']} == {"ukpga/2000/1"}
+    result = corpus.get_answers_and_documents("Patents Act")
+    assert len(result['source_documents']) == 4
+    with pytest.raises(ValueError):
+        corpus.get_answers_and_documents("Patents Act", acts=["ukpga/1999/99"])
+
+
+def test_query_referring_to_a_section(server):
+    corpus = make_corpus(server, processes=1)
+    corpus.load_data()
+    result = corpus.get_answers_and_documents("What does s.129 say?", acts=["ukpga/2000/1"])
+    assert [(doc.metadata['act'], doc.metadata['section']) for doc in result['source_documents']] == [
+        ("ukpga/2000/1", "129")
+    ]
+    # Without a subset, the section of every Act
+    result = corpus.get_answers_and_documents("Explain section 129(1)")
+    assert sorted((doc.metadata['act'], doc.metadata['section']) for doc in result['source_documents']) == [
+        (act, "129") for act in ACTS
+    ]
+
+
+def test_section_of_several_acts_is_ranked_by_the_search(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    acts = ["ukpga/2000/1", "ukpga/2005/2", "ukpga/2010/15", "ukpga/2015/4", "ukpga/1977/37"]
+    copies = corpus_resolver(acts)
+
+    def resolve(path):
+        # Only the Patents Act, last in the index, is about patents
+        content = copies(path)
+        if content is None or path.startswith("/ukpga/1977/37"):
+            return content
+        return content.replace(b"patent", b"licence").replace(b"Patent", b"Licence")
+
+    with ClmlFixtureServer(resolver=resolve) as server:
+        corpus = make_corpus(server, processes=1, acts=acts)
+        corpus.load_data()
+    query = "What does section 60 of the Patents Act 1977 say about when a patent is granted?"
+    documents = corpus.get_answers_and_documents(query)['source_documents']
+    assert len(documents) == 4
+    assert (documents[0].metadata['act'], documents[0].metadata['section']) == ("ukpga/1977/37", "60")
+    assert all(doc.metadata['section'] == "60" for doc in documents)
+    # Restricted to one Act, the section is looked up without a search
+    embeddings = corpus.core_embedding_model
+    calls = embeddings.calls
+    documents = corpus.get_answers_and_documents(query, acts=["ukpga/2000/1"])['source_documents']
+    assert [(doc.metadata['act'], doc.metadata['section']) for doc in documents] == [("ukpga/2000/1", "60")]
+    assert embeddings.calls == calls
+
+
+def test_corpus_loads_from_cache(server):
+    make_corpus(server).load_data()
+    downloads = server.statuses[200]
+    corpus = make_corpus(server)
+    corpus.load_data()
+    assert server.statuses[200] == downloads
+    assert len(corpus.data) == 3 * 166
+
+
+def test_corpus_refresh_of_unchanged_acts(server):
+    corpus = make_corpus(server)
+    corpus.load_data()
+    embeddings = corpus.core_embedding_model
+    embeddings.embedded.clear()
+    assert corpus.refresh() == {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 3 * 166}
+    assert embeddings.embedded == []
@@ -0,0 +1,155 @@
+"""Tests for the ingest-time embedding scheduler, against a stub of the embeddings API that enforces rate limits."""
+import time
+
+import openai
+import pytest
+import requests
+from langchain.embeddings.openai import OpenAIEmbeddings
+from langchain.storage import InMemoryStore
+from common_logic.context import TokenCounter
+from common_logic.embedding_scheduler import (
+    Budget, EmbeddingScheduler, _openai_connection_errors, retry_delay, without_retries
+)
+from common_logic.embedding_store import cache_backed_embeddings
+from tests.fakes import FakeEmbeddings
+from tests.stub_server import StubEmbeddingsClient, StubOpenAIServer, stub_embedding
+
+# 40 texts of 25 estimated tokens each
+TEXTS = [f"Section {i:03} " + "word " * 17 + "end" for i in range(40)]
+
+
+def estimating_counter():
+    """A token counter that estimates, as the stub server does, whether or not tiktoken has its encoding."""
+    counter = TokenCounter()
+    counter._loaded = True
+    return counter
+
+
+class FailingEmbeddings(FakeEmbeddings):
+    """Embeddings whose calls fail for good from the given call on."""
+
+    def __init__(self, fail_from: int):
+        super().__init__()
+        self.fail_from = fail_from
+
+    def embed_documents(self, texts):
+        if self.calls + 1 >= self.fail_from:
+            self.calls += 1
+            raise ValueError("invalid input")
+        return super().embed_documents(texts)
+
+
+def test_batches_are_token_sized():
+    scheduler = EmbeddingScheduler(FakeEmbeddings(), max_batch_tokens=10, max_batch_size=3)
+    assert scheduler.batches([4, 4, 4, 20, 1, 1, 1, 1]) == [
+        range(0, 2), range(2, 3), range(3, 4), range(4, 7), range(7, 8)
+    ]
+    assert scheduler.batches([]) == []
+
+
+def test_budget_waits_for_the_allowance():
+    budget = Budget(2, period=1.0)
+    assert budget.reserve(1) == budget.reserve(1) == 0
+    assert budget.reserve(1) == pytest.approx(0.5, abs=0.05)
+    # More than a period's allowance waits no longer than a period
+    assert budget.reserve(5) == pytest.approx(1.5, abs=0.05)
+    assert Budget(0).reserve(100) == 0
+
+
+def test_retry_delay():
+    assert retry_delay(openai.error.RateLimitError("slow down", http_status=429, headers={"retry-after": "2"})) == 2.0
+    response = requests.Response()
+    response.status_code = 503
+    assert retry_delay(requests.HTTPError(response=response)) == 0.0
+    assert retry_delay(requests.ConnectionError()) == 0.0
+    assert retry_delay(openai.error.InvalidRequestError("too long", None, http_status=400)) is None
+    assert retry_delay(ValueError()) is None
+    assert retry_delay(openai.error.APIConnectionError("reset")) == 0.0
+
+
+def test_openai_connection_errors_without_error_module(monkeypatch):
+    class APIConnectionError(Exception):
+        pass
+
+    # openai>=1 has no openai.error module, and its errors are at the top level
+    monkeypatch.delattr(openai, "error")
+    monkeypatch.setattr(openai, "APIConnectionError", APIConnectionError, raising=False)
+    assert _openai_connection_errors() == (APIConnectionError,)
+
+
+def test_without_retries():
+    embeddings = OpenAIEmbeddings(openai_api_key="sk-test")
+    assert without_retries(embeddings).max_retries == 1
+    assert embeddings.max_retries > 1
+    fake = FakeEmbeddings()
+    assert without_retries(fake) is fake
+
+
+def test_batches_are_sent_concurrently():
+    with StubOpenAIServer(latency=0.1, dimensions=8) as server:
+        scheduler = EmbeddingScheduler(
+            StubEmbeddingsClient(server.url), estimating_counter(), max_batch_tokens=100, max_concurrency=4
+        )
+        start = time.perf_counter()
+        vectors = scheduler.embed(TEXTS)
+        elapsed = time.perf_counter() - start
+    assert vectors == [stub_embedding(text, 8) for text in TEXTS]
+    assert server.requests["embeddings"] == 10 and server.max_in_flight == 4
+    # Ten batches of 0.1s, four at a time
+    assert elapsed < 0.6
+    assert scheduler.last_stats.batches == 10 and scheduler.last_stats.tokens == 1000
+
+
+# Limits per second rather than per minute, so that the tests are quick
+LIMITS = dict(requests_per_minute=8, tokens_per_minute=800)
+
+
+def test_scheduler_stays_within_the_limits():
+    with StubOpenAIServer(dimensions=8, limit_period=1.0, **LIMITS) as server:
+        # A little under the server's limits, for the time requests take to reach it
+        scheduler = EmbeddingScheduler(
+            StubEmbeddingsClient(server.url), estimating_counter(), max_batch_tokens=200, period=1.0,
+            **{name: 0.9 * limit for name, limit in LIMITS.items()}
+        )
+        vectors = scheduler.embed(TEXTS)
+    assert vectors == [stub_embedding(text, 8) for text in TEXTS]
+    assert server.throttled == 0 and scheduler.last_stats.retries == 0
+    # 1000 tokens, of which 720 may be sent at once and the rest at 720 a second
+    assert scheduler.last_stats.seconds >= 0.35
+
+
+def test_scheduler_honours_retry_after():
+    with StubOpenAIServer(dimensions=8, limit_period=1.0, **LIMITS) as server:
+        scheduler = EmbeddingScheduler(
+            StubEmbeddingsClient(server.url), estimating_counter(), max_batch_tokens=200, backoff_factor=10
+        )
+        vectors = scheduler.embed(TEXTS)
+    assert vectors == [stub_embedding(text, 8) for text in TEXTS]
+    assert server.throttled > 0 and scheduler.last_stats.retries == server.throttled
+    # Waiting as long as the server asked, rather than backing off for 10s or more
+    assert scheduler.last_stats.seconds < 5
+
+
+def test_failed_batches_are_not_retried():
+    embeddings = FailingEmbeddings(fail_from=1)
+    with pytest.raises(ValueError):
+        EmbeddingScheduler(embeddings, estimating_counter(), max_batch_tokens=100).embed(TEXTS)
+    # The batches already in flight, but no more
+    assert embeddings.calls <= 4
+
+
+def test_interrupted_embedding_resumes_from_the_cache():
+    store = InMemoryStore()
+
+    def cached(embeddings):
+        scheduler = EmbeddingScheduler(embeddings, estimating_counter(), max_batch_tokens=100, max_concurrency=1)
+        return cache_backed_embeddings(embeddings, store, namespace="fake", scheduler=scheduler)
+
+    with pytest.raises(ValueError):
+        cached(FailingEmbeddings(fail_from=3)).embed_documents(TEXTS)
+    # The two batches embedded before the failure were cached
+    assert len(list(store.yield_keys())) == 8
+    embeddings = FakeEmbeddings()
+    vectors = cached(embeddings).embed_documents(TEXTS)
+    assert embeddings.embedded == TEXTS[8:]
+    assert vectors == FakeEmbeddings().embed_documents(TEXTS)
@@ -0,0 +1,92 @@
+"""Tests for the SQLite embedding store."""
+import numpy as np
+import pytest
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from common_logic.embedding_store import (
+    BATCH_SIZE, SQLiteByteStore, cache_backed_embeddings, open_embedding_store, open_token_count_store
+)
+from tests.fakes import FakeEmbeddings
+
+
+class NoEmbeddings(FakeEmbeddings):
+    """Embeddings that fail if the cache misses."""
+
+    def embed_documents(self, texts):
+        raise AssertionError(f"Embedded {len(texts)} texts that should have been cached")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteByteStore(tmp_path / "embeddings.sqlite3")
+    yield store
+    store.close()
+
+
+def test_batched_get_set_delete(store):
+    pairs = [(f"key{i}", f"value{i}".encode()) for i in range(BATCH_SIZE * 2 + 7)]
+    store.mset(pairs)
+    assert len(store) == len(pairs)
+    keys = [key for key, _ in pairs] + ["missing"]
+    assert store.mget(keys) == [value for _, value in pairs] + [None]
+    store.mdelete(["key0", "key1", "missing"])
+    assert store.mget(["key0", "key2"]) == [None, b"value2"]
+    assert sorted(store.yield_keys(prefix="key10")) == sorted(
+        key for key, _ in pairs if key.startswith("key10")
+    )
+
+
+def test_embeddings_are_stored_as_float32(store):
+    embedder = cache_backed_embeddings(FakeEmbeddings(size=16), store, namespace="fake")
+    vectors = embedder.embed_documents(["the patent office", "a patent"])
+    keys = list(store.yield_keys())
+    assert len(keys) == 2 and all(key.startswith("fake") for key in keys)
+    assert [len(value) for value in store.mget(keys)] == [16 * 4, 16 * 4]
+    # Cached vectors come back as float32 values of the computed ones
+    cached = cache_backed_embeddings(NoEmbeddings(size=16), store, namespace="fake")
+    assert np.allclose(cached.embed_documents(["the patent office", "a patent"]), vectors)
+
+
+def test_migrate_from_file_store(tmp_path):
+    texts = [f"section {i}" for i in range(20)]
+    legacy = CacheBackedEmbeddings.from_bytes_store(
+        FakeEmbeddings(), LocalFileStore(tmp_path / "embeddings_cache"), namespace="fake"
+    )
+    vectors = legacy.embed_documents(texts)
+
+    store = open_embedding_store(tmp_path)
+    assert isinstance(store, SQLiteByteStore)
+    assert len(store) == len(texts)
+    assert not (tmp_path / "embeddings_cache").exists()
+    assert (tmp_path / "embeddings_cache.migrated").is_dir()
+    migrated = cache_backed_embeddings(NoEmbeddings(), store, namespace="fake")
+    assert np.allclose(migrated.embed_documents(texts), vectors)
+    store.close()
+
+
+def test_file_store_is_still_available(tmp_path):
+    store = open_embedding_store(tmp_path, "file")
+    assert isinstance(store, LocalFileStore)
+    embedder = cache_backed_embeddings(FakeEmbeddings(), store, namespace="fake")
+    vectors = embedder.embed_documents(["a patent"])
+    cached = CacheBackedEmbeddings.from_bytes_store(NoEmbeddings(), store, namespace="fake")
+    assert cached.embed_documents(["a patent"]) == vectors
+
+
+def test_token_counts_are_kept_apart_from_embeddings(store):
+    embedder = cache_backed_embeddings(FakeEmbeddings(), store, namespace="fake")
+    embedder.embed_documents(["a patent"])
+    # Cached among the embeddings by earlier versions
+    store.mset([("tokens:estimate:abc", b"3")])
+    counts = open_token_count_store(store)
+    assert counts.path == store.path and counts.table != store.table
+    counts.mset([("estimate:abc", b"3")])
+    assert len(store) == 1 and all(key.startswith("fake") for key in store.yield_keys())
+    assert list(counts.yield_keys()) == ["estimate:abc"]
+    counts.close()
+    assert open_token_count_store(LocalFileStore(store.path.parent / "cache")) is None
+
+
+def test_unknown_store(tmp_path):
+    with pytest.raises(ValueError):
+        open_embedding_store(tmp_path, "redis")
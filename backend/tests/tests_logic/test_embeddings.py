@@ -0,0 +1,61 @@
+"""Tests for the embedding providers and the local hashing embeddings."""
+from pathlib import Path
+
+import numpy as np
+import pytest
+from langchain.llms.fake import FakeListLLM
+from common_logic.data_source import LegislationDataSource
+from common_logic.embeddings import HashingEmbeddings, create_embeddings
+from common_logic.lxml_parser import parse_section
+from common_logic.utils import flatten_text
+from tests.fixture_server import ClmlFixtureServer
+
+FIXTURES_DIR = Path(__file__).parent
+
+
+def section_text(fixture, number):
+    title, data = parse_section((FIXTURES_DIR / fixture).read_bytes())
+    return f"{number}. {title}\n\n{flatten_text(data)}"
+
+
+def test_hashing_embeddings_are_unit_vectors_of_the_text_alone():
+    texts = [section_text("test_section.xml", "1"), section_text("test_section_2.xml", "129"), "", "the of and"]
+    vectors = np.array(HashingEmbeddings(dimensions=256).embed_documents(texts))
+    assert vectors.shape == (4, 256)
+    assert np.allclose(np.linalg.norm(vectors[:2], axis=1), 1.0)
+    # Texts without words, once stopwords are left out, have no direction
+    assert not vectors[2:].any()
+    # The same vector whichever batch a text is embedded in, and whichever instance embeds it
+    assert np.array_equal(HashingEmbeddings(dimensions=256).embed_query(texts[1]), vectors[1])
+    assert HashingEmbeddings().model == "hashing-v1-1024"
+
+
+def test_hashing_embeddings_rank_related_text_first():
+    embeddings = HashingEmbeddings()
+    sections = np.array(embeddings.embed_documents(
+        [section_text("test_section.xml", "1"), section_text("test_section_2.xml", "129")]
+    ))
+    assert np.argmax(sections @ embeddings.embed_query("When is a patent granted for an invention?")) == 0
+    assert np.argmax(sections @ embeddings.embed_query("Does the Act bind the Crown?")) == 1
+
+
+def test_create_embeddings():
+    assert create_embeddings("hashing", dimensions=64).dimensions == 64
+    with pytest.raises(ValueError, match="Unknown embedding provider"):
+        create_embeddings("word2vec")
+
+
+def test_data_source_uses_the_configured_provider(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    monkeypatch.setattr("common_logic.data_source.EMBEDDING_PROVIDER", "hashing")
+    monkeypatch.setattr("common_logic.data_source.HASHING_DIMENSIONS", 128)
+    with ClmlFixtureServer() as server:
+        ds = LegislationDataSource(f"{server.url}/ukpga/1977/37/contents", llm=FakeListLLM(responses=["answer"]))
+        ds.load_data(use_cache=False)
+    assert isinstance(ds.core_embedding_model, HashingEmbeddings)
+    # Cached vectors are kept apart from those of other providers
+    assert ds.embedding_namespace == "hashing-v1-128"
+    assert all(key.startswith("hashing-v1-128") for key in ds.store.yield_keys())
+    result = ds.get_answers_and_documents("Does the Act bind the Crown?")
+    assert result["source_documents"][0].metadata["section"] == "129"
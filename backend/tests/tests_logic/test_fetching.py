@@ -0,0 +1,70 @@
+"""Tests for the concurrent section fetcher."""
+import time
+import pytest
+from common_logic.fetching import RateLimiter, SectionFetcher
+from common_logic.XMLparser import UKLegislationParser
+from tests.fixture_server import ClmlFixtureServer
+
+
+@pytest.fixture
+def server():
+    with ClmlFixtureServer() as server:
+        yield server
+
+
+def section_urls(server, numbers):
+    return [f"{server.url}/ukpga/1977/37/section/{n}" for n in numbers]
+
+
+def test_fetch_all_keeps_order_and_runs_concurrently():
+    with ClmlFixtureServer(latency=0.05) as server:
+        fetcher = SectionFetcher(max_workers=4, backoff_factor=0)
+        contents = fetcher.fetch_all(section_urls(server, ["1", "129", "2", "129"]))
+    assert [b'<Pnumber>129</Pnumber>' in c for c in contents] == [False, True, False, True]
+    assert server.max_in_flight > 1
+
+
+def test_fetch_retries_then_succeeds():
+    with ClmlFixtureServer(fail_first=2) as server:
+        fetcher = SectionFetcher(max_workers=1, max_retries=3, backoff_factor=0)
+        content = fetcher.fetch(section_urls(server, ["1"])[0])
+    assert content is not None
+    assert server.requests["/ukpga/1977/37/section/1"] == 3
+
+
+def test_fetch_gives_up_after_max_retries():
+    with ClmlFixtureServer(fail_first=5) as server:
+        fetcher = SectionFetcher(max_workers=1, max_retries=1, backoff_factor=0)
+        assert fetcher.fetch(section_urls(server, ["1"])[0]) is None
+    assert server.requests["/ukpga/1977/37/section/1"] == 2
+
+
+def test_fetch_does_not_retry_not_found(server):
+    fetcher = SectionFetcher(max_workers=1, max_retries=3, backoff_factor=0)
+    assert fetcher.fetch(f"{server.url}/ukpga/1977/37/missing") is None
+    assert server.requests["/ukpga/1977/37/missing"] == 1
+
+
+def test_fetch_timeout():
+    with ClmlFixtureServer(latency=0.5) as server:
+        fetcher = SectionFetcher(max_workers=1, max_retries=0, timeout=0.1)
+        assert fetcher.fetch(section_urls(server, ["1"])[0]) is None
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = RateLimiter(requests_per_second=20)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait("http://example.com/a")
+    limiter.wait("http://other.example.com/a")
+    assert time.monotonic() - start >= 0.2 - 0.01
+
+
+def test_concurrent_parser_matches_sequential(server):
+    contents_url = f"{server.url}/ukpga/1977/37/contents"
+    sequential = UKLegislationParser(contents_url, parse_sections=True)
+    fetcher = SectionFetcher(max_workers=8)
+    concurrent = UKLegislationParser(contents_url, parse_sections=True, fetcher=fetcher)
+    assert len(concurrent.get_section_strings()) == 166
+    assert concurrent.get_section_strings() == sequential.get_section_strings()
+    assert concurrent.get_section_strings()[0].startswith("1. Patentable inventions.\n\n    1) A patent")
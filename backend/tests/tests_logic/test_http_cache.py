@@ -0,0 +1,98 @@
+"""Tests for the persistent conditional-GET HTTP cache."""
+import pytest
+from common_logic.fetching import SectionFetcher
+from common_logic.http_cache import HTTPCache
+from common_logic.utils import fetch_xml
+from tests.fixture_server import ClmlFixtureServer
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = HTTPCache(tmp_path / "http_cache.sqlite3")
+    yield cache
+    cache.close()
+
+
+def test_put_and_get(cache):
+    assert cache.get("http://test.com/data.xml") is None
+    cache.put("http://test.com/data.xml", b"<xml/>", etag='"abc"', last_modified="Wed, 18 Aug 2021 00:00:00 GMT")
+    entry = cache.get("http://test.com/data.xml")
+    assert entry.content == b"<xml/>"
+    assert entry.validators() == {
+        'If-None-Match': '"abc"',
+        'If-Modified-Since': "Wed, 18 Aug 2021 00:00:00 GMT"
+    }
+    assert cache.request_headers("http://test.com/data.xml") == entry.validators()
+
+
+def test_cache_persists_across_instances(tmp_path):
+    cache = HTTPCache(tmp_path / "http_cache.sqlite3")
+    cache.put("http://test.com/data.xml", b"<xml/>", etag='"abc"')
+    cache.close()
+    reopened = HTTPCache(tmp_path / "http_cache.sqlite3")
+    assert reopened.get("http://test.com/data.xml").content == b"<xml/>"
+    reopened.close()
+
+
+def test_lru_eviction(tmp_path):
+    cache = HTTPCache(tmp_path / "http_cache.sqlite3", max_bytes=10)
+    cache.put("a", b"aaaaaa", etag='"a"')
+    cache.put("b", b"bbbb", etag='"b"')
+    cache.touch("a")
+    cache.put("c", b"cccc", etag='"c"')
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.total_bytes() == 10
+    assert cache.stats['evictions'] == 1
+    cache.close()
+
+
+def test_responses_without_validators_are_not_cached(cache):
+    assert cache.resolve("http://test.com/data.xml", 200, b"<xml/>", {}) == b"<xml/>"
+    assert len(cache) == 0
+
+
+def test_fetcher_revalidates_with_conditional_get(cache):
+    with ClmlFixtureServer() as server:
+        fetcher = SectionFetcher(max_workers=2, cache=cache)
+        urls = [f"{server.url}/ukpga/1977/37/section/{n}" for n in ["1", "129"]]
+        first = fetcher.fetch_all(urls)
+        second = fetcher.fetch_all(urls)
+    assert first == second
+    assert server.statuses[200] == 2
+    assert server.statuses[304] == 2
+    assert cache.stats == {'not_modified': 2, 'downloaded': 2, 'evictions': 0}
+
+
+def test_fetch_xml_uses_cache(cache):
+    with ClmlFixtureServer() as server:
+        url = f"{server.url}/ukpga/1977/37/section/1"
+        first = fetch_xml(url, cache=cache)
+        second = fetch_xml(url, cache=cache)
+    assert str(first) == str(second)
+    assert server.statuses[304] == 1
+
+
+def test_fetcher_refetches_entry_evicted_before_not_modified(tmp_path):
+    path = tmp_path / "http_cache.sqlite3"
+
+    class EvictedCache(HTTPCache):
+        """Cache whose entries are evicted by another writer just after their validators are read."""
+
+        def request_headers(self, url):
+            headers = super().request_headers(url)
+            other = HTTPCache(path, max_bytes=2)
+            other.put("other", b"xx", etag='"x"')
+            other.close()
+            return headers
+
+    with ClmlFixtureServer() as server:
+        url = f"{server.url}/ukpga/1977/37/section/1"
+        first = SectionFetcher(max_workers=1, cache=HTTPCache(path)).fetch(url)
+        cache = EvictedCache(path)
+        second = SectionFetcher(max_workers=1, cache=cache).fetch(url)
+    assert second == first
+    assert server.statuses[304] == 1 and server.statuses[200] == 2
+    assert cache.stats['downloaded'] == 1
+    cache.close()
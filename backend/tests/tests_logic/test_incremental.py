@@ -0,0 +1,127 @@
+"""Tests for incremental re-ingestion of legislation."""
+import re
+import pytest
+from langchain.llms.fake import FakeListLLM
+from common_logic.data_source import LegislationDataSource
+from common_logic.manifest import Manifest
+from common_logic.XMLparser import UKLegislationParser
+from tests.fakes import FakeEmbeddings
+from tests.fixture_server import ClmlFixtureServer, build_act_xml, default_resolver
+
+
+class ChangingAct:
+    """Resolver for an Act whose contents and sections can be edited between ingests."""
+
+    def __init__(self):
+        self.removed = set()
+        self.replacements = {}
+
+    def __call__(self, path):
+        if path == "/ukpga/1977/37":
+            content = build_act_xml(omit=tuple(sorted(self.removed)))
+        else:
+            content = default_resolver(path)
+        if content is None:
+            return None
+        if path == "/ukpga/1977/37/contents":
+            for number in self.removed:
+                content = re.sub(
+                    rf'<ContentsItem ContentRef="section-{number}".*?</ContentsItem>'.encode(), b"", content
+                )
+        for old, new in self.replacements.items():
+            content = content.replace(old, new)
+        return content
+
+
+@pytest.fixture
+def act(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    resolver = ChangingAct()
+    resolver.removed = {"5"}
+    with ClmlFixtureServer(resolver=resolver) as server:
+        yield server, resolver
+
+
+def edit_act(resolver):
+    resolver.removed = {"4A"}
+    resolver.replacements = {b"does not affect Her Majesty": b"binds Her Majesty"}
+
+
+@pytest.mark.parametrize("whole_act", [True, False])
+def test_refresh_updates_only_changed_sections(act, monkeypatch, whole_act):
+    server, resolver = act
+    monkeypatch.setattr("common_logic.data_source.WHOLE_ACT_INGEST", whole_act)
+    embeddings = FakeEmbeddings()
+    ds = LegislationDataSource(f"{server.url}/ukpga/1977/37/contents", embedding_model=embeddings,
+                               llm=FakeListLLM(responses=["answer"]))
+    ds.load_data(use_cache=False)
+    assert len(ds.vectorstore.index_to_docstore_id) == 165
+
+    edit_act(resolver)
+    embeddings.embedded.clear()
+    summary = ds.refresh()
+
+    assert summary == {'added': 1, 'changed': 1, 'removed': 1, 'unchanged': 163}
+    assert len(ds.vectorstore.index_to_docstore_id) == 165
+    section_ids = set(ds.vectorstore.index_to_docstore_id.values())
+    assert f"{server.url}/ukpga/1977/37/section/4A" not in section_ids
+    assert f"{server.url}/ukpga/1977/37/section/5" in section_ids
+    changed = ds.vectorstore.docstore.search(f"{server.url}/ukpga/1977/37/section/129")
+    assert "binds Her Majesty" in changed.page_content
+    # Only the added and changed sections were embedded
+    assert len(embeddings.embedded) == 2
+    # The manifest on disk matches the index
+    assert Manifest.load(ds.manifest_path).sections == ds.manifest.sections
+    # The section and lexical indexes follow the vector store
+    assert [doc.metadata['section'] for doc in ds.qa_chain.retriever.get_relevant_documents("s.4A")] != ["4A"]
+    assert ds.qa_chain.retriever.get_relevant_documents("section 129")[0] == changed
+    assert ds.qa_chain.retriever.get_relevant_documents("binds Her Majesty")[0] == changed
+
+
+def test_refresh_reuses_unchanged_sections(act, monkeypatch):
+    server, resolver = act
+    monkeypatch.setattr("common_logic.data_source.WHOLE_ACT_INGEST", False)
+    ds = LegislationDataSource(f"{server.url}/ukpga/1977/37/contents", embedding_model=FakeEmbeddings(),
+                               llm=FakeListLLM(responses=["answer"]))
+    ds.load_data(use_cache=False)
+    edit_act(resolver)
+    ds.refresh()
+    # Only the contents, the new section 5 and the changed section 129 were downloaded again
+    assert server.statuses[200] == 166 + 3
+    assert server.statuses[304] == 163
+    assert len(ds.manifest.sources) == 165
+
+
+def test_refresh_of_unchanged_act_does_nothing(act):
+    server, _ = act
+    embeddings = FakeEmbeddings()
+    ds = LegislationDataSource(f"{server.url}/ukpga/1977/37/contents", embedding_model=embeddings,
+                               llm=FakeListLLM(responses=["answer"]))
+    ds.load_data(use_cache=False)
+    embeddings.embedded.clear()
+    assert ds.refresh() == {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 165}
+    assert embeddings.embedded == []
+
+
+def test_load_from_cache_keeps_manifest(act):
+    server, _ = act
+    url = f"{server.url}/ukpga/1977/37/contents"
+    ds = LegislationDataSource(url, embedding_model=FakeEmbeddings(), llm=FakeListLLM(responses=["answer"]))
+    ds.load_data(use_cache=False)
+    cached = LegislationDataSource(url, embedding_model=FakeEmbeddings(), llm=FakeListLLM(responses=["answer"]))
+    cached.load_data()
+    assert cached.manifest.sources == ds.manifest.sources
+    assert cached.manifest.sections == ds.manifest.sections
+
+
+@pytest.mark.parametrize("engine", ["bs4", "lxml"])
+def test_parser_reuses_unchanged_sections_without_fetcher(act, engine):
+    server, resolver = act
+    url = f"{server.url}/ukpga/1977/37/contents"
+    first = UKLegislationParser(url, parse_sections=True, engine=engine)
+    assert len(first.source_hashes) == 165
+    edit_act(resolver)
+    second = UKLegislationParser(url, parse_sections=True, engine=engine, previous=first,
+                                 previous_source_hashes=first.source_hashes)
+    assert second.stats == {'parsed': 2, 'reused': 163}
@@ -0,0 +1,104 @@
+"""Tests for persisted, fingerprinted FAISS indexes."""
+import pytest
+from langchain.llms.fake import FakeListLLM
+from langchain.schema.document import Document
+from langchain.vectorstores import FAISS
+from common_logic.data_source import LegislationDataSource
+from common_logic.index_store import FINGERPRINT_FILE, index_fingerprint, load_index, read_fingerprint, save_index
+from tests.fakes import FakeEmbeddings
+from tests.fixture_server import ClmlFixtureServer, default_resolver
+
+DOCUMENTS = [Document(page_content=f"section {i} about patents", metadata={'section': str(i)}) for i in range(10)]
+IDS = [f"id{i}" for i in range(10)]
+
+
+def test_fingerprint_covers_inputs():
+    fingerprint = index_fingerprint(IDS, DOCUMENTS, "model", {'index': 'IndexFlatL2'})
+    assert fingerprint == index_fingerprint(IDS, list(DOCUMENTS), "model", {'index': 'IndexFlatL2'})
+    changed = DOCUMENTS[:-1] + [Document(page_content="changed", metadata={'section': '9'})]
+    assert fingerprint != index_fingerprint(IDS, changed, "model", {'index': 'IndexFlatL2'})
+    assert fingerprint != index_fingerprint(IDS, DOCUMENTS, "other-model", {'index': 'IndexFlatL2'})
+    assert fingerprint != index_fingerprint(IDS, DOCUMENTS, "model", {'index': 'IndexHNSWFlat'})
+    assert fingerprint != index_fingerprint(IDS[::-1], DOCUMENTS[::-1], "model", {'index': 'IndexFlatL2'})
+
+
+def test_save_and_load(tmp_path):
+    embeddings = FakeEmbeddings()
+    vectorstore = FAISS.from_documents(DOCUMENTS, embeddings, ids=IDS)
+    save_index(vectorstore, tmp_path, "abc")
+    assert read_fingerprint(tmp_path) == "abc"
+    assert load_index(tmp_path, "other", embeddings) is None
+    loaded = load_index(tmp_path, "abc", embeddings)
+    assert loaded.index.ntotal == 10
+    assert loaded.index_to_docstore_id == vectorstore.index_to_docstore_id
+    query = "section 3 about patents"
+    assert loaded.similarity_search(query, k=3) == vectorstore.similarity_search(query, k=3)
+    # The loaded index can still be updated in place
+    loaded.delete(["id0"])
+    assert loaded.index.ntotal == 9
+
+
+def test_incomplete_save_is_not_loaded(tmp_path):
+    save_index(FAISS.from_documents(DOCUMENTS, FakeEmbeddings(), ids=IDS), tmp_path, "abc")
+    (tmp_path / FINGERPRINT_FILE).unlink()
+    assert load_index(tmp_path, "abc", FakeEmbeddings()) is None
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    with ClmlFixtureServer() as server:
+        yield server
+
+
+def make_source(server, embeddings=None):
+    return LegislationDataSource(
+        f"{server.url}/ukpga/1977/37/contents", embedding_model=embeddings or FakeEmbeddings(),
+        llm=FakeListLLM(responses=["answer"])
+    )
+
+
+def test_startup_loads_saved_index(server, monkeypatch, tmp_path):
+    built = make_source(server)
+    built.load_data()
+    assert (tmp_path / "indexes").is_dir()
+
+    def rebuild(*args, **kwargs):
+        raise AssertionError("The index should not be rebuilt")
+
+    monkeypatch.setattr(FAISS, "from_documents", rebuild)
+    embeddings = FakeEmbeddings()
+    loaded = make_source(server, embeddings)
+    loaded.load_data()
+    assert embeddings.calls == 0
+    assert loaded.vectorstore.index.ntotal == built.vectorstore.index.ntotal
+    assert loaded.get_answers_and_documents("patent")['source_documents'] == \
+        built.get_answers_and_documents("patent")['source_documents']
+
+
+def test_changed_inputs_rebuild_index(server, tmp_path):
+    make_source(server).load_data()
+    other_model = FakeEmbeddings()
+    other_model.model = "other-embeddings"
+    source = make_source(server, other_model)
+    source.load_data()
+    assert other_model.calls > 0
+    assert read_fingerprint(source.index_dir) == source.index_fingerprint()
+
+
+def test_refresh_saves_index(server):
+    source = make_source(server)
+    source.load_data()
+    fingerprint = read_fingerprint(source.index_dir)
+    server.resolver = lambda path: default_resolver(path).replace(b"does not affect", b"binds")
+    assert source.refresh()['changed'] == 1
+    assert read_fingerprint(source.index_dir) == source.index_fingerprint() != fingerprint
+
+
+def test_persistence_can_be_disabled(server, monkeypatch, tmp_path):
+    monkeypatch.setattr("common_logic.data_source.PERSIST_INDEX", False)
+    source = make_source(server)
+    source.load_data()
+    assert source.index_dir is None
+    assert not (tmp_path / "indexes").exists()
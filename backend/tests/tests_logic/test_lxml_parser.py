@@ -0,0 +1,75 @@
+"""Tests for the streaming lxml section parsing engine."""
+import pytest
+from bs4 import BeautifulSoup
+from common_logic.lxml_parser import parse_section
+from common_logic.fetching import SectionFetcher
+from common_logic.utils import parse_recursive, flatten_text
+from common_logic.XMLparser import UKLegislationParser
+from tests.fixture_server import ClmlFixtureServer
+from tests.tests_logic import CURRENT_DIR
+
+SNIPPET = b"""<Legislation xmlns="http://www.legislation.gov.uk/namespaces/legislation">
+<Primary><Body><P1group><Title>Sample <Emphasis>title</Emphasis>.</Title>
+<P1><Pnumber>60</Pnumber><P1para>
+  <Text>Opening <Citation>words</Citation>
+     spread   over lines<!-- a comment --><CommentaryRef Ref="c1"/>;</Text>
+  <P2><Pnumber><Addition>2</Addition></Pnumber><P2para>
+    <Text>nested</Text>
+    <P3><Pnumber>a</Pnumber><P3para><Text>deeper</Text></P3para></P3>
+    <P4><Pnumber>i</Pnumber><P4para><Text>skipped level</Text></P4para></P4>
+    <BlockAmendment><P1><Pnumber>99</Pnumber><P1para><Text>amended</Text></P1para></P1></BlockAmendment>
+  </P2para></P2>
+  <Text>Closing</Text>
+</P1para></P1></P1group>
+<P1group><Title>Second</Title><P1><Pnumber>61</Pnumber></P1></P1group>
+</Body></Primary></Legislation>"""
+
+
+def parse_with_bs4(content):
+    soup = BeautifulSoup(content, 'xml')
+    title_element = soup.select_one('P1group > Title')
+    title = title_element.text.strip() if title_element else None
+    return title, parse_recursive(soup.find('P1'))
+
+
+@pytest.mark.parametrize("content", [
+    pytest.param((CURRENT_DIR / name).read_bytes(), id=name)
+    for name in ["test_section.xml", "test_section_2.xml", "test_xml.xml"]
+] + [pytest.param(SNIPPET, id="snippet")])
+def test_parity_with_bs4(content):
+    expected_title, expected_data = parse_with_bs4(content)
+    title, parsed_data = parse_section(content)
+    assert title == expected_title
+    assert parsed_data == expected_data
+    assert flatten_text(parsed_data) == flatten_text(expected_data)
+
+
+def test_parse_section_snippet():
+    title, parsed_data = parse_section(SNIPPET)
+    assert title == "Sample title."
+    assert parsed_data['label'] == "60"
+    assert parsed_data['text'][0] == "Opening words spread over lines;"
+    assert parsed_data['text'][1] == {'text': ["nested", {'text': ["deeper"], 'label': "a"}], 'label': "2"}
+    assert parsed_data['text'][2] == "Closing"
+
+
+def test_parse_section_without_content():
+    assert parse_section(None) == (None, {})
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        UKLegislationParser('dummy_uri', engine="regex")
+
+
+def test_parser_with_lxml_engine():
+    with ClmlFixtureServer() as server:
+        parser = UKLegislationParser(
+            f"{server.url}/ukpga/1977/37/contents", parse_sections=True,
+            fetcher=SectionFetcher(max_workers=8), engine="lxml"
+        )
+    sections = parser.get_section_dicts()
+    assert len(sections) == 166
+    title, parsed_data = parse_with_bs4((CURRENT_DIR / "test_section.xml").read_bytes())
+    assert sections[0]['title'] == title
+    assert sections[0]['flattened_text'] == f"1. {title}\n\n{flatten_text(parsed_data)}"
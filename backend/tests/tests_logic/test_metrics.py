@@ -0,0 +1,87 @@
+"""Tests for the Prometheus metrics of the ingestion and query pipelines."""
+import pytest
+from langchain.llms.fake import FakeListLLM
+from prometheus_client import REGISTRY
+from common_logic.data_source import LegislationDataSource
+from common_logic.metrics import render_metrics
+from tests.fakes import FakeEmbeddings
+from tests.fixture_server import ClmlFixtureServer
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    with ClmlFixtureServer() as server:
+        yield server
+
+
+def sample(name, labels=()):
+    return REGISTRY.get_sample_value(name, dict(labels)) or 0.0
+
+
+class Counts:
+    """Increase of metric samples since it was created."""
+
+    def __init__(self, *samples):
+        self.before = {sample_: sample(*sample_) for sample_ in samples}
+
+    def __getitem__(self, sample_):
+        return sample(*sample_) - self.before[sample_]
+
+
+FETCHED = ("legislation_fetches_total", (("outcome", "downloaded"),))
+PARSED = ("legislation_sections_total", (("outcome", "parsed"),))
+ACT_PARSES = ("legislation_act_parse_seconds_count", ())
+BUILDS = ("index_build_seconds_count", (("operation", "build"),))
+LOADS = ("index_build_seconds_count", (("operation", "load"),))
+MISSES = ("embedding_cache_requests_total", (("result", "miss"),))
+HITS = ("embedding_cache_requests_total", (("result", "hit"),))
+EMBEDS = ("query_stage_seconds_count", (("stage", "embed"),))
+RETRIEVALS = ("query_stage_seconds_count", (("stage", "retrieve"),))
+LLM_CALLS = ("query_stage_seconds_count", (("stage", "llm"),))
+
+
+def make_source(server):
+    return LegislationDataSource(
+        f"{server.url}/ukpga/1977/37/contents", embedding_model=FakeEmbeddings(),
+        llm=FakeListLLM(responses=["answer"] * 3)
+    )
+
+
+def test_ingestion_metrics(server, monkeypatch):
+    counts = Counts(FETCHED, PARSED, ACT_PARSES, BUILDS, LOADS, MISSES, HITS)
+    ds = make_source(server)
+    ds.load_data()
+    # The contents and the whole Act
+    assert counts[FETCHED] == 2
+    assert counts[ACT_PARSES] == 1
+    assert counts[PARSED] == len(ds.data)
+    assert counts[BUILDS] == 1 and counts[LOADS] == 0
+    assert counts[MISSES] == len(ds.data) and counts[HITS] == 0
+
+    # The saved index is loaded next time, and rebuilding it finds every embedding in the cache
+    make_source(server).load_data()
+    assert counts[LOADS] == 1
+    monkeypatch.setattr("common_logic.data_source.PERSIST_INDEX", False)
+    make_source(server).load_data()
+    assert counts[BUILDS] == 2
+    assert counts[MISSES] == len(ds.data) and counts[HITS] == len(ds.data)
+
+
+def test_query_stage_metrics(server):
+    ds = make_source(server)
+    ds.load_data()
+    counts = Counts(EMBEDS, RETRIEVALS, LLM_CALLS)
+    ds.stream_answers_and_documents("patentable inventions", lambda documents: None, lambda token: None)
+    assert (counts[EMBEDS], counts[RETRIEVALS], counts[LLM_CALLS]) == (1, 1, 1)
+    # Queries referring to a section by number are not embedded
+    ds.stream_answers_and_documents("What does s.60 say?", lambda documents: None, lambda token: None)
+    assert (counts[EMBEDS], counts[RETRIEVALS], counts[LLM_CALLS]) == (1, 2, 2)
+
+
+def test_render_metrics():
+    content, content_type = render_metrics()
+    assert content_type.startswith("text/plain")
+    assert b"# TYPE query_stage_seconds histogram" in content
+    assert b"# TYPE legislation_fetches_total counter" in content
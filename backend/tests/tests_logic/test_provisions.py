@@ -0,0 +1,73 @@
+"""Tests for the slotted section model and its text renderer."""
+import copy
+from pathlib import Path
+
+import pytest
+from common_logic.lxml_parser import parse_body_sections, parse_section
+from common_logic.provisions import Provision, Section, render
+from common_logic.utils import flatten_text, parse_xml, parse_recursive
+from tests.fixture_server import build_act_xml
+from tests.tests_logic.test_utils import nested_data
+
+FIXTURES_DIR = Path(__file__).parent
+
+EDGE_CASES = [
+    {},
+    {'label': '1'},
+    {'text': []},
+    {'text': [{}, 'after an empty provision', {'label': 'a'}, {'text': []}]},
+    {'text': ['no label', {'text': ['unlabelled', {'text': ['deep'], 'label': 'i'}, 'tail']}], 'label': '2'},
+    {'text': [{'text': [{'text': [{'text': ['first line'], 'label': 'i'}, 'second'], 'label': 'a'}], 'label': '1'}]},
+]
+
+
+def parsed_sections():
+    sections = [nested_data, *EDGE_CASES]
+    for fixture in ("test_section.xml", "test_section_2.xml"):
+        content = (FIXTURES_DIR / fixture).read_bytes()
+        sections.append(parse_section(content)[1])
+        sections.append(parse_recursive(parse_xml(content).find('P1')))
+    return sections
+
+
+@pytest.mark.parametrize("data", parsed_sections())
+def test_render_matches_flatten_text(data):
+    provision = Provision.from_dict(data)
+    assert render(provision) == flatten_text(data)
+    assert provision.render(prefix="1) ", depth=1) == flatten_text(data, prefix="1) ", depth=1)
+
+
+@pytest.mark.parametrize("data", parsed_sections())
+def test_provisions_round_trip(data):
+    original = copy.deepcopy(data)
+    assert Provision.from_dict(data).to_dict() == original
+    assert data == original
+
+
+def test_whole_act_renders_identically():
+    sections = parse_body_sections(build_act_xml())
+    assert len(sections) > 1
+    for section in sections.values():
+        assert render(Provision.from_dict(section['parsed_data'])) == flatten_text(section['parsed_data'])
+
+
+def test_provision_tree():
+    provision = Provision.from_dict(nested_data)
+    assert provision.label == '1'
+    assert [child.label for child in provision.text] == ['1', '2', '3', '4', '5']
+    assert provision.text[0].text[1] == Provision(['the invention is new;'], 'a')
+    assert Provision.from_dict({}) == Provision()
+
+
+def test_section_round_trip():
+    content = (FIXTURES_DIR / "test_section.xml").read_bytes()
+    title, data = parse_section(content)
+    item = {
+        'number': '1', 'title': title, 'IdURI': 'http://www.legislation.gov.uk/id/ukpga/1977/37/section/1',
+        'DocumentURI': 'http://www.legislation.gov.uk/ukpga/1977/37/section/1', 'parsed_data': data,
+        'flattened_text': f"1. {title}\n\n{flatten_text(data)}"
+    }
+    section = Section.from_dict({**item, 'xml_data': content})
+    assert section.render() == item['flattened_text']
+    assert section.to_dict() == item
+    assert Section.from_dict(section.to_dict()) == section
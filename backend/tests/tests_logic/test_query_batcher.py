@@ -0,0 +1,114 @@
+"""Tests for micro-batched query embedding."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain.llms.fake import FakeListLLM
+from common_logic.data_source import LegislationDataSource
+from common_logic.query_batcher import QueryEmbeddingBatcher
+from tests.fakes import FakeEmbeddings
+from tests.fixture_server import ClmlFixtureServer
+
+QUERIES = [f"query number {i} about patents" for i in range(40)]
+
+
+class SlowEmbeddings(FakeEmbeddings):
+    """Embeddings that record the size of each call and wait on a barrier before the first one returns."""
+
+    def __init__(self, release: threading.Event = None):
+        super().__init__()
+        self.batch_sizes = []
+        self.release = release
+
+    def embed_documents(self, texts):
+        if self.release is not None:
+            self.release.wait(5)
+        self.batch_sizes.append(len(texts))
+        return super().embed_documents(texts)
+
+
+def test_concurrent_queries_are_batched():
+    model = SlowEmbeddings()
+    batcher = QueryEmbeddingBatcher(model, max_batch_size=16, max_wait=0.05)
+    with ThreadPoolExecutor(max_workers=len(QUERIES)) as pool:
+        vectors = list(pool.map(batcher.embed_query, QUERIES))
+    batcher.close()
+    assert vectors == [FakeEmbeddings().embed_query(query) for query in QUERIES]
+    assert sum(model.batch_sizes) == len(QUERIES)
+    assert max(model.batch_sizes) <= 16
+    assert len(model.batch_sizes) < len(QUERIES) / 4
+    assert batcher.stats == {'queries': len(QUERIES), 'batches': len(model.batch_sizes)}
+
+
+def test_queries_wait_for_the_batch_in_progress():
+    release = threading.Event()
+    model = SlowEmbeddings(release)
+    batcher = QueryEmbeddingBatcher(model, max_batch_size=64, max_wait=0.0)
+    with ThreadPoolExecutor(max_workers=len(QUERIES)) as pool:
+        futures = [pool.submit(batcher.embed_query, query) for query in QUERIES]
+        # The first batch is held up, so the rest queue behind it and are embedded together
+        threading.Event().wait(0.1)
+        release.set()
+        results = [future.result() for future in futures]
+    batcher.close()
+    assert len(results) == len(QUERIES)
+    assert len(model.batch_sizes) <= 3
+
+
+def test_errors_reach_every_caller():
+    class Failing(FakeEmbeddings):
+        def embed_documents(self, texts):
+            raise RuntimeError("embedding service unavailable")
+
+    batcher = QueryEmbeddingBatcher(Failing(), max_wait=0.05)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(batcher.embed_query, query) for query in QUERIES[:4]]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
+    # The batcher keeps working after a failed batch
+    batcher.embeddings = FakeEmbeddings()
+    assert batcher.embed_query("patents") == FakeEmbeddings().embed_query("patents")
+    batcher.close()
+
+
+def test_documents_are_not_batched():
+    documents = FakeEmbeddings()
+    batcher = QueryEmbeddingBatcher(FakeEmbeddings(), document_embeddings=documents)
+    batcher.embed_documents(["one", "two"])
+    assert documents.embedded == ["one", "two"]
+    assert batcher.stats['batches'] == 0
+
+
+def test_data_source_batches_retrieval_queries(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    # The sections of the fixture Acts are copies of one section, which would be dropped as duplicates
+    monkeypatch.setattr("common_logic.data_source.CONTEXT_DEDUP_SIMILARITY", 0)
+    with ClmlFixtureServer() as server:
+        source = LegislationDataSource(
+            f"{server.url}/ukpga/1977/37/contents", embedding_model=FakeEmbeddings(),
+            llm=FakeListLLM(responses=["answer"])
+        )
+        source.load_data()
+    assert isinstance(source.query_embedder, QueryEmbeddingBatcher)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(source.get_answers_and_documents, QUERIES[:8]))
+    assert all(len(result['source_documents']) == 4 for result in results)
+    assert source.query_embedder.stats['queries'] == 8
+    source.query_embedder.close()
+
+
+def test_async_queries_are_batched_on_the_event_loop():
+    model = SlowEmbeddings()
+    batcher = QueryEmbeddingBatcher(model, max_batch_size=16, max_wait=0.05)
+
+    async def embed_all():
+        return await asyncio.gather(*(batcher.aembed_query(query) for query in QUERIES))
+
+    vectors = asyncio.run(embed_all())
+    assert vectors == [FakeEmbeddings().embed_query(query) for query in QUERIES]
+    # Full batches are sent straight away, and the remainder once the wait is over
+    assert model.batch_sizes == [16, 16, 8]
+    assert batcher._thread is None
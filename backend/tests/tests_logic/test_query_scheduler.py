@@ -0,0 +1,110 @@
+"""Tests for admission control of queries."""
+import asyncio
+
+import pytest
+from common_logic.query_scheduler import QueryScheduler, SchedulerBusy
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def hold(scheduler, events, name, release, on_queued=None):
+    async with scheduler.slot(on_queued):
+        events.append(('start', name))
+        await release.wait()
+    events.append(('end', name))
+
+
+def test_admits_up_to_the_limit_then_queues_in_order():
+    async def scenario():
+        scheduler = QueryScheduler(max_concurrent=2, max_queued=10)
+        events = []
+        releases = {name: asyncio.Event() for name in "abcd"}
+        positions = {name: [] for name in "abcd"}
+
+        def on_queued(name):
+            async def report(position, eta):
+                positions[name].append(position)
+            return report
+
+        tasks = {name: asyncio.create_task(hold(scheduler, events, name, releases[name], on_queued(name)))
+                 for name in "abcd"}
+        await asyncio.sleep(0.01)
+        assert events == [('start', 'a'), ('start', 'b')]
+        assert (scheduler.active, scheduler.waiting) == (2, 2)
+        releases['b'].set()
+        await asyncio.sleep(0.01)
+        assert events[2:] == [('end', 'b'), ('start', 'c')]
+        for name in "acd":
+            releases[name].set()
+        await asyncio.gather(*tasks.values())
+        assert (scheduler.active, scheduler.waiting) == (0, 0)
+        assert positions == {'a': [], 'b': [], 'c': [1], 'd': [2, 1]}
+        assert scheduler.stats['admitted'] == 4 and scheduler.stats['queued'] == 2
+
+    run(scenario())
+
+
+def test_rejects_when_the_queue_is_full():
+    async def scenario():
+        scheduler = QueryScheduler(max_concurrent=1, max_queued=1)
+        release = asyncio.Event()
+        events = []
+        running = asyncio.create_task(hold(scheduler, events, 'a', release))
+        waiting = asyncio.create_task(hold(scheduler, events, 'b', release))
+        await asyncio.sleep(0.01)
+        with pytest.raises(SchedulerBusy):
+            await scheduler.acquire()
+        assert scheduler.stats['rejected'] == 1
+        release.set()
+        await asyncio.gather(running, waiting)
+        assert [name for kind, name in events if kind == 'start'] == ['a', 'b']
+
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = QueryScheduler(max_concurrent=1, max_queued=2)
+        release = asyncio.Event()
+        events = []
+        positions = []
+
+        async def report(position, eta):
+            positions.append(position)
+
+        running = asyncio.create_task(hold(scheduler, events, 'a', release))
+        abandoned = asyncio.create_task(hold(scheduler, events, 'b', release))
+        behind = asyncio.create_task(hold(scheduler, events, 'c', release, report))
+        await asyncio.sleep(0.01)
+        abandoned.cancel()
+        await asyncio.sleep(0.01)
+        # The query behind moves up, and a new query can queue in the freed place
+        assert positions == [2, 1]
+        assert scheduler.waiting == 1
+        release.set()
+        await asyncio.gather(running, behind)
+        assert [name for kind, name in events if kind == 'start'] == ['a', 'c']
+        assert scheduler.stats['cancelled'] == 1
+        assert (scheduler.active, scheduler.waiting) == (0, 0)
+
+    run(scenario())
+
+
+def test_eta_from_query_durations():
+    async def scenario():
+        scheduler = QueryScheduler(max_concurrent=2, max_queued=2, smoothing=0.5)
+        assert scheduler.eta(1) is None
+        async with scheduler.slot():
+            await asyncio.sleep(0.05)
+        assert scheduler.average_duration == pytest.approx(0.05, abs=0.03)
+        assert scheduler.eta(4) == pytest.approx(2 * scheduler.average_duration)
+        # A query that fails part way does not count towards the estimate
+        average = scheduler.average_duration
+        with pytest.raises(RuntimeError):
+            async with scheduler.slot():
+                raise RuntimeError()
+        assert scheduler.average_duration == average and scheduler.active == 0
+
+    run(scenario())
@@ -0,0 +1,94 @@
+"""Tests for hybrid lexical and vector retrieval and section number lookup."""
+import asyncio
+
+import pytest
+from langchain.schema.document import Document
+from langchain.vectorstores import FAISS
+from common_logic.retrieval import (
+    HybridRetriever, RetrievalIndex, SectionReference, parse_section_references, reciprocal_rank_fusion
+)
+from tests.fakes import FakeEmbeddings
+
+TEXTS = {
+    "1": "Patentable inventions. A patent may be granted only for an invention which is new.",
+    "2": "Novelty. An invention shall be taken to be new if it does not form part of the state of the art.",
+    "30": "Nature of, and transactions in, patents. Any patent may be assigned or mortgaged.",
+    "46": "Patentee's application for entry in register that licences are available as of right, "
+          "including an exclusive licence.",
+    "60": "Meaning of infringement. A person infringes a patent if he makes, disposes of or uses the product.",
+    "4A": "Methods of treatment or diagnosis. A patent shall not be granted for a method of treatment.",
+}
+
+
+def documents(acts=("ukpga/1977/37",)):
+    return [
+        Document(page_content=f"{number}. {text}", metadata={"section": number, "act": act, "title": text[:20]})
+        for act in acts for number, text in TEXTS.items()
+    ]
+
+
+@pytest.fixture
+def embeddings():
+    return FakeEmbeddings()
+
+
+def retriever(embeddings, docs, **kwargs):
+    vectorstore = FAISS.from_documents(docs, embeddings)
+    return HybridRetriever(
+        vectorstore=vectorstore, embeddings=embeddings, index=RetrievalIndex.from_vectorstore(vectorstore), **kwargs
+    )
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("What does s.60 say?", [SectionReference("60")]),
+    ("s60 and ss. 2", [SectionReference("60"), SectionReference("2")]),
+    ("Explain section 2(1)", [SectionReference("2", ("1",))]),
+    ("sec. 4a(2)(b) and Section 4A", [SectionReference("4A", ("2", "b")), SectionReference("4A")]),
+    ("Who owns the patent's 5 claims?", []),
+    ("exclusive licence", []),
+])
+def test_parse_section_references(query, expected):
+    assert parse_section_references(query) == expected
+
+
+def test_section_reference_label():
+    assert SectionReference("60", ("2", "a")).label == "60(2)(a)"
+
+
+def test_reciprocal_rank_fusion():
+    # Ranked second by both beats ranked first by one
+    assert reciprocal_rank_fusion([[1, 2, 3], [4, 2, 5]])[:1] == [2]
+    assert set(reciprocal_rank_fusion([[1], [], [6]])) == {1, 6}
+
+
+def test_lexical_search_ranks_exact_terms():
+    index = RetrievalIndex(documents())
+    positions = index.lexical_search("exclusive licence", 3)
+    assert index.documents[positions[0]].metadata["section"] == "46"
+    assert len(positions) == 1
+    assert index.lexical_search("unrelated words", 3) == []
+    mask = index.mask({"section": ["1", "2"]})
+    assert {index.documents[p].metadata["section"] for p in index.lexical_search("patent new", 5, mask)} <= {"1", "2"}
+
+
+def test_hybrid_search(embeddings):
+    hybrid = retriever(embeddings, documents(), k=2)
+    found = hybrid.get_relevant_documents("Can a licence be exclusive?")
+    assert found[0].metadata["section"] == "46"
+    assert len(found) == 2
+    assert asyncio.run(hybrid.aget_relevant_documents("Can a licence be exclusive?")) == found
+
+
+def test_section_lookup_skips_vector_search(embeddings):
+    acts = ("ukpga/1977/37", "ukpga/2004/16")
+    hybrid = retriever(embeddings, documents(acts), k=4, filter={"act": ["ukpga/2004/16"]})
+    calls = embeddings.calls
+    found = hybrid.get_relevant_documents("What does s.60(1) say, and section 4A?")
+    assert [(doc.metadata["act"], doc.metadata["section"]) for doc in found] == [
+        ("ukpga/2004/16", "60"), ("ukpga/2004/16", "4A")
+    ]
+    assert asyncio.run(hybrid.aget_relevant_documents("s.60")) == found[:1]
+    assert embeddings.calls == calls
+    # A section that does not exist falls back to searching
+    assert len(hybrid.get_relevant_documents("What does section 999 say about patents?")) == 4
+    assert embeddings.calls == calls + 1
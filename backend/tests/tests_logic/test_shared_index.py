@@ -0,0 +1,211 @@
+"""Tests for index snapshots shared read-only between worker processes."""
+import multiprocessing
+import threading
+
+import numpy as np
+import pytest
+from langchain.llms.fake import FakeListLLM
+from langchain.schema.document import Document
+from common_logic.data_source import CorpusDataSource, SharedDataSource
+from common_logic.embedding_store import open_embedding_store
+from common_logic.retrieval import InvertedIndex, RetrievalIndex
+from common_logic.shared_index import CURRENT_FILE, DocumentFile, current_snapshot
+from tests.fakes import FakeEmbeddings
+from tests.fixture_server import ClmlFixtureServer, corpus_resolver
+
+ACTS = ["ukpga/1977/37", "ukpga/2000/1"]
+QUERIES = [
+    ("patentable inventions", None),
+    ("What does s.60 say?", None),
+    ("Explain section 129(1)", ["ukpga/2000/1"]),
+    ("infringement of a patent", ["ukpga/1977/37"]),
+]
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    with ClmlFixtureServer(resolver=corpus_resolver(ACTS)) as server:
+        yield server
+
+
+@pytest.fixture
+def corpus(server):
+    corpus = CorpusDataSource(
+        [f"{server.url}/{act}/contents/" for act in ACTS], processes=1,
+        embedding_model=FakeEmbeddings(), llm=FakeListLLM(responses=["answer"] * 10)
+    )
+    corpus.load_data()
+    return corpus
+
+
+def attach(directory, store_dir):
+    data_source = SharedDataSource(
+        directory, embedding_model=FakeEmbeddings(), llm=FakeListLLM(responses=["answer"] * 10),
+        store=open_embedding_store(store_dir)
+    )
+    data_source.load_data()
+    return data_source
+
+
+def retrieve(data_source, query, acts):
+    return [
+        (doc.metadata['act'], doc.metadata['section'], doc.page_content)
+        for doc in data_source._get_chain(acts).retriever.get_relevant_documents(query)
+    ]
+
+
+def test_document_file(tmp_path):
+    documents = [Document(page_content=f"Section {i} – café", metadata={"section": str(i)}) for i in range(5)]
+    assert DocumentFile.write(tmp_path, documents) == 5
+    stored = DocumentFile(tmp_path)
+    assert len(stored) == 5
+    assert list(stored) == documents
+    assert stored[-1] == documents[-1] and stored[1:3] == documents[1:3]
+    with pytest.raises(IndexError):
+        stored[5]
+
+    (tmp_path / "empty").mkdir()
+    DocumentFile.write(tmp_path / "empty", [])
+    assert list(DocumentFile(tmp_path / "empty")) == []
+
+
+def test_inverted_index(tmp_path):
+    index = InvertedIndex.from_lists({"b": [3, 1], "a": [2]}, {"b": [0.5, 1.5], "a": [2.0]})
+    index.save(tmp_path, "terms")
+    loaded = InvertedIndex.load(tmp_path, "terms")
+    assert isinstance(loaded.positions, np.memmap)
+    for found in (index.get("b"), loaded.get("b")):
+        assert found[0].tolist() == [3, 1] and found[1].tolist() == [0.5, 1.5]
+    assert loaded.get("c") is None and loaded.get("") is None
+    assert InvertedIndex.from_lists({}).get("a") is None
+
+
+def test_saved_retrieval_index_matches(tmp_path):
+    documents = [
+        Document(page_content=f"{i}. Text about {word} and patents", metadata={"section": str(i), "act": act})
+        for i, (word, act) in enumerate([("licences", "a"), ("crown use", "a"), ("licences", "b"), ("damages", "b")])
+    ]
+    index = RetrievalIndex(documents)
+    index.save(tmp_path)
+    loaded = RetrievalIndex.load(tmp_path, documents)
+    for filter in (None, {"act": "a"}, {"act": ["b", "c"]}, {"section": "2"}):
+        assert np.array_equal(loaded.mask(filter), index.mask(filter)) if filter else loaded.mask(filter) is None
+        mask = index.mask(filter)
+        assert loaded.lexical_search("licences", 4, mask) == index.lexical_search("licences", 4, mask)
+    assert loaded.lookup_sections("s.2 and s.3") == index.lookup_sections("s.2 and s.3") == [2, 3]
+    assert loaded.lookup_sections("s.9") is None
+    with pytest.raises(ValueError):
+        RetrievalIndex.load(tmp_path, documents[:2])
+
+
+def test_shared_data_source_matches_corpus(corpus, tmp_path):
+    snapshot = corpus.publish(tmp_path / "shared")
+    assert snapshot.fingerprint == corpus.fingerprint
+
+    shared = attach(tmp_path / "shared", tmp_path)
+    assert shared.fingerprint == corpus.fingerprint
+    assert sorted(shared.acts) == ACTS
+    assert len(shared.data) == len(corpus.data)
+    for query, acts in QUERIES:
+        assert retrieve(shared, query, acts) == retrieve(corpus, query, acts)
+    result = shared.get_answers_and_documents("patentable inventions", acts=["ukpga/1977/37"])
+    assert result['result'] == "answer"
+    assert {doc.metadata['act'] for doc in result['source_documents']} == {"ukpga/1977/37"}
+    with pytest.raises(ValueError):
+        shared.get_answers_and_documents("patents", acts=["ukpga/1999/99"])
+    # Nothing is embedded to attach, only the queries
+    assert set(shared.core_embedding_model.embedded) <= {query for query, _ in QUERIES}
+
+
+def _worker_retrieve(directory, store_dir, queries, results):
+    shared = attach(directory, store_dir)
+    results.put([retrieve(shared, query, acts) for query, acts in queries])
+
+
+def test_workers_attach_in_other_processes(corpus, tmp_path):
+    corpus.publish(tmp_path / "shared")
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [
+        context.Process(target=_worker_retrieve, args=(tmp_path / "shared", tmp_path / f"worker{i}", QUERIES, results))
+        for i in range(2)
+    ]
+    for worker in workers:
+        worker.start()
+    expected = [retrieve(corpus, query, acts) for query, acts in QUERIES]
+    assert [results.get(timeout=60) for _ in workers] == [expected, expected]
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+
+def test_publishing_replaces_snapshot(corpus, tmp_path):
+    directory = tmp_path / "shared"
+    first = corpus.publish(directory)
+    # Publishing the same index again does not rewrite it
+    mtime = (first.directory / "index.faiss").stat().st_mtime_ns
+    assert corpus.publish(directory) == first
+    assert (first.directory / "index.faiss").stat().st_mtime_ns == mtime
+
+    attached = attach(directory, tmp_path)
+    corpus.fingerprint = "1" * 64
+    second = corpus.publish(directory)
+    corpus.fingerprint = "2" * 64
+    third = corpus.publish(directory)
+    assert current_snapshot(directory) == third
+    assert (directory / CURRENT_FILE).read_text() == third.directory.name
+    # The previous snapshot is kept for workers still attaching to it, older ones are removed
+    assert sorted(path.name for path in directory.iterdir() if path.is_dir()) == sorted(
+        [second.directory.name, third.directory.name]
+    )
+    # Workers attached to a removed snapshot keep their mapping
+    assert retrieve(attached, *QUERIES[0]) == retrieve(corpus, *QUERIES[0])
+    assert attach(directory, tmp_path).fingerprint == "2" * 64
+
+
+def test_attach_errors(corpus, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        attach(tmp_path / "shared", tmp_path)
+    corpus.publish(tmp_path / "shared")
+    other = SharedDataSource(
+        tmp_path / "shared", embedding_model=FakeEmbeddings(), llm=FakeListLLM(responses=["answer"]),
+        store=open_embedding_store(tmp_path)
+    )
+    other.core_embedding_model.model = "other-embeddings"
+    with pytest.raises(ValueError):
+        other.load_data()
+
+
+def test_api_worker_waits_for_snapshot(corpus, tmp_path, monkeypatch):
+    import app.main
+
+    monkeypatch.setattr("app.main.SHARED_INDEX", True)
+    monkeypatch.setattr("app.main.SHARED_INDEX_DIR", tmp_path / "shared")
+    monkeypatch.setattr("app.main.SHARED_INDEX_POLL", 0.05)
+    monkeypatch.setattr("app.main.SharedDataSource", lambda directory: SharedDataSource(
+        directory, embedding_model=FakeEmbeddings(), llm=FakeListLLM(responses=["answer"]),
+        store=open_embedding_store(tmp_path)
+    ))
+    publisher = threading.Timer(0.2, corpus.publish, args=(tmp_path / "shared",))
+    publisher.start()
+    data_source = app.main.create_data_source()
+    publisher.join()
+    assert isinstance(data_source, SharedDataSource)
+    assert data_source.fingerprint == corpus.fingerprint
+
+
+def test_api_worker_gives_up_waiting_for_snapshot(tmp_path, monkeypatch):
+    import app.main
+
+    monkeypatch.setattr("app.main.SHARED_INDEX", True)
+    monkeypatch.setattr("app.main.SHARED_INDEX_DIR", tmp_path / "shared")
+    monkeypatch.setattr("app.main.SHARED_INDEX_POLL", 0.05)
+    monkeypatch.setattr("app.main.SHARED_INDEX_TIMEOUT", 0.2)
+    monkeypatch.setattr("app.main.SharedDataSource", lambda directory: SharedDataSource(
+        directory, embedding_model=FakeEmbeddings(), llm=FakeListLLM(responses=["answer"]),
+        store=open_embedding_store(tmp_path)
+    ))
+    with pytest.raises(TimeoutError):
+        app.main.create_data_source()
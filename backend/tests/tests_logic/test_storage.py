@@ -0,0 +1,78 @@
+"""Tests for the compact on-disk format for parsed legislation."""
+import json
+import pickle
+import pytest
+from common_logic.data_source import LegislationDataSource
+from common_logic.embedding_store import open_embedding_store
+from common_logic.storage import ParsedLegislation, save_parsed_legislation, SECTION_FIELDS, FORMAT_VERSION
+from common_logic.XMLparser import UKLegislationParser
+from tests.fakes import FakeEmbeddings, FakeStreamingLLM
+from tests.fixture_server import ClmlFixtureServer
+
+
+@pytest.fixture(scope="module")
+def parser():
+    with ClmlFixtureServer() as server:
+        return UKLegislationParser(
+            f"{server.url}/ukpga/1977/37/contents", parse_sections=True, engine="lxml", whole_act=True
+        )
+
+
+def test_round_trip(parser, tmp_path):
+    path = tmp_path / "parsed.jsonl"
+    save_parsed_legislation(parser, path)
+    loaded = ParsedLegislation.load(path)
+    assert loaded.base_url == parser.base_url
+    assert loaded.get_metadata() == parser.get_metadata()
+    assert len(loaded) == 166
+    assert loaded.get_section_strings() == parser.get_section_strings()
+    assert loaded.get_section_dicts() == [
+        {field: item.get(field) for field in SECTION_FIELDS} for item in parser.get_section_dicts()
+    ]
+    first_item = loaded.get_contents()['parts'][0]['blocks'][0]['items'][0]
+    assert first_item['number'] == "1"
+    assert first_item['section'] == 0
+    assert 'parsed_data' not in first_item
+    assert b"<Legislation" not in path.read_bytes()
+
+
+def test_sections_are_loaded_lazily(parser, tmp_path):
+    path = tmp_path / "parsed.jsonl"
+    save_parsed_legislation(parser, path)
+    loaded = ParsedLegislation.load(path)
+    assert loaded._sections.count(None) == 166
+    assert loaded.get_section(128)['flattened_text'] == parser.get_section_dicts()[128]['flattened_text']
+    assert loaded._sections.count(None) == 165
+    loaded.close()
+
+
+def test_unsupported_version(parser, tmp_path):
+    path = tmp_path / "parsed.jsonl"
+    save_parsed_legislation(parser, path)
+    lines = path.read_bytes().split(b"\n", 1)
+    header = json.loads(lines[0])
+    header['version'] = FORMAT_VERSION + 1
+    path.write_bytes(json.dumps(header).encode() + b"\n" + lines[1])
+    with pytest.raises(ValueError):
+        ParsedLegislation.load(path)
+
+
+def test_parser_save_and_load(parser, tmp_path):
+    parser.save(tmp_path / "parsed.jsonl")
+    loaded = UKLegislationParser.load(tmp_path / "parsed.jsonl")
+    assert isinstance(loaded, ParsedLegislation)
+    assert loaded.get_section_strings() == parser.get_section_strings()
+
+
+def test_migrate_pickled_parser(parser, tmp_path):
+    with open(tmp_path / "parsed.pkl", "wb") as f:
+        pickle.dump(parser, f)
+    ds = LegislationDataSource(
+        parser.base_url, embedding_model=FakeEmbeddings(), llm=FakeStreamingLLM(responses=["answer"]),
+        store=open_embedding_store(tmp_path)
+    )
+    assert ds._migrate_pickled_parser(tmp_path / "parsed.jsonl")
+    assert isinstance(ds.parser, ParsedLegislation)
+    assert (tmp_path / "parsed.jsonl").exists()
+    assert ds.parser.get_section_strings() == parser.get_section_strings()
+    assert not ds._migrate_pickled_parser(tmp_path / "missing.jsonl")
@@ -0,0 +1,78 @@
+"""Tests for streaming answers from a data source."""
+import asyncio
+
+import pytest
+from common_logic.data_source import CorpusDataSource
+from tests.fakes import FakeEmbeddings, FakeStreamingLLM
+from tests.fixture_server import ClmlFixtureServer, corpus_resolver
+
+ACTS = ["ukpga/1977/37", "ukpga/2000/1"]
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    # The sections of the fixture Acts are copies of one section, which would be dropped as duplicates
+    monkeypatch.setattr("common_logic.data_source.CONTEXT_DEDUP_SIMILARITY", 0)
+    with ClmlFixtureServer(resolver=corpus_resolver(ACTS)) as server:
+        corpus = CorpusDataSource(
+            [f"{server.url}/{act}/contents" for act in ACTS], processes=1, embedding_model=FakeEmbeddings(),
+            llm=FakeStreamingLLM(responses=["A patent may be granted for an invention."])
+        )
+        corpus.load_data()
+        yield corpus
+
+
+def test_stream_sources_then_tokens(corpus):
+    events = []
+    result = corpus.stream_answers_and_documents(
+        "When may a patent be granted?",
+        on_documents=lambda documents: events.append(('documents', documents)),
+        on_token=lambda token: events.append(('token', token))
+    )
+    assert events[0] == ('documents', result['source_documents'])
+    assert len(result['source_documents']) == 4
+    tokens = [value for kind, value in events[1:]]
+    assert all(kind == 'token' for kind, _ in events[1:])
+    assert tokens == ["A ", "patent ", "may ", "be ", "granted ", "for ", "an ", "invention."]
+    assert result['result'] == "".join(tokens)
+    # Streaming gives the same answer and sources as the blocking call
+    blocking = corpus.get_answers_and_documents("When may a patent be granted?")
+    assert blocking['result'] == result['result']
+    assert blocking['source_documents'] == result['source_documents']
+
+
+def test_stream_subset_of_acts(corpus):
+    documents = []
+    result = corpus.stream_answers_and_documents(
+        "patent", on_documents=documents.extend, on_token=lambda token: None, acts=["ukpga/2000/1"]
+    )
+    assert documents == result['source_documents']
+    assert {doc.metadata['act'] for doc in documents} == {"ukpga/2000/1"}
+    with pytest.raises(ValueError):
+        corpus.stream_answers_and_documents("patent", documents.extend, lambda token: None, acts=["ukpga/1999/1"])
+
+
+def test_async_stream_matches_sync(corpus):
+    events = []
+
+    async def on_documents(documents):
+        events.append(('documents', documents))
+
+    async def on_token(token):
+        events.append(('token', token))
+
+    query = "When may a patent be granted?"
+    result = asyncio.run(corpus.astream_answers_and_documents(query, on_documents, on_token))
+    assert events[0] == ('documents', result['source_documents'])
+    assert "".join(value for kind, value in events[1:]) == result['result']
+    assert result['result'] == "A patent may be granted for an invention."
+    blocking = corpus.get_answers_and_documents(query)
+    assert blocking['source_documents'] == result['source_documents']
+    # Without streaming, and restricted to one Act
+    subset = asyncio.run(corpus.aget_answers_and_documents("patent", acts=["ukpga/2000/1"]))
+    assert subset['result'] == result['result']
+    assert {doc.metadata['act'] for doc in subset['source_documents']} == {"ukpga/2000/1"}
+    blocking = corpus.get_answers_and_documents("patent", acts=["ukpga/2000/1"])
+    assert subset['source_documents'] == blocking['source_documents']
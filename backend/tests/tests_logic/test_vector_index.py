@@ -0,0 +1,113 @@
+"""Tests for the exact, approximate and quantized vector index types."""
+import faiss
+import numpy as np
+import pytest
+from langchain.llms.fake import FakeListLLM
+from common_logic.data_source import LegislationDataSource
+from common_logic.index_store import read_fingerprint
+from common_logic.vector_index import (
+    FLAT_PARAMS, build_index, configure_search, factory_string, index_params, is_exact
+)
+from tests.fakes import FakeEmbeddings
+from tests.fixture_server import ClmlFixtureServer
+
+
+def clustered_vectors(count=1000, dimensions=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimensions)) * 4
+    return (centres[rng.integers(clusters, size=count)] + rng.standard_normal((count, dimensions))).astype(np.float32)
+
+
+def recall(index, vectors, queries, k=10):
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, expected = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    return np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)])
+
+
+def test_index_params():
+    assert index_params('flat') == FLAT_PARAMS and is_exact(index_params('flat'))
+    assert index_params('ivf', nlist=16) == {'index': 'ivf', 'nlist': 16}
+    assert index_params('hnsw') == {'index': 'hnsw', 'hnsw_m': 32}
+    assert index_params('ivfpq', pq_m=8, pq_bits=4) == {'index': 'ivfpq', 'nlist': 0, 'pq_m': 8, 'pq_bits': 4}
+    assert not is_exact(index_params('pq'))
+    with pytest.raises(ValueError):
+        index_params('annoy')
+
+
+def test_factory_string():
+    assert factory_string(index_params('ivf'), 64, 10000) == "IVF400,Flat"
+    assert factory_string(index_params('pq'), 1536, 10000) == "PQ96x8"
+    assert factory_string(index_params('ivfpq', nlist=50, pq_m=8, pq_bits=4), 64, 1000) == "IVF50,PQ8x4"
+    assert factory_string(index_params('hnsw', hnsw_m=16), 64, 10) == "HNSW16"
+    # Too few vectors to train
+    assert factory_string(index_params('ivf', nlist=100), 64, 50) is None
+    assert factory_string(index_params('pq'), 64, 100) is None
+
+
+@pytest.mark.parametrize("kind, minimum_recall", [
+    ('flat', 1.0), ('ivf', 0.9), ('hnsw', 0.9), ('pq', 0.3), ('ivfpq', 0.3)
+])
+def test_build_index(kind, minimum_recall):
+    vectors = clustered_vectors()
+    index = build_index(vectors, index_params(kind, nlist=20, hnsw_m=16, pq_m=8, pq_bits=4))
+    configure_search(index, nprobe=20, ef_search=64)
+    assert index.ntotal == len(vectors)
+    assert recall(index, vectors, vectors[:50]) >= minimum_recall
+
+
+def test_search_parameters_trade_recall_for_speed():
+    vectors = clustered_vectors(clusters=50)
+    index = build_index(vectors, index_params('ivf', nlist=50))
+    configure_search(index, nprobe=1)
+    narrow = recall(index, vectors, vectors[:100])
+    configure_search(index, nprobe=50)
+    assert recall(index, vectors, vectors[:100]) == 1.0 > narrow
+    # Parameters of other index types are ignored
+    configure_search(faiss.IndexFlatL2(8), nprobe=4, ef_search=16)
+
+
+def test_too_few_vectors_fall_back_to_flat():
+    index = build_index(clustered_vectors(count=100), index_params('ivfpq'))
+    assert isinstance(index, faiss.IndexFlat)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr("common_logic.data_source.DATA_DIR", tmp_path)
+    monkeypatch.setattr("common_logic.data_source.FETCH_RATE_LIMIT", 0)
+    # The sections of the fixture Acts are copies of one section, which would be dropped as duplicates
+    monkeypatch.setattr("common_logic.data_source.CONTEXT_DEDUP_SIMILARITY", 0)
+    with ClmlFixtureServer() as server:
+        yield server
+
+
+@pytest.mark.parametrize("kind", ['ivf', 'hnsw'])
+def test_data_source_builds_saves_and_loads_approximate_index(server, monkeypatch, kind):
+    monkeypatch.setattr("common_logic.data_source.VECTOR_INDEX", kind)
+
+    def make_source():
+        return LegislationDataSource(
+            f"{server.url}/ukpga/1977/37/contents", embedding_model=FakeEmbeddings(),
+            llm=FakeListLLM(responses=["answer"])
+        )
+
+    ds = make_source()
+    ds.load_data()
+    built = type(faiss.downcast_index(ds.vectorstore.index))
+    assert built is not faiss.IndexFlatL2
+    assert ds.vectorstore.index.ntotal == len(ds.data)
+    assert read_fingerprint(ds.index_dir) == ds.fingerprint
+    assert len(ds.get_answers_and_documents("patentable inventions")['source_documents']) == 4
+
+    # Loaded on the next start, while the index type is unchanged
+    loaded = make_source()
+    loaded.load_data()
+    assert type(faiss.downcast_index(loaded.vectorstore.index)) is built
+    # A different index type changes the fingerprint, so the index is rebuilt
+    monkeypatch.setattr("common_logic.data_source.VECTOR_INDEX", 'flat')
+    flat = make_source()
+    flat.load_data()
+    assert flat.fingerprint != ds.fingerprint
+    assert isinstance(flat.vectorstore.index, faiss.IndexFlatL2)
@@ -0,0 +1,85 @@
+"""Tests for whole-Act ingestion, which splits the Act body into sections locally."""
+import pytest
+from common_logic.fetching import SectionFetcher
+from common_logic.utils import act_url_from_contents_url, normalise_uri
+from common_logic.XMLparser import UKLegislationParser
+from tests.fixture_server import ClmlFixtureServer, build_act_xml, default_resolver
+
+SECTION_KEYS = ['number', 'title', 'parsed_data', 'flattened_text', 'DocumentURI']
+
+
+def section_records(parser, server):
+    """Return the public fields of each section, with the server address removed from the DocumentURI."""
+    return [
+        {key: item[key].replace(server.url, "") if key == 'DocumentURI' else item[key] for key in SECTION_KEYS}
+        for item in parser.get_section_dicts()
+    ]
+
+
+@pytest.fixture(scope="module")
+def per_section_sections():
+    with ClmlFixtureServer() as server:
+        parser = UKLegislationParser(
+            f"{server.url}/ukpga/1977/37/contents", parse_sections=True,
+            fetcher=SectionFetcher(max_workers=8), engine="lxml"
+        )
+    return section_records(parser, server)
+
+
+def section_requests(server):
+    return sum(count for path, count in server.requests.items() if "/section/" in path)
+
+
+def test_act_url_from_contents_url():
+    assert act_url_from_contents_url(
+        'https://www.legislation.gov.uk/ukpga/1977/37/contents/') == 'https://www.legislation.gov.uk/ukpga/1977/37'
+    assert act_url_from_contents_url(
+        'https://www.legislation.gov.uk/ukpga/1977/37') == 'https://www.legislation.gov.uk/ukpga/1977/37'
+
+
+def test_normalise_uri():
+    assert normalise_uri('https://www.legislation.gov.uk/ukpga/1977/37/section/1/') == \
+        normalise_uri('http://www.legislation.gov.uk/ukpga/1977/37/section/1')
+
+
+@pytest.mark.parametrize("engine", ["lxml", "bs4"])
+def test_whole_act_matches_per_section(engine, per_section_sections):
+    with ClmlFixtureServer() as server:
+        parser = UKLegislationParser(
+            f"{server.url}/ukpga/1977/37/contents/", parse_sections=True, engine=engine, whole_act=True
+        )
+    sections = section_records(parser, server)
+    assert sections == per_section_sections
+    assert server.requests["/ukpga/1977/37"] == 1
+    assert section_requests(server) == 0
+
+
+def test_whole_act_falls_back_for_missing_sections(per_section_sections):
+    def resolver(path):
+        if path == "/ukpga/1977/37":
+            return build_act_xml(omit=("4A", "129"))
+        return default_resolver(path)
+
+    with ClmlFixtureServer(resolver=resolver) as server:
+        parser = UKLegislationParser(
+            f"{server.url}/ukpga/1977/37/contents", parse_sections=True,
+            fetcher=SectionFetcher(max_workers=4), engine="lxml", whole_act=True
+        )
+    sections = section_records(parser, server)
+    assert sections == per_section_sections
+    assert section_requests(server) == 2
+    assert server.requests["/ukpga/1977/37/section/4A"] == 1
+    assert server.requests["/ukpga/1977/37/section/129"] == 1
+
+
+def test_whole_act_unavailable_fetches_every_section(per_section_sections):
+    def resolver(path):
+        return None if path == "/ukpga/1977/37" else default_resolver(path)
+
+    with ClmlFixtureServer(resolver=resolver) as server:
+        parser = UKLegislationParser(
+            f"{server.url}/ukpga/1977/37/contents", parse_sections=True,
+            fetcher=SectionFetcher(max_workers=8, max_retries=0), engine="lxml", whole_act=True
+        )
+    assert section_requests(server) == len(per_section_sections)
+    assert parser.get_section_strings() == [item['flattened_text'] for item in per_section_sections]
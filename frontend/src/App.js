@@ -15,6 +15,8 @@ function App() {
     });
     const [isDataReceived, setIsDataReceived] = useState(false);
     const [isReset, setIsReset] = useState(false);
+    // Shown instead of the answer while the query waits for the server, or if the server turns it away
+    const [statusMessage, setStatusMessage] = useState('');
     let webSocket;
 
     const resetApp = useCallback(() => {
@@ -28,6 +30,7 @@ function App() {
         setUserQuery('');
         setIsDataReceived(false);
         setResponse({query: '', result: '', sources: [], state: ''});
+        setStatusMessage('');
     }, [webSocket]);
 
     useEffect(() => {
@@ -43,6 +46,7 @@ function App() {
         ws.onopen = () => {
             console.log('WebSocket is connected.');
             ws.send(JSON.stringify({"query": userQuery}));
+            setStatusMessage('');
             setIsLoading(true);
         };
 
@@ -51,9 +55,40 @@ function App() {
             const receivedData = JSON.parse(event.data);
             switch (receivedData.state) {
                 case "PROCESSING":
+                    setStatusMessage('');
                     setIsLoading(true);
                     break;
+                case "QUEUED":
+                    setIsLoading(true);
+                    setStatusMessage(`Waiting for the server - position ${receivedData.position} in the queue` +
+                        (receivedData.eta !== null ? `, about ${Math.ceil(receivedData.eta)}s` : ''));
+                    break;
+                case "BUSY":
+                    setIsLoading(false);
+                    setStatusMessage(receivedData.error);
+                    break;
+                case "WARMING":
+                    setIsLoading(false);
+                    setStatusMessage("The legislation is still loading - please try again in a moment");
+                    break;
+                case "ERROR":
+                    setIsLoading(false);
+                    setStatusMessage(`Something went wrong: ${receivedData.error}`);
+                    break;
+                case "STREAMING":
+                    setStatusMessage('');
+                    // The first streamed message carries the sources, the rest append a token to the answer
+                    setResponse(previous => receivedData.sources ? {
+                        query: receivedData.query,
+                        result: receivedData.token,
+                        sources: receivedData.sources,
+                        state: receivedData.state
+                    } : {...previous, result: previous.result + receivedData.token});
+                    setIsLoading(false);
+                    setIsDataReceived(true);
+                    break;
                 case "SUCCESS":
+                    setStatusMessage('');
                     setResponse(receivedData);
                     setIsLoading(false);
                     setIsDataReceived(true);
@@ -96,7 +131,9 @@ function App() {
                 <QueryInput setUserQuery={setUserQuery} resetApp={handleReset}/>
                 <hr/>
                 {isLoading ? ( // Conditional rendering based on isLoading state
-                    <div>Loading...</div> // Your loading screen here
+                    <div>{statusMessage || "Loading..."}</div> // Your loading screen here
+                ) : statusMessage ? (
+                    <div>{statusMessage}</div>
                 ) : isDataReceived ? (
                     <>
                         <UserQueryDisplay titleName="You asked..." output={response.query}/>